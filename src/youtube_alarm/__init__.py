@@ -1,9 +1,29 @@
 """
 YouTube Alarm Clock package.
+
+The public classes are imported on first access, so importing the package (and running the
+command line) does not load yt_dlp, mutagen, requests or psutil up front.
 """
+import importlib
 
-from .music_library import MusicLibrary
-from .vlc_manager import VLCManager
+_LAZY_ATTRIBUTES = {
+    "MusicLibrary": ".music_library",
+    "PlayerBackend": ".player_backend",
+    "VLCManager": ".vlc_manager",
+    "MpvManager": ".mpv_manager",
+}
 
-__all__ = ["MusicLibrary", "VLCManager"]
+__all__ = ["MusicLibrary", "PlayerBackend", "VLCManager", "MpvManager"]
 __version__ = "0.1.0"
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        value = getattr(importlib.import_module(_LAZY_ATTRIBUTES[name], __name__), name)
+        globals()[name] = value  # Later accesses skip __getattr__
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY_ATTRIBUTES))
@@ -0,0 +1,229 @@
+import os
+import re
+import json
+import asyncio
+import logging
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+
+from mutagen import MutagenError
+from mutagen.mp3 import MP3
+from mutagen.id3 import ID3, ID3NoHeaderError, TXXX
+
+from .utils import write_json_atomic
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(module)s - %(funcName)s - line %(lineno)d - %(message)s'
+)
+
+CACHE_FILE_NAME = ".youtube_alarm_analysis.json"
+RESCAN_INTERVAL = 60  # seconds between checks for newly downloaded tracks
+BATCH_SIZE = 20  # tracks analyzed per check at most, the rest waits for the next ones
+FULL_SCAN_EVERY = 60  # checks between two stats of every file, for files changed in place
+WORKER_NICENESS = 10  # analysis must never compete with playback or the next download
+
+GAIN_RE = re.compile(r"track_gain = ([-+]?\d+(?:\.\d+)?) dB")
+PEAK_RE = re.compile(r"track_peak = (\d+(?:\.\d+)?)")
+
+
+def measure_loudness(file_path):
+    """Run ffmpeg's replaygain filter over a file. Returns (gain_db, peak) or (None, None)."""
+    try:
+        result = subprocess.run(
+            ["ffmpeg", "-hide_banner", "-nostats", "-i", file_path, "-vn", "-af", "replaygain", "-f", "null", "-"],
+            capture_output=True, text=True, check=True
+        )
+    except (OSError, subprocess.CalledProcessError) as e:
+        logging.warning(f"Loudness analysis failed for {file_path}: {e}")
+        return None, None
+    gain = GAIN_RE.search(result.stderr)
+    peak = PEAK_RE.search(result.stderr)
+    return (float(gain.group(1)) if gain else None), (float(peak.group(1)) if peak else None)
+
+
+def write_replaygain_tags(file_path, gain, peak):
+    """Store the track gain as REPLAYGAIN_* frames, which VLC applies with --audio-replay-gain-mode=track."""
+    try:
+        audio = ID3(file_path)
+    except ID3NoHeaderError:
+        audio = ID3()
+    audio.add(TXXX(encoding=3, desc='REPLAYGAIN_TRACK_GAIN', text=f"{gain:.2f} dB"))
+    if peak is not None:
+        audio.add(TXXX(encoding=3, desc='REPLAYGAIN_TRACK_PEAK', text=f"{peak:.6f}"))
+    audio.save(file_path)
+
+
+def analyze_track(file_path):
+    """
+    Compute duration, bitrate and loudness of a single MP3 and tag it with its ReplayGain values.
+
+    Runs in a worker process. The returned size and mtime are taken after tagging so the cache
+    entry stays valid for the file as it is now on disk.
+
+    Returns:
+        dict: The analysis result, or None if the file could not be read.
+    """
+    try:
+        info = MP3(file_path).info
+    except (MutagenError, OSError) as e:
+        logging.error(f"Could not analyze {file_path}: {e}")
+        return None
+    gain, peak = measure_loudness(file_path)
+    if gain is not None:
+        try:
+            write_replaygain_tags(file_path, gain, peak)
+        except (MutagenError, OSError) as e:
+            logging.error(f"Could not write ReplayGain tags to {file_path}: {e}")
+    stat = os.stat(file_path)
+    return {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "duration": info.length,
+        "bitrate": info.bitrate,
+        "track_gain": gain,
+        "track_peak": peak,
+    }
+
+
+def _lower_priority():
+    try:
+        os.nice(WORKER_NICENESS)
+    except (AttributeError, OSError):
+        pass
+
+
+class AnalysisCache:
+    """
+    Per-track analysis results, persisted as JSON in the library's base folder.
+
+    Entries are keyed by the path relative to the base folder and are only trusted while the
+    file's size and mtime still match the ones recorded with the result.
+    """
+
+    def __init__(self, base_folder):
+        self.path = os.path.join(base_folder, CACHE_FILE_NAME)
+        self.entries = {}
+        self.dirty = False
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            self.entries = {}
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable analysis cache {self.path}: {e}")
+            self.entries = {}
+
+    def save(self):
+        if not self.dirty:
+            return
+        write_json_atomic(self.path, self.entries)
+        self.dirty = False
+
+    @staticmethod
+    def key(playlist_name, file_name):
+        return f"{playlist_name}/{file_name}"
+
+    def get(self, playlist_name, file_name, stat=None):
+        """Return the cached result if it still matches the file on disk."""
+        entry = self.entries.get(self.key(playlist_name, file_name))
+        if entry is None:
+            return None
+        if stat is not None and (entry["size"] != stat.st_size or entry["mtime_ns"] != stat.st_mtime_ns):
+            return None
+        return entry
+
+    def put(self, playlist_name, file_name, result):
+        self.entries[self.key(playlist_name, file_name)] = result
+        self.dirty = True
+
+
+class AudioAnalyzer:
+    """
+    Background stage that analyzes every library track once, in a process pool.
+
+    Each check looks at library records it has not seen yet (new downloads, upgrades, files
+    picked up by the watcher all get a new record); only every FULL_SCAN_EVERY checks is every
+    file stat'ed again, for files changed in place. At most `batch_size` tracks are analyzed
+    per check. Tracks that are playing or queued in `player` are left for later, since
+    analysis rewrites their tags.
+    """
+
+    def __init__(self, music_library, max_workers=1, rescan_interval=RESCAN_INTERVAL, batch_size=BATCH_SIZE, player=None):
+        self.music_library = music_library
+        self.max_workers = max_workers
+        self.rescan_interval = rescan_interval
+        self.batch_size = batch_size
+        self.player = player
+        self.seen = {}  # (playlist, video ID) -> the library record found analyzed
+        self.checks = 0
+
+    def upcoming(self):
+        """Paths the player is playing or about to play."""
+        if self.player is None:
+            return set()
+        return set(self.player.playlist[max(self.player.current_index, 0):])
+
+    def pending(self, playlist_name=None):
+        """Return the (playlist, file name, path) of songs without a valid analysis, up to `batch_size`."""
+        cache = self.music_library.analysis
+        full_scan = self.checks % FULL_SCAN_EVERY == 0
+        self.checks += 1
+        upcoming = self.upcoming()
+        pending = []
+        for key, song in self.music_library.snapshot():
+            pl = key[0]
+            if playlist_name and pl != playlist_name:
+                continue
+            if not full_scan and self.seen.get(key) is song:
+                continue
+            path = song["file_path"]
+            if path in upcoming:
+                continue  # Not seen either: checked again once it has played
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if cache.get(pl, song.file_name, stat) is not None:
+                self.seen[key] = song
+            elif len(pending) < self.batch_size:
+                pending.append((pl, song.file_name, path))
+        return pending
+
+    async def analyze_pending(self, executor, playlist_name=None, save_every=20):
+        """Analyze all pending songs, saving the cache as results come in. Returns the number of tracks analyzed."""
+        loop = asyncio.get_running_loop()
+        pending = self.pending(playlist_name)
+        if not pending:
+            return 0
+        logging.info(f"Analyzing {len(pending)} tracks in the background...")
+
+        async def analyze(pl, file_name, path):
+            return pl, file_name, await loop.run_in_executor(executor, analyze_track, path)
+
+        analyzed = 0
+        try:
+            for next_result in asyncio.as_completed([analyze(*song) for song in pending]):
+                pl, file_name, result = await next_result
+                if result:
+                    self.music_library.analysis.put(pl, file_name, result)
+                    analyzed += 1
+                    if analyzed % save_every == 0:
+                        self.music_library.analysis.save()
+        finally:
+            self.music_library.analysis.save()
+        logging.info(f"Analyzed {analyzed} tracks.")
+        return analyzed
+
+    async def run(self, playlist_name=None):
+        """Keep analyzing new tracks until cancelled."""
+        executor = ProcessPoolExecutor(max_workers=self.max_workers, initializer=_lower_priority)
+        try:
+            while True:
+                await self.analyze_pending(executor, playlist_name)
+                await asyncio.sleep(self.rescan_interval)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,179 @@
+import os
+import json
+import time
+import uuid
+import logging
+
+from .utils import write_json_atomic
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(module)s - %(funcName)s - line %(lineno)d - %(message)s'
+)
+
+CHECKPOINT_FILE_NAME = ".youtube_alarm_state.json"
+QUEUE_FILE_NAME = ".youtube_alarm_queue.json"
+CHECKPOINT_VERSION = 3
+CHECKPOINT_INTERVAL = 5  # seconds between position-only checkpoints
+FSYNC_INTERVAL = 30  # at most one fsync per this many seconds, even for queue changes
+MAX_RESUME_AGE = 15 * 60  # an older checkpoint belongs to a previous alarm, not to a crash
+MAX_QUEUE_CHANGES = 200  # queue changes kept in the state file before the queue snapshot is rewritten
+
+
+class PlaybackCheckpoint:
+    """
+    Crash-safe snapshot of the playback state, used to resume after a crash or restart.
+
+    The queues (videos still to play, songs enqueued in the player) can hold thousands of URLs,
+    so they are written once to a queue snapshot file. The small state file written on every
+    change only holds the position and what changed since that snapshot: videos consumed or
+    newly listed, songs added to the player. Once more than MAX_QUEUE_CHANGES have piled up,
+    or the player queue was rebuilt, a new snapshot is written.
+
+    Every save goes to a temporary file that is atomically renamed over its target, so a crash
+    leaves either the old or the new state, never a torn one. Renames are cheap; fsyncs are
+    not, so the state file is only synced for queue changes, at most once per `fsync_interval`
+    seconds. Position-only updates are never synced: at worst a power cut loses a few seconds
+    of track position.
+    """
+
+    def __init__(self, base_folder, fsync_interval=FSYNC_INTERVAL, max_age=MAX_RESUME_AGE):
+        self.path = os.path.join(base_folder, CHECKPOINT_FILE_NAME)
+        self.queue_path = os.path.join(base_folder, QUEUE_FILE_NAME)
+        self.fsync_interval = fsync_interval
+        self.max_age = max_age
+        self.last_fsync = 0.0
+        self.last_save = 0.0
+        self.last_queue = None
+        self.snapshot = None  # The last queue snapshot written, plus a set of its videos
+        self.last_changes = None
+
+    def save(self, state, durable=False):
+        """Atomically replace the state file with `state`."""
+        state = dict(state, version=CHECKPOINT_VERSION, saved_at=time.time())
+        now = time.monotonic()
+        sync = durable and now - self.last_fsync >= self.fsync_interval
+        try:
+            write_json_atomic(self.path, state, fsync=sync)
+        except OSError as e:
+            logging.error(f"Could not write checkpoint {self.path}: {e}")
+            return False
+        if sync:
+            self.last_fsync = now
+        self.last_save = now
+        return True
+
+    def save_queue(self, playlist_url, playlist_name, videos, player):
+        """Write a new queue snapshot. It is always synced: the state files written after it refer to it."""
+        snapshot = {
+            "version": CHECKPOINT_VERSION,
+            "snapshot_id": uuid.uuid4().hex,
+            "playlist_url": playlist_url,
+            "playlist_name": playlist_name,
+            "videos": list(videos),
+            "player_playlist": list(player.playlist),
+        }
+        try:
+            write_json_atomic(self.queue_path, snapshot, fsync=True)
+        except OSError as e:
+            logging.error(f"Could not write checkpoint {self.queue_path}: {e}")
+            return False
+        self.snapshot = dict(snapshot, video_set=set(snapshot["videos"]))
+        return True
+
+    def queue_changes(self, playlist_url, videos, player):
+        """Return what changed in the queues since the snapshot, or None if a new snapshot is needed."""
+        if not self.snapshot or self.snapshot["playlist_url"] != playlist_url:
+            return None
+        base = self.snapshot["player_playlist"]
+        if player.playlist[:len(base)] != base:
+            return None  # The player queue was rebuilt, e.g. after a restart
+        remaining = set(videos)
+        changes = {
+            "consumed": [url for url in self.snapshot["videos"] if url not in remaining],
+            "appended": [url for url in videos if url not in self.snapshot["video_set"]],
+            "player_added": list(player.playlist[len(base):]),
+        }
+        if sum(len(change) for change in changes.values()) > MAX_QUEUE_CHANGES:
+            return None
+        return changes
+
+    def update(self, playlist_url, playlist_name, videos, player):
+        """
+        Checkpoint the current playback state if it changed or the interval elapsed.
+
+        Queue changes (new songs, a new current track) are written right away and synced;
+        the track position alone is only written every CHECKPOINT_INTERVAL seconds.
+        """
+        queue = (len(player.playlist), player.current_index, len(videos))
+        queue_changed = queue != self.last_queue
+        if not queue_changed and time.monotonic() - self.last_save < CHECKPOINT_INTERVAL:
+            return False
+        changes = self.queue_changes(playlist_url, videos, player) if queue_changed else self.last_changes
+        if changes is None:
+            if not self.save_queue(playlist_url, playlist_name, videos, player):
+                return False
+            changes = {"consumed": [], "appended": [], "player_added": []}
+        self.last_queue = queue
+        self.last_changes = changes
+        state = dict(
+            changes,
+            snapshot_id=self.snapshot["snapshot_id"],
+            player=type(player).__name__,
+            current_index=player.current_index,
+            position=player.position,
+            player_pid=player.pid,
+            # A listing still running when we stop has to be restarted on resume
+            listing_complete=getattr(videos, "done", True),
+            listed_count=getattr(videos, "listed_count", len(videos)),
+        )
+        return self.save(state, durable=queue_changed)
+
+    def load(self, playlist_url=None):
+        """
+        Return the saved state if it is recent enough to resume, None otherwise.
+
+        Args:
+            playlist_url (str, optional): If provided, only a checkpoint of this playlist is returned.
+        """
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable checkpoint {self.path}: {e}")
+            return None
+        if state.get("version") != CHECKPOINT_VERSION:
+            return None
+        if time.time() - state.get("saved_at", 0) > self.max_age:
+            logging.info("Checkpoint is too old to resume from, starting fresh.")
+            return None
+        try:
+            with open(self.queue_path) as f:
+                queue = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring checkpoint without a readable queue {self.queue_path}: {e}")
+            return None
+        if queue.get("snapshot_id") != state.get("snapshot_id"):
+            return None  # A power cut between both writes: the state belongs to another queue
+        if playlist_url and queue.get("playlist_url") != playlist_url:
+            return None
+        consumed = set(state["consumed"])
+        return dict(
+            state,
+            playlist_url=queue["playlist_url"],
+            playlist_name=queue["playlist_name"],
+            videos=[url for url in queue["videos"] if url not in consumed] + state["appended"],
+            player_playlist=queue["player_playlist"] + state["player_added"],
+        )
+
+    def clear(self):
+        """Remove the checkpoint after a clean shutdown."""
+        for path in (self.path, self.queue_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self.snapshot = None
+        self.last_queue = None
@@ -0,0 +1,98 @@
+"""
+Command line of the alarm.
+
+Only the standard library is imported until the arguments are parsed, so --help and argument
+errors return without loading yt_dlp, mutagen, requests or psutil.
+"""
+import os
+import argparse
+from pathlib import Path  # Added for robust path handling
+
+def entry_point():
+    """
+    The main entry point for the 'youtube-alarm' command line script.
+    """
+    parser = argparse.ArgumentParser(
+                    prog='YoutubeAlarm',
+                    description='Launches youtube with an alarm.')
+
+    # 1. Hour and Minute are now OPTIONAL in the parser
+    parser.add_argument('--hour', type=int, required=False, help='Alarm hour (0-23)')
+    parser.add_argument('--minute', type=int, required=False, help='Alarm minute (0-59)')
+
+    parser.add_argument('--playlist', type=str, required=False, help='YouTube playlist URL')
+
+    # 2. New argument for base directory
+    # Default is ~/Music/YoutubeAlarm
+    default_music_dir = os.path.join(Path.home(), "Music", "YoutubeAlarm")
+    parser.add_argument('--base-dir', type=str, default=default_music_dir,
+                        help=f'Directory to save music (default: {default_music_dir})')
+
+    parser.add_argument('--player', choices=['vlc', 'mpv'], default='vlc', help='Media player to use (default: vlc)')
+    parser.add_argument('--test', action='store_true', help='Test mode (starts immediately)')
+    parser.add_argument('--validate', action='store_true', help='Validate MP3 files')
+    parser.add_argument('--shuffle', action='store_true', help='Shuffle the playlist')
+    parser.add_argument('--download-all', action='store_true', help='Download entire playlist immediately')
+    parser.add_argument('--watch-library', action='store_true', help='Track files added or removed in the music folder while running')
+    parser.add_argument('--analyze', action='store_true', help='Analyze duration, bitrate and loudness of tracks in the background')
+    parser.add_argument('--no-resume', action='store_true', help='Ignore the checkpoint of an interrupted alarm and start fresh')
+    parser.add_argument('--retag', action='store_true', help='Add missing YouTube ID and playlist tags to the existing library, then exit')
+    parser.add_argument('--profile', nargs='?', const='', default=None, metavar='REPORT',
+                        help='Record the wall and CPU time of each startup and playback phase, and write a report '
+                             '(default: youtube_alarm_profile.txt in the base directory)')
+    parser.add_argument('--profile-cpu', type=str, default='', metavar='PHASES',
+                        help='With --profile, comma-separated phases to run under cProfile (e.g. check_metadata,playback_tick)')
+    parser.add_argument('--profile-memory', type=str, default='', metavar='PHASES',
+                        help='With --profile, comma-separated phases to trace with tracemalloc (e.g. library_scan)')
+
+    args = parser.parse_args()
+
+    if args.retag:
+        from .music_library import MusicLibrary
+        MusicLibrary(args.base_dir).retag_missing()
+        return
+
+    if args.playlist is None:
+        parser.error("the following arguments are required: --playlist")
+
+    # 3. Manual validation logic
+    # If we are NOT testing AND NOT downloading all, we MUST have time set.
+    if not (args.test or args.download_all):
+        if args.hour is None or args.minute is None:
+            parser.error("the following arguments are required: --hour, --minute (unless using --test or --download-all)")
+
+    if (args.profile_cpu or args.profile_memory) and args.profile is None:
+        parser.error("--profile-cpu and --profile-memory require --profile")
+    from .profiler import shared_profiler
+    if args.profile is not None:
+        shared_profiler.enable(cpu_phases=_phase_list(args.profile_cpu), memory_phases=_phase_list(args.profile_memory))
+
+    # asyncio, yt_dlp, mutagen and the player libraries are only loaded from here on
+    import asyncio
+    with shared_profiler.phase('import'):
+        from .main import main
+
+    try:
+        asyncio.run(main(
+            playlist_url=args.playlist,
+            hour_alarm=args.hour,
+            minute_alarm=args.minute,
+            base_dir=args.base_dir,
+            test_mode=args.test,
+            validate=args.validate,
+            shuffle=args.shuffle,
+            download_all=args.download_all,
+            watch_library=args.watch_library,
+            analyze=args.analyze,
+            resume=not args.no_resume,
+            player_name=args.player
+        ))
+    finally:
+        if shared_profiler.enabled:
+            shared_profiler.write_report(args.profile or os.path.join(args.base_dir, "youtube_alarm_profile.txt"))
+
+def _phase_list(phases):
+    return [phase.strip() for phase in phases.split(',') if phase.strip()]
+
+if __name__ == "__main__":
+    entry_point()
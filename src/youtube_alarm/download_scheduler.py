@@ -0,0 +1,335 @@
+import os
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from yt_dlp.utils import DownloadCancelled
+
+from .utils import extract_id_from_filename
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(module)s - %(funcName)s - line %(lineno)d - %(message)s'
+)
+
+FOREGROUND_WORKERS = 1
+BACKGROUND_WORKERS = 1
+AT_RISK_SLACK = 90  # seconds: below this, background downloads are throttled
+PREEMPT_SLACK = 30  # seconds: below this, background downloads are stopped and requeued
+BACKGROUND_THROTTLE_RATE = 64 * 1024  # bytes per second left to a throttled background download
+BACKGROUND_NICENESS = 10  # background ffmpeg conversions inherit this from their worker thread
+MONITOR_INTERVAL = 1.0
+DEFAULT_TRACK_DURATION = 210  # seconds assumed for tracks that were not analyzed
+DEFAULT_THROUGHPUT = 256 * 1024  # bytes per second assumed until a download has been measured
+MIN_THROUGHPUT_SAMPLE = 256 * 1024  # smaller downloads are mostly latency, not throughput
+THROUGHPUT_WEIGHT = 0.3  # weight of the latest download in the moving average
+
+_local = threading.local()
+
+
+class ThroughputMeter:
+    """Moving average of the download throughput, measured on finished full-speed downloads."""
+
+    def __init__(self, default=DEFAULT_THROUGHPUT, weight=THROUGHPUT_WEIGHT):
+        self.default = default
+        self.weight = weight
+        self.rate = None
+        self.samples = 0
+
+    def observe(self, progress):
+        if progress.get('status') != 'finished':
+            return
+        size = progress.get('downloaded_bytes') or progress.get('total_bytes')
+        elapsed = progress.get('elapsed')
+        if not size or not elapsed or size < MIN_THROUGHPUT_SAMPLE:
+            return
+        rate = size / elapsed
+        self.rate = rate if self.rate is None else self.weight * rate + (1 - self.weight) * self.rate
+        self.samples += 1
+
+    @property
+    def bytes_per_second(self):
+        return self.rate or self.default
+
+
+# Shared by every download of the process
+download_throughput = ThroughputMeter()
+
+
+def job_progress_hook(progress):
+    """yt_dlp progress hook that lets the scheduler throttle or stop the download running in this thread."""
+    control = getattr(_local, 'control', None)
+    if not (control and control.throttle_rate):
+        download_throughput.observe(progress)  # Throttled downloads say nothing about the link
+    if control:
+        control.on_progress(progress)
+
+
+def track_deadline(player, music_library, playlist_name, tracks_before=0, clock=time.monotonic):
+    """
+    Estimate when a track appended to the player's queue will start playing.
+
+    Args:
+        tracks_before (int): Tracks that will be queued between the current end of the queue and this one.
+
+    Returns:
+        float: Monotonic time at which the track is needed.
+    """
+    def duration(path):
+        video_id = extract_id_from_filename(os.path.basename(path))
+        return music_library.get_duration(playlist_name, video_id, default=DEFAULT_TRACK_DURATION)
+
+    current = max(player.current_index, 0)
+    queued = player.playlist[current:]
+    if not queued:
+        return clock() + tracks_before * DEFAULT_TRACK_DURATION
+    remaining = max(duration(queued[0]) - player.position, 0)
+    remaining += sum(duration(path) for path in queued[1:])
+    return clock() + remaining + tracks_before * DEFAULT_TRACK_DURATION
+
+
+def _lower_thread_priority():
+    # On Linux the nice value is per thread, and ffmpeg processes started from it inherit it
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), BACKGROUND_NICENESS)
+    except (AttributeError, OSError):
+        pass
+
+
+class JobControl:
+    """Flags shared between the scheduler and the worker thread running a job."""
+
+    def __init__(self):
+        self.throttle_rate = None  # bytes per second, None for full speed
+        self.preempted = False
+        self.pinned = False  # a foreground caller is waiting on this job: never slow it down
+        self.cancelled = False  # the scheduler is shutting down: stop, pinned or not
+        self._mark = None
+
+    def on_progress(self, progress):
+        if self.cancelled:
+            raise DownloadCancelled('Download scheduler shut down')
+        if self.preempted and not self.pinned:
+            raise DownloadCancelled('Preempted by a download with a closer deadline')
+        rate = None if self.pinned else self.throttle_rate
+        if not rate or progress.get('status') != 'downloading':
+            self._mark = None
+            return
+        downloaded = progress.get('downloaded_bytes') or 0
+        now = time.monotonic()
+        if self._mark is None:
+            self._mark = (now, downloaded)
+            return
+        start, start_bytes = self._mark
+        ahead = (downloaded - start_bytes) / rate - (now - start)
+        if ahead > 0:
+            time.sleep(min(ahead, 1.0))
+
+
+class DownloadJob:
+    _counter = itertools.count()
+
+    def __init__(self, fn, args, deadline, background, key):
+        self.fn = fn
+        self.args = args
+        self.deadline = deadline if deadline is not None else float('inf')
+        self.background = background
+        self.key = key
+        self.seq = next(self._counter)
+        self.control = JobControl()
+        self.future = None
+        self.running = False
+
+    def __lt__(self, other):
+        return (self.deadline, self.seq) < (other.deadline, other.seq)
+
+
+class DownloadScheduler:
+    """
+    Runs downloads in deadline order, ahead of background work.
+
+    Foreground jobs carry a deadline (monotonic time at which the track is needed) and run in
+    earliest-deadline-first order. Background jobs (--download-all) run on their own low-priority
+    worker and only when no foreground job is waiting. When a foreground job's slack drops below
+    AT_RISK_SLACK, running background downloads are throttled to BACKGROUND_THROTTLE_RATE; below
+    PREEMPT_SLACK they are stopped and requeued. Jobs finishing after their deadline are counted
+    as misses.
+
+    Jobs sharing a `key` (a video ID) are merged: a foreground request for a video that is
+    already queued in the background promotes it instead of downloading it twice.
+    """
+
+    def __init__(self, foreground_workers=FOREGROUND_WORKERS, background_workers=BACKGROUND_WORKERS, clock=time.monotonic):
+        self.workers = {False: foreground_workers, True: background_workers}
+        self.clock = clock
+        self.queues = {False: [], True: []}
+        self.running = {False: set(), True: set()}
+        self.jobs = {}  # key -> job, for jobs queued or running
+        self.executors = {}
+        self.monitor_task = None
+        self.stats = {'completed': 0, 'deadline_misses': 0, 'preempted': 0, 'promoted': 0}
+
+    def _executor(self, background):
+        if background not in self.executors:
+            self.executors[background] = ThreadPoolExecutor(
+                max_workers=self.workers[background],
+                thread_name_prefix='background-download' if background else 'download',
+                initializer=_lower_thread_priority if background else None
+            )
+        return self.executors[background]
+
+    async def run(self, fn, *args, deadline=None, background=False, key=None):
+        """
+        Run `fn(*args)` in a download worker and return its result.
+
+        Args:
+            deadline (float, optional): Monotonic time by which the result is needed.
+            background (bool): Run at background priority (throttled and preempted when needed).
+            key (str, optional): Identifies the download, so concurrent requests for it are merged.
+        """
+        existing = self.jobs.get(key) if key is not None else None
+        if existing:
+            if not background:
+                self._promote(existing, deadline)
+            return await asyncio.shield(existing.future)
+
+        job = DownloadJob(fn, args, deadline, background, key)
+        job.future = asyncio.get_running_loop().create_future()
+        if key is not None:
+            self.jobs[key] = job
+        heapq.heappush(self.queues[background], job)
+        self._pump()
+        return await asyncio.shield(job.future)
+
+    def _promote(self, job, deadline):
+        deadline = deadline if deadline is not None else float('inf')
+        if job.background:
+            self.stats['promoted'] += 1
+            if job.running:
+                job.control.pinned = True
+            else:
+                self.queues[True].remove(job)
+                heapq.heapify(self.queues[True])
+                job.background = False
+                job.deadline = deadline
+                heapq.heappush(self.queues[False], job)
+        elif deadline < job.deadline and not job.running:
+            job.deadline = deadline
+            heapq.heapify(self.queues[False])
+        self._pump()
+
+    def _pump(self):
+        self._check_deadlines()
+        while self.queues[False] and len(self.running[False]) < self.workers[False]:
+            self._start(heapq.heappop(self.queues[False]))
+        # Background work only starts when no foreground job is waiting or about to miss its deadline
+        while (self.queues[True] and not self.queues[False] and self._slack() >= PREEMPT_SLACK
+               and len(self.running[True]) < self.workers[True]):
+            self._start(heapq.heappop(self.queues[True]))
+        if (self.running[False] or self.queues[False]) and self.monitor_task is None:
+            self.monitor_task = asyncio.ensure_future(self._monitor())
+
+    def _start(self, job):
+        job.running = True
+        self.running[job.background].add(job)
+        asyncio.ensure_future(self._execute(job))
+
+    async def _execute(self, job):
+        background = job.background
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(self._executor(background), self._call, job)
+        except DownloadCancelled:
+            if job.control.cancelled:
+                self.running[background].discard(job)
+                job.running = False
+                if job.key is not None and self.jobs.get(job.key) is job:
+                    del self.jobs[job.key]
+                job.future.cancel()
+                return
+            self.running[background].discard(job)
+            job.running = False
+            job.control = JobControl()
+            self.stats['preempted'] += 1
+            logging.info(f"Background download {job.key or job.fn.__name__} preempted, requeued.")
+            heapq.heappush(self.queues[True], job)
+            self._pump()
+            return
+        except Exception as e:
+            self._finish(job, background)
+            job.future.set_exception(e)
+            return
+        self._finish(job, background)
+        job.future.set_result(result)
+
+    def _finish(self, job, background):
+        self.running[background].discard(job)
+        job.running = False
+        if job.key is not None and self.jobs.get(job.key) is job:
+            del self.jobs[job.key]
+        self.stats['completed'] += 1
+        late = self.clock() - job.deadline
+        if late > 0 and not job.background:
+            self.stats['deadline_misses'] += 1
+            logging.warning(f"Download {job.key or job.fn.__name__} finished {late:.0f}s after its deadline.")
+        self._pump()
+
+    @staticmethod
+    def _call(job):
+        _local.control = job.control
+        try:
+            return job.fn(*job.args)
+        finally:
+            _local.control = None
+
+    def _slack(self):
+        """Seconds left before the closest foreground deadline."""
+        foreground = list(self.running[False]) + self.queues[False]
+        return min((job.deadline for job in foreground), default=float('inf')) - self.clock()
+
+    def _check_deadlines(self):
+        """Throttle or preempt background downloads while a foreground deadline is at risk."""
+        slack = self._slack()
+        throttle_rate = BACKGROUND_THROTTLE_RATE if slack < AT_RISK_SLACK else None
+        for job in self.running[True]:
+            if job.control.throttle_rate != throttle_rate:
+                job.control.throttle_rate = throttle_rate
+                logging.info(f"{'Throttling' if throttle_rate else 'Unthrottling'} background download {job.key or ''}")
+            if slack < PREEMPT_SLACK:
+                job.control.preempted = True
+
+    async def _monitor(self):
+        try:
+            while self.running[False] or self.queues[False]:
+                self._pump()
+                await asyncio.sleep(MONITOR_INTERVAL)
+            self._check_deadlines()
+        finally:
+            self.monitor_task = None
+
+    def report(self):
+        return (f"Download scheduler: {self.stats['completed']} jobs, {self.stats['deadline_misses']} deadline misses, "
+                f"{self.stats['preempted']} preemptions, {self.stats['promoted']} promotions")
+
+    def shutdown(self):
+        """Stop running downloads at their next progress update and drop the queued ones."""
+        for background in (False, True):
+            for job in self.running[background]:
+                job.control.cancelled = True
+            for job in self.queues[background]:
+                job.future.cancel()
+                if job.key is not None and self.jobs.get(job.key) is job:
+                    del self.jobs[job.key]
+            self.queues[background].clear()
+        # Worker threads are joined at interpreter exit: the cancelled downloads end them quickly
+        for executor in self.executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+        self.executors.clear()
+
+
+# Shared by every download of the process
+shared_scheduler = DownloadScheduler()
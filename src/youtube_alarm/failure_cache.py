@@ -0,0 +1,214 @@
+import os
+import json
+import time
+import logging
+import threading
+
+from .utils import write_json_atomic
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(module)s - %(funcName)s - line %(lineno)d - %(message)s'
+)
+
+FAILURE_CACHE_FILE_NAME = ".youtube_alarm_failures.json"
+
+# Error classes, from the message yt_dlp reports
+UNAVAILABLE = "unavailable"  # private, deleted, terminated account: will not come back
+RESTRICTED = "restricted"  # geo-blocked, members-only, age-gated: unlikely to change soon
+THROTTLED = "throttled"  # the extractor itself is being rate limited, not this video's fault
+TRANSIENT = "transient"  # anything else: network errors, timeouts, extractor hiccups
+
+ERROR_PATTERNS = [
+    (THROTTLED, ("http error 429", "too many requests", "confirm you're not a bot", "confirm you’re not a bot",
+                 "rate-limited", "rate limited")),
+    (UNAVAILABLE, ("private video", "video unavailable", "has been removed", "been terminated",
+                   "no longer available", "does not exist", "video has been deleted")),
+    (RESTRICTED, ("available in your country", "geo restricted", "geo-restricted", "members-only",
+                  "join this channel", "sign in to confirm your age", "age-restricted")),
+]
+
+# First retry delay and cap per error class, in seconds; the delay doubles with every failure
+RETRY_BACKOFF = {
+    UNAVAILABLE: (7 * 24 * 3600, 90 * 24 * 3600),
+    RESTRICTED: (24 * 3600, 30 * 24 * 3600),
+    TRANSIENT: (10 * 60, 24 * 3600),
+}
+
+BREAKER_THRESHOLD = 3  # consecutive throttling errors before extraction is paused
+BREAKER_COOLDOWN = 5 * 60  # first pause, doubled each time the breaker trips again
+BREAKER_MAX_COOLDOWN = 3600
+BREAKER_TRIAL_TIMEOUT = 60  # seconds before a trial request that never reported back is given up on
+
+
+def classify_error(error):
+    """Map a yt_dlp error (or its message) to one of the error classes."""
+    message = str(error).lower()
+    for error_class, patterns in ERROR_PATTERNS:
+        if any(pattern in message for pattern in patterns):
+            return error_class
+    return TRANSIENT
+
+
+class CircuitBreaker:
+    """
+    Pauses all extraction when YouTube starts throttling us.
+
+    After BREAKER_THRESHOLD consecutive throttling errors the breaker opens for a cooldown that
+    doubles every time it trips again. Once the cooldown has passed a single trial request is
+    let through: a success closes the breaker, another throttling error reopens it, and any other
+    error lets the next trial through. A trial that never reports back is given up on after
+    `trial_timeout` seconds. Downloads report from worker threads, so the state changes under a lock.
+    """
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN, max_cooldown=BREAKER_MAX_COOLDOWN,
+                 trial_timeout=BREAKER_TRIAL_TIMEOUT, clock=time.monotonic):
+        self.threshold = threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.trial_timeout = trial_timeout
+        self.clock = clock
+        self.consecutive_errors = 0
+        self.cooldown = cooldown
+        self.open_until = None
+        self.trial_started = None  # set while the half-open trial request is in flight
+        self.lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.open_until is not None and self.clock() < self.open_until
+
+    def remaining(self):
+        """Seconds until extraction may be tried again (0 if it is allowed now)."""
+        with self.lock:
+            if self.open_until is None:
+                return 0
+            now = self.clock()
+            if now < self.open_until:
+                return self.open_until - now
+            if self.trial_started is not None:
+                return max(0, self.trial_started + self.trial_timeout - now)
+            return 0
+
+    def allow(self):
+        """True if a request may be made now. Once half-open, only the caller that gets the trial is allowed."""
+        with self.lock:
+            if self.open_until is None:
+                return True
+            now = self.clock()
+            if now < self.open_until:
+                return False
+            if self.trial_started is not None and now < self.trial_started + self.trial_timeout:
+                return False  # Another caller's trial is in flight
+            self.trial_started = now
+            return True
+
+    def record_success(self):
+        with self.lock:
+            if self.open_until is not None:
+                logging.info("Extraction is working again, closing circuit breaker.")
+            self.consecutive_errors = 0
+            self.cooldown = self.base_cooldown
+            self.open_until = None
+            self.trial_started = None
+
+    def record_inconclusive(self):
+        """A request failed for a reason that says nothing about throttling, e.g. a timeout."""
+        with self.lock:
+            self.trial_started = None  # The trial proved nothing: let the next request try
+
+    def record_throttle(self):
+        with self.lock:
+            self.consecutive_errors += 1
+            # This was the trial request after a cooldown
+            half_open = self.open_until is not None and self.clock() >= self.open_until
+            if half_open or self.consecutive_errors >= self.threshold:
+                if half_open:
+                    self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+                self.open_until = self.clock() + self.cooldown
+                self.trial_started = None
+                logging.warning(f"Extractor appears to be throttled, pausing extraction for {self.cooldown:.0f}s.")
+
+
+class FailureCache:
+    """
+    Persistent record of videos that failed to extract or download, keyed by YouTube ID.
+
+    Each entry keeps the error class, the number of failures and the time of the next retry,
+    so dead videos are skipped up front instead of costing a network round trip on every run.
+    Throttling errors are not held against the video; they feed the circuit breaker instead.
+    Downloads report from worker threads, so entries only change and are saved under a lock.
+    """
+
+    def __init__(self, base_folder, clock=time.time):
+        self.path = os.path.join(base_folder, FAILURE_CACHE_FILE_NAME)
+        self.clock = clock
+        self.entries = {}
+        self.breaker = CircuitBreaker()
+        self.lock = threading.RLock()
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            self.entries = {}
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable failure cache {self.path}: {e}")
+            self.entries = {}
+
+    def save(self):
+        # Under the lock: entries cannot change while they are serialized, and an older state
+        # never replaces a newer one on disk
+        with self.lock:
+            try:
+                write_json_atomic(self.path, self.entries)
+            except OSError as e:
+                logging.error(f"Could not write failure cache {self.path}: {e}")
+
+    def should_skip(self, video_id):
+        """True if the video failed before and its retry time has not come yet."""
+        entry = self.entries.get(video_id)
+        return entry is not None and self.clock() < entry["retry_at"]
+
+    def record_failure(self, video_id, error):
+        """
+        Remember that a video failed.
+
+        Returns:
+            str: The error class the failure was filed under.
+        """
+        error_class = classify_error(error)
+        if error_class == THROTTLED:
+            self.breaker.record_throttle()
+            return error_class
+        if error_class == TRANSIENT:
+            # A timeout or network error tells nothing about throttling: an open breaker stays open
+            self.breaker.record_inconclusive()
+        else:
+            # YouTube answered about the video itself, so it is not throttling us
+            self.breaker.record_success()
+        if not video_id:
+            return error_class
+
+        with self.lock:
+            entry = self.entries.get(video_id, {"failures": 0})
+            failures = entry["failures"] + 1
+            first_delay, max_delay = RETRY_BACKOFF[error_class]
+            delay = min(first_delay * 2 ** (failures - 1), max_delay)
+            self.entries[video_id] = {
+                "error": error_class,
+                "message": str(error)[:200],
+                "failures": failures,
+                "retry_at": self.clock() + delay,
+            }
+            self.save()
+        logging.info(f"Video {video_id} failed ({error_class}), not retrying for {delay / 3600:.1f}h.")
+        return error_class
+
+    def record_success(self, video_id):
+        self.breaker.record_success()
+        with self.lock:
+            if self.entries.pop(video_id, None) is not None:
+                self.save()
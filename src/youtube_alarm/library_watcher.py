@@ -0,0 +1,215 @@
+import os
+import sys
+import ctypes
+import ctypes.util
+import struct
+import asyncio
+import logging
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(module)s - %(funcName)s - line %(lineno)d - %(message)s'
+)
+
+# inotify constants from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+DEBOUNCE_DELAY = 0.5  # seconds of quiet before a burst of events is applied
+MAX_DEBOUNCE_DELAY = 5.0  # never hold events back longer than this
+POLL_INTERVAL = 300  # seconds between rescans when inotify is unavailable
+
+
+def _load_inotify():
+    """Return libc if it exposes inotify, None otherwise."""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+class LibraryWatcher:
+    """
+    Keeps a MusicLibrary in sync with its folder while the program runs.
+
+    On Linux the watcher listens to inotify events and applies file creations, renames and
+    deletions to the library one by one. Bursts of events are debounced so a playlist copied
+    in by hand is applied in a single pass. Where inotify is unavailable the watcher falls back
+    to rescanning the whole library every `poll_interval` seconds.
+    """
+
+    def __init__(self, music_library, debounce=DEBOUNCE_DELAY, poll_interval=POLL_INTERVAL, use_inotify=True):
+        self.music_library = music_library
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        self.inotify_fd = None
+        self.watches = {}  # wd -> playlist name ('' for the base folder)
+        self.pending = {}  # (playlist_name, filename) -> True if the file appeared, False if it vanished
+        self.pending_since = None
+        self._libc = None
+        self._flush_handle = None
+        self._poll_task = None
+        self._rescan_task = None
+        self._loop = None
+
+    @property
+    def is_polling(self):
+        return self._poll_task is not None
+
+    def start(self):
+        """Start watching. Must be called from within a running event loop."""
+        self._loop = asyncio.get_running_loop()
+        if self.use_inotify and self._start_inotify():
+            logging.info(f"Watching {self.music_library.base_folder} with inotify.")
+        else:
+            logging.info(f"inotify unavailable, rescanning {self.music_library.base_folder} every {self.poll_interval}s.")
+            self._poll_task = asyncio.ensure_future(self._poll_loop())
+
+    def stop(self):
+        """Stop watching and release the inotify descriptor."""
+        if self._flush_handle:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._poll_task:
+            self._poll_task.cancel()
+            self._poll_task = None
+        if self._rescan_task:
+            self._rescan_task.cancel()
+            self._rescan_task = None
+        if self.inotify_fd is not None:
+            self._loop.remove_reader(self.inotify_fd)
+            os.close(self.inotify_fd)
+            self.inotify_fd = None
+            self.watches.clear()
+
+    def _start_inotify(self):
+        self._libc = _load_inotify()
+        if self._libc is None:
+            return False
+        fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            logging.warning(f"inotify_init1 failed: {os.strerror(ctypes.get_errno())}")
+            return False
+        self.inotify_fd = fd
+        if not self._add_watch(self.music_library.base_folder, ""):
+            os.close(fd)
+            self.inotify_fd = None
+            return False
+        for playlist_name in os.listdir(self.music_library.base_folder):
+            if os.path.isdir(os.path.join(self.music_library.base_folder, playlist_name)):
+                self._add_watch(os.path.join(self.music_library.base_folder, playlist_name), playlist_name)
+        self._loop.add_reader(fd, self._read_events)
+        return True
+
+    def _add_watch(self, path, playlist_name):
+        wd = self._libc.inotify_add_watch(self.inotify_fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            logging.warning(f"Could not watch {path}: {os.strerror(ctypes.get_errno())}")
+            return False
+        self.watches[wd] = playlist_name
+        return True
+
+    def _read_events(self):
+        try:
+            data = os.read(self.inotify_fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            self._handle_event(wd, mask, name)
+        self._schedule_flush()
+
+    def _handle_event(self, wd, mask, name):
+        if mask & IN_Q_OVERFLOW:
+            logging.warning("inotify queue overflowed, rescanning the library.")
+            self.pending.clear()
+            if not self._rescan_task or self._rescan_task.done():
+                self._rescan_task = asyncio.ensure_future(self.rescan())
+            return
+        playlist_name = self.watches.get(wd)
+        if playlist_name is None:
+            return
+        if mask & IN_IGNORED:
+            del self.watches[wd]
+            return
+        if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+            if playlist_name:
+                self.pending = {key: added for key, added in self.pending.items() if key[0] != playlist_name}
+                self.music_library.discard_playlist(playlist_name)
+            return
+
+        if playlist_name == "":
+            # Event in the base folder: only new playlist folders matter, removals arrive as *_SELF
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                playlist_folder = os.path.join(self.music_library.base_folder, name)
+                if self._add_watch(playlist_folder, name):
+                    # Files may have landed before the watch existed
+                    self.music_library.scan_playlist_folder(name, playlist_folder)
+            return
+
+        if mask & IN_ISDIR or not name.endswith(".mp3"):
+            return
+        if mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+            self.pending[(playlist_name, name)] = True
+        elif mask & (IN_DELETE | IN_MOVED_FROM):
+            self.pending[(playlist_name, name)] = False
+        # IN_CREATE on a file is ignored: IN_CLOSE_WRITE follows once it is complete.
+
+    def _schedule_flush(self):
+        if not self.pending:
+            return
+        now = self._loop.time()
+        if self.pending_since is None:
+            self.pending_since = now
+        if self._flush_handle:
+            self._flush_handle.cancel()
+        delay = min(self.debounce, max(0.0, self.pending_since + MAX_DEBOUNCE_DELAY - now))
+        self._flush_handle = self._loop.call_later(delay, self.flush)
+
+    def flush(self):
+        """Apply the pending file events to the library."""
+        self._flush_handle = None
+        self.pending_since = None
+        pending, self.pending = self.pending, {}
+        added = removed = 0
+        for (playlist_name, name), appeared in pending.items():
+            file_path = os.path.join(self.music_library.base_folder, playlist_name, name)
+            if appeared and os.path.exists(file_path):
+                added += self.music_library.index_file(playlist_name, file_path)
+            else:
+                removed += self.music_library.discard_file(playlist_name, file_path)
+        if added or removed:
+            logging.info(f"Library updated from disk: {added} added, {removed} removed.")
+
+    async def rescan(self):
+        """Rebuild the whole library index in a thread: reading every file's tags would stall the event loop."""
+        await asyncio.to_thread(self.music_library.scan_folders)
+
+    async def _poll_loop(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            await self.rescan()
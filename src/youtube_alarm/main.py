@@ -1,24 +1,26 @@
 import os
 import re
 import time
-import random
 import logging
 import asyncio
 import datetime
-import argparse
-import requests
 import subprocess
 import signal
-from pathlib import Path  # Added for robust path handling
-
-import yt_dlp
-
-from mutagen.id3 import ID3, TIT2, TPE1, TALB, TXXX
-from mutagen import MutagenError
+import threading
 
 from .utils import extract_id_from_url, sanitize_name
-from .vlc_manager import VLCManager
 from .music_library import MusicLibrary
+from .ydl_pool import shared_pool
+from .pipeline import TrackPipeline, stage_timings
+from .checkpoint import PlaybackCheckpoint
+from .failure_cache import FailureCache
+from .download_scheduler import shared_scheduler, track_deadline
+from .prefetch import TrackPrefetcher
+from .alarm_scheduler import AlarmScheduler
+from .playlist_stream import PlaylistQueue, stream_playlist, SHUFFLE_WINDOW
+from .profiler import shared_profiler
+from .player_backend import PlayerStartError
+from .cli import entry_point  # Still importable from here, the command line itself lives in cli.py
 
 logging.basicConfig(
     level=logging.INFO,
@@ -27,123 +29,63 @@ logging.basicConfig(
 
 BUFFER_SIZE = 20
 MIN_SONGS_TO_START = 3
-
-async def extract_video_info(video_url):
-    ydl_opts = {
-        'quiet': True,
-        'skip_download': True
-    }
-    try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info_dict = ydl.extract_info(video_url, download=False)
-            logging.info(f"Extracted info for {video_url}: {info_dict.get('title')}")
-            return info_dict
-    except yt_dlp.utils.DownloadError as e:
-        logging.error(f"Error extracting info for {video_url}: {e}")
-        return None
-
-async def download_audio(video_url, playlist_name, music_library):
-    # Ensure we use the base folder from the library instance
-    playlist_folder = os.path.join(music_library.base_folder, playlist_name)
-
-    # We download using the ID and the raw title to ensure uniqueness during download
-    ydl_opts = {
-        'format': 'bestaudio/best',
-        'outtmpl': os.path.join(playlist_folder, '%(id)s_%(title)s.%(ext)s'),  # Do not sanitize the title here
-        'postprocessors': [{
-            'key': 'FFmpegExtractAudio',
-            'preferredcodec': 'mp3',
-            'preferredquality': '192',
-        }],
-        'noplaylist': True,
-        'quiet': True
-    }
-    try:
-        start_time = datetime.datetime.now()
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info_dict = ydl.extract_info(video_url, download=True)
-            end_time = datetime.datetime.now()
-
-            video_id = info_dict.get('id')
-            title = info_dict.get('title')
-            artist = info_dict.get('uploader')
-            album = playlist_name
-
-            if not music_library.song_exists(playlist_name, video_id):
-                # The file currently exists on disk with the RAW (unsanitized) title
-                raw_file_path = os.path.join(playlist_folder, f"{video_id}_{title}.mp3")
-
-                if os.path.exists(raw_file_path):
-                    logging.info(f"File downloaded successfully: {raw_file_path}")
-
-                    # CRITICAL FIX:
-                    # We pass the SANITIZED title to the library.
-                    # The library's add_song method will take our 'raw_file_path'
-                    # and rename it to match the sanitized title.
-                    clean_title = sanitize_name(title)
-
-                    music_library.add_song(
-                        playlist_name=playlist_name,
-                        video_id=video_id,
-                        title=clean_title,
-                        file_path=raw_file_path
-                    )
-
-                    # Now we calculate the new path (post-rename) to apply metadata
-                    final_path = os.path.join(playlist_folder, f"{video_id}_{clean_title}.mp3")
-
-                    try:
-                        audio = ID3(final_path)
-                        audio.add(TIT2(encoding=3, text=title)) # Keep original title in metadata
-                        if artist:
-                            audio.add(TPE1(encoding=3, text=artist))
-                        audio.add(TALB(encoding=3, text=album))  # Set album as playlist name
-                        audio.add(TXXX(encoding=3, desc='YouTubeID', text=video_id))
-                        audio.add(TXXX(encoding=3, desc='PlaylistName', text=playlist_name))  # Save playlist info in metadata
-                        audio.save()
-                    except (MutagenError, FileNotFoundError) as e:
-                        logging.error(f"Metadata error for {final_path}: {e}")
-                        return None
-
-                    logging.info(f"Downloaded and processed: {clean_title}")
-                    logging.info(f"Saved as: {final_path} with metadata - Title: {title}, Artist: {artist}, Album: {album}, YouTubeID: {video_id}")
-
-                    return final_path  # Return the file path instead of adding directly to VLC playlist
-                else:
-                    logging.error(f"Expected file not found: {raw_file_path}")
-                    return None
-            else:
-                return None
-    except (yt_dlp.utils.DownloadError, FileNotFoundError) as e:
-        logging.error(f"Error processing {video_url}: {e}")
-        return None
-    except MutagenError as e:
-        logging.error(f"Mutagen error while processing {file_path}: {e}")
-        return None
-
-async def maintain_buffer(videos, playlist_name, music_library, vlc_manager, current_song_index):
+PREFETCH_BEFORE_ALARM = 120  # seconds: warm the first songs into the page cache
+WARM_UP_BEFORE_ALARM = 30  # seconds: start the player so it is ready when the alarm rings
+DRAFT_UPGRADE_INTERVAL = 60  # seconds between two looks for draft-quality songs to upgrade
+PLAYER_RETRY_DELAY = 5  # seconds before trying again to start a player that failed to start
+
+# Set when the user stops the program: the exit is deliberate, no checkpoint to resume from
+stop_requested = threading.Event()
+
+async def download_audio(video_url, playlist_name, music_library, failures=None, deadline=None, background=False):
+    """Download a video through the download scheduler. Returns the new MP3 path or None."""
+    pipeline = TrackPipeline(playlist_name, music_library, failures)
+    return await shared_scheduler.run(pipeline.process, video_url, deadline, deadline=deadline, background=background,
+                                      key=extract_id_from_url(video_url))
+
+def is_known_failure(video_url, failures):
+    """True if a previous run found this video unavailable and its retry time has not come yet."""
+    if failures and failures.should_skip(extract_id_from_url(video_url)):
+        logging.info(f"Skipping {video_url}: it failed recently.")
+        return True
+    return False
+
+async def maintain_buffer(videos, playlist_name, music_library, player, current_song_index, failures=None):
     buffer = []  # Local buffer to track which songs need to be added to the VLC playlist
 
-    if vlc_manager.vlc_process is None or vlc_manager.vlc_process.poll() is not None:
-        return  # Exit if VLC is not running
+    if not player.is_running():
+        return  # Exit if the player is not running
 
-    n_songs = vlc_manager.get_playlist_length()
+    n_songs = player.get_playlist_length()
     songs_ahead = n_songs - current_song_index
+    pipeline = TrackPipeline(playlist_name, music_library, failures)
 
     # Ensure the buffer has the right number of songs ahead
     while songs_ahead < BUFFER_SIZE and videos:
-        next_video_url = videos.pop(0)
-        info_dict = await extract_video_info(next_video_url)
+        if failures and not failures.breaker.allow():
+            break  # Extractor is throttled; try again once the breaker lets us
+        next_video_url = videos.popleft()
+        if is_known_failure(next_video_url, failures):
+            continue
+        # Needed once every song queued ahead of it has played
+        deadline = track_deadline(player, music_library, playlist_name, tracks_before=len(buffer))
+        info_dict = await shared_scheduler.run(pipeline.resolve, next_video_url, deadline=deadline)
         video_id = info_dict.get('id', None) if info_dict else None
         title = sanitize_name(info_dict.get('title', None)) if info_dict else None
 
         if video_id and title:
             # Check if the song is already in the buffer or playlist
-            song_in_playlist = any(video_id in path for path in vlc_manager.playlist)
+            song_in_playlist = any(video_id in path for path in player.playlist)
             song_in_buffer = any(video_id in path for path in buffer)
 
             if not music_library.song_exists(playlist_name, video_id) and not song_in_playlist and not song_in_buffer:
-                file_path = await download_audio(next_video_url, playlist_name, music_library)
+                # Downloads from the resolved info, no second extraction. If a background
+                # download of the same video is in flight, this waits for it instead
+                # A draft quality is fetched instead when the deadline is too close for the best one
+                file_path = await shared_scheduler.run(pipeline.fetch, info_dict, deadline, deadline=deadline, key=video_id)
+                if not file_path:
+                    paths = music_library.get_song_paths_by_id(video_id, playlist_name)
+                    file_path = paths[0] if paths else None
                 if file_path:
                     buffer.append(file_path)  # Add the downloaded song to the buffer
             else:
@@ -155,80 +97,172 @@ async def maintain_buffer(videos, playlist_name, music_library, vlc_manager, cur
         songs_ahead = len(buffer) + n_songs - current_song_index
 
     # Add songs from buffer to VLC playlist in the correct order
-    while buffer:
-        song_to_add = buffer.pop(0)
-        if song_to_add not in vlc_manager.playlist:  # Double check to avoid duplicates
-            await vlc_manager.add_to_playlist(song_to_add)
+    for song_to_add in buffer:
+        if song_to_add not in player.playlist:  # Double check to avoid duplicates
+            await player.add_to_playlist(song_to_add)
 
 
-async def player_loop(vlc_manager, current_song_index):
+async def upgrade_drafts(playlist_name, music_library, player, failures=None):
+    """Replace draft-quality songs with the best quality, at background priority."""
+    pipeline = TrackPipeline(playlist_name, music_library, failures)
+    while True:
+        upcoming = set(player.playlist[max(player.current_index, 0):])
+        for video_id in music_library.get_draft_ids(playlist_name):
+            if failures and not failures.breaker.allow():
+                break  # Extractor is throttled: upgrades are the first thing to wait
+            if failures and failures.should_skip(video_id):
+                continue  # Its last upgrade failed: wait for the retry time like any other download
+            paths = music_library.get_song_paths_by_id(video_id, playlist_name)
+            if paths and paths[0] in upcoming:
+                continue  # Playing or queued: the player keeps the draft, it is upgraded for next time
+            try:
+                await shared_scheduler.run(pipeline.upgrade, video_id, background=True, key=video_id)
+            except Exception as e:
+                # The draft stays playable: log and move on to the next one
+                logging.error(f"Could not upgrade draft {video_id}: {e!r}")
+        await asyncio.sleep(DRAFT_UPGRADE_INTERVAL)
+
+def log_task_failure(task):
+    """Done callback for background tasks that are never awaited, so their errors are not lost."""
+    if not task.cancelled() and task.exception():
+        logging.error(f"Background task {task.get_name()} failed: {task.exception()!r}")
+
+async def player_loop(player, current_song_index):
     current_song = None
-    if vlc_manager.vlc_process and vlc_manager.vlc_process.poll() is None:
-        try:
-            await vlc_manager.update_current_song_index()
-            new_song, new_song_index = await vlc_manager.get_current_song()
-            if new_song_index != current_song_index:
-                current_song = new_song
-                current_song_index = new_song_index
-                logging.info(f"Currently playing: {current_song} (Index: {current_song_index})")
-            else:
-                pass
-                #logging.info(f"No change in the current song.")
-            return current_song_index  # Return the updated song index
-        except requests.RequestException as e:
-            logging.error(f"Error checking VLC status: {e}")
-            return -1
-
-async def main_loop(videos, playlist_name, music_library, vlc_manager, alarm_time, test_mode):
+    if player.is_running():
+        # Backends handle their own transport errors and report an unknown song as index -1
+        await player.update_current_song_index()
+        new_song, new_song_index = await player.get_current_song()
+        if new_song_index != current_song_index:
+            current_song = new_song
+            current_song_index = new_song_index
+            logging.info(f"Currently playing: {current_song} (Index: {current_song_index})")
+        else:
+            pass
+            #logging.info(f"No change in the current song.")
+        return current_song_index  # Return the updated song index
+
+async def start_player(player):
+    """Start the player. Returns False, after logging why, if it could not be started."""
+    try:
+        with shared_profiler.phase('player_start'):
+            await player.start()
+    except PlayerStartError as e:
+        logging.error(f"Could not start {type(player).__name__}: {e}")
+        return False
+    return True
+
+async def resume_playback(player, state):
+    """Restore the queue and track position saved by a previous run. Returns True if playback resumed."""
+    if state.get("player") == type(player).__name__ and state.get("player_pid") and await player.rejoin(state["player_pid"]):
+        # The player survived the restart and still holds the whole queue
+        player.playlist = list(state["player_playlist"])
+        player.current_index = state["current_index"]
+        return True
+
+    # Requeue from the interrupted song onwards and jump back to where it was
+    remaining = [path for path in state["player_playlist"][max(state["current_index"], 0):] if os.path.exists(path)]
+    if not remaining or not await start_player(player):
+        return False
+    for song in remaining:
+        await player.add_to_playlist(song)
+    await player.start_playback()
+    if state.get("position") and os.path.exists(state["player_playlist"][max(state["current_index"], 0)]):
+        await player.seek(state["position"])
+    logging.info(f"Resumed playback with {len(remaining)} queued songs.")
+    return True
+
+async def wait_for_alarm(alarm_time, playlist_name, music_library, player, prefetcher=None, scheduler=None):
+    """Sleep until the alarm, warming up the first songs and the player shortly before it."""
+    scheduler = scheduler or AlarmScheduler()
+    alarm_timestamp = alarm_time.timestamp()
+
+    async def warm_up_player():
+        if music_library.count_songs(playlist_name) >= MIN_SONGS_TO_START:
+            await start_player(player)  # On failure the alarm itself tries again
+
+    if prefetcher:
+        first_songs = music_library.get_song_paths(playlist_name)[:MIN_SONGS_TO_START]
+        scheduler.add_task(alarm_timestamp - PREFETCH_BEFORE_ALARM, "prefetch first songs", lambda: prefetcher.warm(first_songs))
+    scheduler.add_task(alarm_timestamp - WARM_UP_BEFORE_ALARM, "player warm-up", warm_up_player)
+    await scheduler.wait_until(alarm_time)
+
+async def main_loop(videos, playlist_name, music_library, player, alarm_time, test_mode,
+                    checkpoint=None, playlist_url=None, resume_state=None, failures=None, prefetcher=None):
     alarm_triggered = False
     server_started = False
     current_song_index = -1
+    start_failures = 0
 
-    while True:
-        current_time = datetime.datetime.now()
-
-        # Trigger logic: Either test mode OR time reached
-        should_trigger = test_mode or (alarm_time and current_time >= alarm_time)
+    # Trigger logic: Either test mode OR time reached. Until then, sleep instead of polling the clock
+    if not test_mode:
+        with shared_profiler.phase('wait_for_alarm'):
+            await wait_for_alarm(alarm_time, playlist_name, music_library, player, prefetcher)
 
-        if should_trigger:
-            if not alarm_triggered:
-                logging.info("Alarm triggered!")
+    while True:
+        if player.closed:
+            logging.info("Player stopped on request, ending the alarm.")
+            return
+        if not alarm_triggered:
+            if resume_state:
+                server_started = await resume_playback(player, resume_state)
+                resume_state = None
+            if not server_started:
+                if not start_failures:
+                    logging.info("Alarm triggered!")
+                    shared_profiler.mark('alarm')
 
                 # Wait for enough songs before starting (unless downloading all)
                 if music_library.count_songs(playlist_name) >= MIN_SONGS_TO_START:
-                    vlc_manager.initialize_vlc_server()
-                    while not vlc_manager.is_server_running():
-                        logging.info("Waiting for VLC server to start...")
-                        await asyncio.sleep(1)
+                    # Unless the pre-alarm warm-up already started it
+                    if not player.is_running() and not await start_player(player):
+                        start_failures += 1
+                        await asyncio.sleep(PLAYER_RETRY_DELAY)
+                        continue  # The alarm is not served yet: keep trying
 
                     # Add initial batch
-                    for song in music_library.get_song_paths(playlist_name)[:BUFFER_SIZE]:
-                        await vlc_manager.add_to_playlist(song)
-                    await vlc_manager.start_playback()
+                    with shared_profiler.phase('queue_first_songs'):
+                        for song in music_library.get_song_paths(playlist_name)[:BUFFER_SIZE]:
+                            await player.add_to_playlist(song)
+                        await player.start_playback()
+                    shared_profiler.mark('playback started')
 
                     server_started = True
                 alarm_triggered = True
 
         if server_started:
-            current_song_index = await player_loop(vlc_manager, current_song_index)  # Get the current song index
-            await maintain_buffer(videos, playlist_name, music_library, vlc_manager, current_song_index)
-
-        await asyncio.sleep(.25)
-
-async def download_entire_playlist(videos, playlist_name, music_library):
-    """Downloads the entire playlist at once."""
+            with shared_profiler.phase('playback_tick'):
+                if await player.supervise():
+                    current_song_index = -1  # The queue was rebuilt from the interrupted song
+                current_song_index = await player_loop(player, current_song_index)  # Get the current song index
+                if prefetcher:
+                    await prefetcher.update()  # Warm the next tracks into the page cache before they start
+                await maintain_buffer(videos, playlist_name, music_library, player, current_song_index, failures)
+                if checkpoint:
+                    checkpoint.update(playlist_url, playlist_name, videos, player)
+            await player.wait_for_change(player.poll_interval)
+        else:
+            await asyncio.sleep(.25)
+
+async def download_entire_playlist(videos, playlist_name, music_library, failures=None):
+    """Downloads the entire playlist at once, at background priority, as its pages are listed."""
     logging.info("Starting download of entire playlist...")
-    for video_url in videos:
-        await download_audio(video_url, playlist_name, music_library)
+    async for video_url in videos.follow():
+        if is_known_failure(video_url, failures):
+            continue
+        if failures and not failures.breaker.allow():
+            await asyncio.sleep(failures.breaker.remaining())
+        await download_audio(video_url, playlist_name, music_library, failures, background=True)
     logging.info("Entire playlist download complete.")
 
 def signal_handler(signal, frame):
     logging.info("Ctrl+C detected. Exiting gracefully...")
+    stop_requested.set()
     for task in asyncio.all_tasks():
         task.cancel()
     asyncio.get_event_loop().stop()
 
-async def main(playlist_url, hour_alarm, minute_alarm, base_dir, test_mode, validate, shuffle, download_all):
+async def main(playlist_url, hour_alarm, minute_alarm, base_dir, test_mode, validate, shuffle, download_all, watch_library=False, analyze=False, resume=True, player_name='vlc'):
     signal.signal(signal.SIGINT, signal_handler)
 
     start_time = datetime.datetime.now()
@@ -243,53 +277,129 @@ async def main(playlist_url, hour_alarm, minute_alarm, base_dir, test_mode, vali
             logging.error(f"Could not create directory {base_dir}: {e}")
             return
 
-    ydl_opts = {
-        'extract_flat': 'in_playlist',
-        'skip_download': True,
-        'quiet': True
-    }
+    # A recent checkpoint means a previous run was interrupted mid-alarm: pick up where it stopped
+    checkpoint = PlaybackCheckpoint(base_dir)
+    resume_state = None
+    if not resume:
+        checkpoint.clear()
+    elif not download_all:
+        resume_state = checkpoint.load(playlist_url)
+
+    if resume_state:
+        logging.info("Resuming interrupted alarm from checkpoint.")
+        videos = PlaylistQueue(resume_state["videos"], shuffle_window=SHUFFLE_WINDOW if shuffle else 0,
+                               listed_count=resume_state.get("listed_count"))
+        playlist_name = resume_state["playlist_name"]
+        if not resume_state.get("listing_complete", True):
+            # The playlist was not fully listed yet: list the rest behind what was already queued
+            logging.info(f"Listing the rest of the playlist after its first {videos.listed_count} videos.")
+            videos.done = False
+            try:
+                await stream_playlist(playlist_url, videos, skip=videos.listed_count)
+            except Exception as e:
+                logging.error(f"Failed to list the rest of the playlist: {e}")
+                videos.finish()
+    else:
+        logging.info("Fetching playlist info...")
+        # Entries arrive page by page while the rest of the program already runs on the first ones
+        videos = PlaylistQueue(shuffle_window=SHUFFLE_WINDOW if shuffle else 0, done=False)
+        with shared_profiler.phase('playlist_fetch'):  # Until the first page is listed
+            try:
+                playlist_name, _ = await stream_playlist(playlist_url, videos)
+            except Exception as e:
+                logging.error(f"Failed to fetch playlist info: {e}")
+                return
+
+            if not await videos.wait_for(1):
+                logging.error("No videos found in the playlist.")
+                return
 
-    logging.info("Fetching playlist info...")
+    # Initialize library with the user-selected (or default) base folder
+    with shared_profiler.phase('library_scan'):
+        music_library = MusicLibrary(base_dir, validate=validate)
+        music_library.initialize_playlist(playlist_name)
+    if not resume_state:
+        with shared_profiler.phase('check_metadata'):
+            music_library.check_metadata(playlist_name)
+    with shared_profiler.phase('clean_up'):
+        music_library.clean_up_non_mp3_files(playlist_name)
+
+    if validate and not resume_state:
+        with shared_profiler.phase('validate_songs'):
+            music_library.validate_songs(playlist_name)
+
+    # Only the selected backend is imported: VLC needs requests, mpv does not
+    if player_name == 'mpv':
+        from .mpv_manager import MpvManager
+        player = MpvManager()
+    else:
+        from .vlc_manager import VLCManager
+        player = VLCManager()
+
+    # Videos that failed before (private, deleted, geo-blocked...) are skipped until their retry time
+    failures = FailureCache(base_dir)
+    prefetcher = TrackPrefetcher(player, music_library, playlist_name)
+
+    library_watcher = None
+    if watch_library:
+        # Pick up files added or removed by hand while we run
+        from .library_watcher import LibraryWatcher
+        library_watcher = LibraryWatcher(music_library)
+        library_watcher.start()
+
+    analysis_task = None
+    if analyze:
+        # Duration, bitrate and loudness are computed once per track, away from the hot path
+        from .audio_analysis import AudioAnalyzer
+        analysis_task = asyncio.ensure_future(AudioAnalyzer(music_library, player=player).run(playlist_name))
+        analysis_task.add_done_callback(log_task_failure)
+
+    # Tracks fetched at draft quality because they were needed soon get their best quality later
+    upgrade_task = asyncio.ensure_future(upgrade_drafts(playlist_name, music_library, player, failures))
+    upgrade_task.add_done_callback(log_task_failure)
+
+    clean_exit = False
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            playlist_info = ydl.extract_info(playlist_url, download=False)
-            videos = [entry['url'] for entry in playlist_info['entries']]
-            playlist_name = sanitize_name(playlist_info.get('title', 'Unknown Playlist'))
-    except Exception as e:
-        logging.error(f"Failed to fetch playlist info: {e}")
-        return
-
-    if not videos:
-        logging.error("No videos found in the playlist.")
+        if resume_state:
+            await main_loop(videos, playlist_name, music_library, player, None, True,
+                            checkpoint=checkpoint, playlist_url=playlist_url, resume_state=resume_state, failures=failures,
+                            prefetcher=prefetcher)
+        else:
+            await run_mode(videos, playlist_name, music_library, player, hour_alarm, minute_alarm, test_mode, download_all,
+                           checkpoint=checkpoint, playlist_url=playlist_url, failures=failures, prefetcher=prefetcher)
+        clean_exit = True
+    finally:
+        if clean_exit or stop_requested.is_set() or player.closed:
+            # Stopped on purpose: the next start is a new alarm, not a recovery
+            checkpoint.clear()
+        videos.stop()  # Let the listing thread end early, if it still runs
+        logging.info(stage_timings.report())
+        logging.info(prefetcher.report())
+        logging.info(shared_scheduler.report())
+        shared_scheduler.shutdown()
+        shared_pool.close()
+        upgrade_task.cancel()
+        if analysis_task:
+            analysis_task.cancel()
+        if library_watcher:
+            library_watcher.stop()
+
+async def run_mode(videos, playlist_name, music_library, player, hour_alarm, minute_alarm, test_mode, download_all,
+                   checkpoint=None, playlist_url=None, failures=None, prefetcher=None):
+    if download_all and not test_mode:
+        # Download the entire playlist without buffering
+        with shared_profiler.phase('download_all'):
+            await download_entire_playlist(videos, playlist_name, music_library, failures)
         return
 
-    if shuffle:
-        random.shuffle(videos)
-
-    # Initialize library with the user-selected (or default) base folder
-    music_library = MusicLibrary(base_dir, validate=validate)
-    music_library.initialize_playlist(playlist_name)
-    music_library.check_metadata(playlist_name)
-    music_library.clean_up_non_mp3_files(playlist_name)
-
-    if validate:
-        music_library.validate_songs(playlist_name)
-
-    vlc_manager = VLCManager()
-
+    background_download = None
     if download_all:
-        # Download the entire playlist without buffering
-        await download_entire_playlist(videos, playlist_name, music_library)
-        # If testing, we might still want to play after downloading all?
-        # For now, following logic: download-all just downloads.
-        # If you want to play after, user can run without --download-all next time.
-        if test_mode:
-             # Logic if user wants to play immediately after download-all in test mode
-             # Reuse main_loop logic or just exit?
-             # Let's assume 'download-all' implies preparation mode, but if 'test' is on, we play.
-             logging.info("Download complete. Starting playback due to --test flag.")
-             await main_loop(videos, playlist_name, music_library, vlc_manager, None, test_mode)
-    else:
+        # With --test, play right away: the rest of the playlist downloads at background priority
+        # and yields to the tracks the player is about to need
+        logging.info("Starting playback while the entire playlist downloads, due to --test flag.")
+        background_download = asyncio.ensure_future(download_entire_playlist(videos, playlist_name, music_library, failures))
+
+    try:
         # Calculate Wake Up Time
         wake_up_time = None
         if not test_mode:
@@ -308,56 +418,22 @@ async def main(playlist_url, hour_alarm, minute_alarm, base_dir, test_mode, vali
         # We need to peek at the first few videos without removing them from the main rotation permanently
         # OR just rely on main_loop to fill the rest.
         # Let's just pre-download the first few if missing.
-        for i in range(min(MIN_SONGS_TO_START, len(videos))):
-             # We reuse the download logic but don't pop yet to keep index sync simple
-             await download_audio(videos[i], playlist_name, music_library)
+        # The first songs are needed when the alarm rings
+        seconds_to_alarm = (wake_up_time - datetime.datetime.now()).total_seconds() if wake_up_time else 0
+        deadline = time.monotonic() + max(seconds_to_alarm, 0)
+        # Shuffled or not, these are among the first listed: no need to wait for the rest of the playlist
+        with shared_profiler.phase('initial_downloads'):
+            for i in range(min(MIN_SONGS_TO_START, await videos.wait_for(MIN_SONGS_TO_START))):
+                 # We reuse the download logic but don't pop yet to keep index sync simple
+                 if not is_known_failure(videos[i], failures):
+                     await download_audio(videos[i], playlist_name, music_library, failures, deadline=deadline)
 
         logging.info(f"Finished checking initial data buffer.")
-        await main_loop(videos, playlist_name, music_library, vlc_manager, wake_up_time, test_mode)
-
-def entry_point():
-    """
-    The main entry point for the 'youtube-alarm' command line script.
-    """
-    parser = argparse.ArgumentParser(
-                    prog='YoutubeAlarm',
-                    description='Launches youtube with an alarm.')
-
-    # 1. Hour and Minute are now OPTIONAL in the parser
-    parser.add_argument('--hour', type=int, required=False, help='Alarm hour (0-23)')
-    parser.add_argument('--minute', type=int, required=False, help='Alarm minute (0-59)')
-
-    parser.add_argument('--playlist', type=str, required=True, help='YouTube playlist URL')
-
-    # 2. New argument for base directory
-    # Default is ~/Music/YoutubeAlarm
-    default_music_dir = os.path.join(Path.home(), "Music", "YoutubeAlarm")
-    parser.add_argument('--base-dir', type=str, default=default_music_dir,
-                        help=f'Directory to save music (default: {default_music_dir})')
-
-    parser.add_argument('--test', action='store_true', help='Test mode (starts immediately)')
-    parser.add_argument('--validate', action='store_true', help='Validate MP3 files')
-    parser.add_argument('--shuffle', action='store_true', help='Shuffle the playlist')
-    parser.add_argument('--download-all', action='store_true', help='Download entire playlist immediately')
-
-    args = parser.parse_args()
-
-    # 3. Manual validation logic
-    # If we are NOT testing AND NOT downloading all, we MUST have time set.
-    if not (args.test or args.download_all):
-        if args.hour is None or args.minute is None:
-            parser.error("the following arguments are required: --hour, --minute (unless using --test or --download-all)")
-
-    asyncio.run(main(
-        playlist_url=args.playlist,
-        hour_alarm=args.hour,
-        minute_alarm=args.minute,
-        base_dir=args.base_dir,
-        test_mode=args.test,
-        validate=args.validate,
-        shuffle=args.shuffle,
-        download_all=args.download_all
-    ))
+        await main_loop(videos, playlist_name, music_library, player, wake_up_time, test_mode,
+                        checkpoint=checkpoint, playlist_url=playlist_url, failures=failures, prefetcher=prefetcher)
+    finally:
+        if background_download:
+            background_download.cancel()
 
 if __name__ == "__main__":
     entry_point()
@@ -0,0 +1,252 @@
+import os
+import json
+import time
+import signal
+import asyncio
+import logging
+import tempfile
+import subprocess
+
+import psutil
+
+from .player_backend import PlayerBackend, PlayerStartError
+from .vlc_manager import AttachedProcess
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(module)s - %(funcName)s - line %(lineno)d - %(message)s'
+)
+
+COMMAND_TIMEOUT = 5  # seconds to wait for mpv to answer a command
+POSITION_REFRESH = 5  # seconds between time-pos queries; track changes are pushed, positions are not
+PLAYLIST_POS_OBSERVER = 1
+
+
+class MpvManager(PlayerBackend):
+    """
+    Player backend driving mpv over its JSON IPC Unix socket.
+
+    Commands are single JSON lines answered on the same socket, without HTTP or authentication.
+    Track changes are not polled: mpv pushes a property-change event for 'playlist-pos' and an
+    'end-file' event, which a reader task applies to `current_index` as they arrive.
+
+    An mpv left on our socket by an earlier run is reused with an empty queue, or told to quit if
+    it cannot be supervised, so a new one never starts next to an unreachable one still playing.
+    """
+
+    poll_interval = 5  # wait_for_change wakes up on events, so main_loop can sleep long
+
+    def __init__(self, socket_path=None):
+        super().__init__()
+        self.socket_path = socket_path or os.path.join(tempfile.gettempdir(), f"youtube_alarm_mpv_{os.getuid()}.sock")
+        self.mpv_process = None
+        self.reader = None
+        self.writer = None
+        self.reader_task = None
+        self.pending = {}  # request_id -> future
+        self.next_request_id = 0
+        self.changed = asyncio.Event()
+        self.last_position_refresh = 0.0
+        signal.signal(signal.SIGINT, self.cleanup)
+        signal.signal(signal.SIGTERM, self.cleanup)
+
+    @property
+    def pid(self):
+        return self.mpv_process.pid if self.mpv_process else None
+
+    async def start(self):
+        if os.path.exists(self.socket_path):
+            if await self._reuse_running():
+                return
+            os.remove(self.socket_path)
+        play_command = [
+            "mpv",
+            "--idle=yes",  # Stay alive with an empty queue, songs are added afterwards
+            "--no-video",
+            "--no-terminal",
+            "--replaygain=track",  # Apply the gain written by the audio analysis stage
+            f"--input-ipc-server={self.socket_path}",
+        ]
+        self.mpv_process = subprocess.Popen(play_command)
+        for _ in range(50):
+            if os.path.exists(self.socket_path) and await self._connect():
+                logging.info(f"mpv initialized on {self.socket_path}.")
+                return
+            await asyncio.sleep(0.2)
+        if self.mpv_process.poll() is None:
+            self.mpv_process.kill()
+        raise PlayerStartError(f"mpv failed to open its IPC socket {self.socket_path}.")
+
+    async def rejoin(self, pid):
+        # Connecting is asynchronous; the socket is opened by the first command
+        try:
+            process = AttachedProcess(pid)
+            if 'mpv' not in process.process.name() or process.poll() is not None:
+                return False
+        except psutil.Error:
+            return False
+        if not os.path.exists(self.socket_path):
+            return False
+        self.mpv_process = process
+        logging.info(f"Rejoined running mpv (PID {pid}) on {self.socket_path}.")
+        return True
+
+    async def _reuse_running(self):
+        """Take over an mpv answering on our socket. Returns False if there is none or it was stopped."""
+        if not await self._connect():
+            return False  # A stale socket file: nothing listens on it
+        reply = await self.send_command("get_property", "pid")
+        try:
+            self.mpv_process = AttachedProcess(reply["data"])
+        except (TypeError, KeyError, psutil.Error):
+            # Without its PID it cannot be supervised: stop it rather than leave it playing
+            logging.warning(f"Stopping the mpv left on {self.socket_path}, its PID is unknown.")
+            await self.send_command("quit")
+            self._disconnect()
+            return False
+        logging.info(f"Reusing running mpv (PID {self.mpv_process.pid}) on {self.socket_path}.")
+        await self.clear_playlist()
+        return True
+
+    def _disconnect(self):
+        if self.reader_task:
+            self.reader_task.cancel()
+            self.reader_task = None
+        if self.writer:
+            self.writer.close()
+            self.writer = None
+
+    async def _connect(self):
+        try:
+            self.reader, self.writer = await asyncio.open_unix_connection(self.socket_path)
+        except OSError:
+            return False
+        self.reader_task = asyncio.ensure_future(self._read_messages())
+        await self.send_command("observe_property", PLAYLIST_POS_OBSERVER, "playlist-pos")
+        return True
+
+    async def _read_messages(self):
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                logging.warning("mpv closed its IPC connection.")
+                self.writer = None
+                self.changed.set()
+                return
+            try:
+                message = json.loads(line)
+            except ValueError:
+                continue
+            self.handle_message(message)
+
+    def handle_message(self, message):
+        """Apply a reply or an event pushed by mpv."""
+        request_id = message.get("request_id")
+        if "event" not in message:
+            future = self.pending.pop(request_id, None)
+            if future and not future.done():
+                future.set_result(message)
+            return
+        event = message["event"]
+        if event == "property-change" and message.get("name") == "playlist-pos":
+            index = message.get("data")
+            index = -1 if index is None else index
+            if index != self.current_index:
+                self.current_index = index
+                self.position = 0
+                logging.info(f"Updated current index to: {self.current_index}")
+            self.changed.set()
+        elif event in ("end-file", "idle"):
+            self.changed.set()
+
+    async def send_command(self, *command):
+        """Send a command and return mpv's reply, or None if it failed."""
+        if self.writer is None and not (self.is_running() and os.path.exists(self.socket_path) and await self._connect()):
+            logging.error(f"mpv is not connected, cannot send {command[0]}.")
+            return None
+        self.next_request_id += 1
+        request_id = self.next_request_id
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        self.writer.write(json.dumps({"command": list(command), "request_id": request_id}).encode() + b"\n")
+        try:
+            await self.writer.drain()
+            reply = await asyncio.wait_for(future, COMMAND_TIMEOUT)
+        except (OSError, asyncio.TimeoutError) as e:
+            self.pending.pop(request_id, None)
+            logging.error(f"Error sending command to mpv: {command[0]}: {e!r}")
+            return None
+        if reply.get("error") != "success":
+            logging.error(f"mpv rejected {command[0]}: {reply.get('error')}")
+            return None
+        return reply
+
+    def is_running(self):
+        return self.mpv_process is not None and self.mpv_process.poll() is None
+
+    def is_ready(self):
+        return self.is_running() and self.writer is not None
+
+    async def add_to_playlist(self, file_path):
+        if await self.send_command("loadfile", os.path.abspath(file_path), "append") is not None:
+            self.playlist.append(file_path)
+            logging.info(f"Added to mpv playlist: {file_path}")
+        else:
+            logging.error(f"Failed to add to mpv playlist: {file_path}")
+
+    async def start_playback(self):
+        if not self.playlist:
+            logging.warning("No songs in the playlist. Cannot start playback.")
+            return
+        if await self.send_command("set_property", "playlist-pos", 0) is not None:
+            await self.send_command("set_property", "pause", False)
+            logging.info("Started mpv playback.")
+        else:
+            logging.error("Failed to start mpv playback.")
+
+    async def skip_song(self):
+        await self.send_command("playlist-next")
+
+    async def previous_song(self):
+        await self.send_command("playlist-prev")
+
+    async def seek(self, seconds):
+        if await self.send_command("seek", seconds, "absolute") is not None:
+            self.position = seconds
+
+    async def clear_playlist(self):
+        if await self.send_command("stop") is not None:
+            await self.send_command("playlist-clear")
+            self.playlist = []
+            self.current_index = -1
+
+    async def update_current_song_index(self):
+        # current_index is kept up to date by pushed events; only refresh the position now and then
+        now = time.monotonic()
+        if now - self.last_position_refresh >= POSITION_REFRESH:
+            self.last_position_refresh = now
+            reply = await self.send_command("get_property", "time-pos")
+            if reply and isinstance(reply.get("data"), (int, float)):
+                self.position = reply["data"]
+
+    async def wait_for_change(self, timeout):
+        # An event pushed while main_loop was busy is still set: return right away for it
+        try:
+            await asyncio.wait_for(self.changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        # Cleared after waking: the caller reads the new state right after this returns
+        self.changed.clear()
+
+    def cleanup(self, signum=None, frame=None):
+        self.closed = True
+        self._disconnect()
+        if self.mpv_process:
+            if self.mpv_process.poll() is None:
+                self.mpv_process.terminate()
+                try:
+                    self.mpv_process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    self.mpv_process.kill()
+                    logging.warning("mpv forcefully terminated.")
+            logging.info("mpv terminated.")
@@ -1,23 +1,91 @@
 import os
 import re
+import sys
 import logging
+import threading
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 
-from mutagen.id3 import ID3, TIT2, TPE1, TALB, TXXX
+from mutagen import MutagenError
+from mutagen.id3 import ID3, ID3NoHeaderError, TIT2, TPE1, TALB, TXXX
 
 from .utils import extract_id_from_filename, sanitize_name
+from .audio_analysis import AnalysisCache
 
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(module)s - %(funcName)s - line %(lineno)d - %(message)s'
 )
 
+class SongRecord:
+    """
+    Compact library entry.
+
+    Only the file name is stored; the full path is rebuilt from the library's base folder and the
+    (interned) playlist name when asked for. Entries still read like the dicts the library used to
+    hold: song["title"], song["file_path"], song["youtube_id"] and song.get(...) all work.
+    """
+
+    __slots__ = ("base_folder", "playlist_name", "youtube_id", "title", "file_name")
+
+    FIELDS = ("title", "file_path", "youtube_id")
+
+    def __init__(self, base_folder, playlist_name, youtube_id, title, file_name):
+        self.base_folder = base_folder
+        self.playlist_name = playlist_name
+        self.youtube_id = youtube_id
+        self.title = title
+        self.file_name = file_name
+
+    @property
+    def file_path(self):
+        return os.path.join(self.base_folder, self.playlist_name, self.file_name)
+
+    def __getitem__(self, key):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self.FIELDS else default
+
+    def __contains__(self, key):
+        return key in self.FIELDS
+
+    def keys(self):
+        return self.FIELDS
+
+    def to_dict(self):
+        return {key: getattr(self, key) for key in self.FIELDS}
+
+    def items(self):
+        return self.to_dict().items()
+
+    def __eq__(self, other):
+        if isinstance(other, SongRecord):
+            other = other.to_dict()
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    # Equal to the dicts it replaces, which are unhashable, and its fields can change
+    __hash__ = None
+
+    def __repr__(self):
+        return f"SongRecord({self.to_dict()!r})"
+
+
 class MusicLibrary:
     def __init__(self, base_folder, validate=False):
         self.base_folder = base_folder
         self.validate = validate
         self.songs = {}
+        self.drafts = set()  # (playlist, video ID) of songs downloaded at draft quality
+        # Downloads add songs from worker threads: changes happen under the lock, and readers
+        # iterate over snapshots instead of the live dict and set
+        self.lock = threading.RLock()
         self.initialize_library()
+        self.analysis = AnalysisCache(self.base_folder)
 
     def initialize_library(self):
         """Initialize the music library by scanning the base folder and loading existing MP3 files organized by playlists."""
@@ -32,28 +100,80 @@ class MusicLibrary:
         self.scan_folders()
 
     def scan_folders(self):
-        """Scan all playlist folders and load MP3 files into the library."""
-        self.songs.clear()
+        """
+        Scan all playlist folders and load MP3 files into the library.
+
+        The new index is built aside and swapped in under the lock, so readers never see a half-filled
+        library. Reading every file's tags is slow on a large library: the watcher runs this in a thread.
+        """
+        songs, drafts = self.read_folders()
+        with self.lock:
+            self.songs, self.drafts = songs, drafts
+
+    def read_folders(self):
+        """Build a fresh (songs, drafts) index of the base folder, without touching the library."""
+        songs, drafts = {}, set()
         for playlist_name in os.listdir(self.base_folder):
             playlist_folder = os.path.join(self.base_folder, playlist_name)
-            if os.path.isdir(playlist_folder):
-                self.scan_playlist_folder(playlist_name, playlist_folder)
+            if not os.path.isdir(playlist_folder):
+                continue
+            playlist_name = sys.intern(playlist_name)
+            for f in os.listdir(playlist_folder):
+                if not f.endswith(".mp3"):
+                    continue
+                entry = self._read_file(os.path.join(playlist_folder, f))
+                if entry:
+                    video_id, title, draft = entry
+                    songs[(playlist_name, video_id)] = SongRecord(self.base_folder, playlist_name, video_id, title, f)
+                    if draft:
+                        drafts.add((playlist_name, video_id))
+        return songs, drafts
 
     def scan_playlist_folder(self, playlist_name, playlist_folder):
         """Scan a specific playlist folder and load MP3 files into the library."""
         for f in os.listdir(playlist_folder):
             if f.endswith(".mp3"):
-                if self.is_valid_filename_format(f):
-                    video_id = extract_id_from_filename(f)
-                    file_path = os.path.join(playlist_folder, f)
-                    metadata = self.get_metadata_by_path(file_path)
-                    self.songs[(playlist_name, video_id)] = {
-                        "title": metadata["title"] if metadata else f[12:-4],  # Title is everything after YouTubeID_ until .mp3
-                        "file_path": file_path,
-                        "youtube_id": video_id
-                    }
-                else:
-                    logging.warning(f"Invalid filename format: {f}")
+                self.index_file(playlist_name, os.path.join(playlist_folder, f))
+
+    def index_file(self, playlist_name, file_path):
+        """Load a single MP3 file into the library. Returns True if the file was indexed."""
+        entry = self._read_file(file_path)
+        if entry is None:
+            return False
+        video_id, title, draft = entry
+        self._store(playlist_name, video_id, title, os.path.basename(file_path))
+        self._mark_draft(playlist_name, video_id, draft)
+        return True
+
+    def _read_file(self, file_path):
+        """Return (video ID, title, draft) from a MP3 file's name and tags, or None if it is badly named."""
+        f = os.path.basename(file_path)
+        if not self.is_valid_filename_format(f):
+            logging.warning(f"Invalid filename format: {f}")
+            return None
+        video_id = extract_id_from_filename(f)
+        metadata = self.get_metadata_by_path(file_path)
+        title = metadata["title"] if metadata else f[12:-4]  # Title is everything after YouTubeID_ until .mp3
+        return video_id, title, bool(metadata) and metadata.get("quality") == "draft"
+
+    def discard_file(self, playlist_name, file_path):
+        """Forget a file that disappeared from disk, without touching the filesystem."""
+        f = os.path.basename(file_path)
+        key = (playlist_name, extract_id_from_filename(f))
+        with self.lock:
+            song = self.songs.get(key)
+            if song and os.path.basename(song["file_path"]) == f:
+                del self.songs[key]
+                self.drafts.discard(key)
+                return True
+        return False
+
+    def discard_playlist(self, playlist_name):
+        """Forget every song of a playlist whose folder disappeared from disk."""
+        with self.lock:
+            for key in [key for key in self.songs if key[0] == playlist_name]:
+                del self.songs[key]
+                self.drafts.discard(key)
 
     def clean_up_non_mp3_files(self, playlist_name):
         """Remove any non-MP3 files from a specific playlist folder."""
@@ -64,8 +184,8 @@ class MusicLibrary:
                 logging.info(f"Removing non-MP3 file: {file_path}")
                 os.remove(file_path)
 
-    def add_song(self, playlist_name, video_id, title, file_path):
-        """Add a new song to the library within a specific playlist."""
+    def add_song(self, playlist_name, video_id, title, file_path, draft=False):
+        """Add a new song to the library within a specific playlist. `draft` marks a low-quality download."""
         playlist_folder = os.path.join(self.base_folder, playlist_name)
         if not os.path.exists(playlist_folder):
             os.makedirs(playlist_folder)
@@ -76,14 +196,43 @@ class MusicLibrary:
         if file_path != final_path:
             os.rename(file_path, final_path)
 
-        self.songs[(playlist_name, video_id)] = {"title": title, "file_path": final_path, "youtube_id": video_id}
+        with self.lock:
+            self._store(playlist_name, video_id, title, sanitized_title)
+            self._mark_draft(playlist_name, video_id, draft)
+
+    def _mark_draft(self, playlist_name, video_id, draft):
+        with self.lock:
+            if draft:
+                self.drafts.add((sys.intern(playlist_name), video_id))
+            else:
+                self.drafts.discard((playlist_name, video_id))
+
+    def get_draft_ids(self, playlist_name):
+        """Return the video IDs of a playlist's songs that were downloaded at draft quality."""
+        with self.lock:
+            drafts = list(self.drafts)
+        return [video_id for playlist, video_id in drafts if playlist == playlist_name]
+
+    def _store(self, playlist_name, video_id, title, file_name):
+        """Insert a compact record; playlist names are interned so all entries share one string."""
+        playlist_name = sys.intern(playlist_name)
+        record = SongRecord(self.base_folder, playlist_name, video_id, title, file_name)
+        with self.lock:
+            self.songs[(playlist_name, video_id)] = record
+
+    def snapshot(self):
+        """Return the library's ((playlist, video ID), song) pairs as a list, safe to iterate while downloads run."""
+        with self.lock:
+            return list(self.songs.items())
 
     def remove_song(self, playlist_name, video_id):
         """Remove a song from the library by its playlist and video ID."""
         key = (playlist_name, video_id)
-        if key in self.songs:
-            os.remove(self.songs[key]['file_path'])
-            del self.songs[key]
+        with self.lock:
+            song = self.songs.pop(key, None)
+            self.drafts.discard(key)
+        if song:
+            os.remove(song['file_path'])
             logging.info(f"Removed song with ID {video_id} from playlist {playlist_name}.")
 
     def song_exists(self, playlist_name, video_id=None, title=None, file_name=None):
@@ -91,30 +240,31 @@ class MusicLibrary:
         if video_id:
             return (playlist_name, video_id) in self.songs
         elif title:
-            return any(song["title"] == title for (pl, _), song in self.songs.items() if pl == playlist_name)
+            return any(song["title"] == title for (pl, _), song in self.snapshot() if pl == playlist_name)
         elif file_name:
-            return any(os.path.basename(song["file_path"]) == file_name for (pl, _), song in self.songs.items() if pl == playlist_name)
+            return any(os.path.basename(song["file_path"]) == file_name for (pl, _), song in self.snapshot() if pl == playlist_name)
         return False
 
     def validate_songs(self, playlist_name=None):
         """Validate all MP3 files in the library and remove corrupted ones."""
-        valid_songs = {}
+        invalid = []
         if playlist_name:
-            for key, song in self.songs.items():
+            for key, song in self.snapshot():
                 if key[0] == playlist_name and self.is_valid_mp3(song["file_path"]):
-                    valid_songs[key] = song
-                else:
-                    logging.info(f"Removing corrupted or incomplete file: {song['file_path']}")
-                    os.remove(song["file_path"])
+                    continue
+                invalid.append((key, song))
         else:
-            for key, song in self.songs.items():
-                if self.is_valid_mp3(song["file_path"]):
-                    valid_songs[key] = song
-                else:
-                    logging.info(f"Removing corrupted or incomplete file: {song['file_path']}")
-                    os.remove(song["file_path"])
-
-        self.songs = valid_songs
+            for key, song in self.snapshot():
+                if not self.is_valid_mp3(song["file_path"]):
+                    invalid.append((key, song))
+
+        for key, song in invalid:
+            logging.info(f"Removing corrupted or incomplete file: {song['file_path']}")
+            os.remove(song["file_path"])
+            with self.lock:
+                if self.songs.get(key) is song:  # Unless a download replaced it meanwhile
+                    del self.songs[key]
+                self.drafts.discard(key)
 
     def is_valid_mp3(self, file_path):
         """Check if an MP3 file is valid by running ffmpeg."""
@@ -133,11 +283,11 @@ class MusicLibrary:
             else:
                 logging.error(f"Song with ID {video_id} not found in playlist {playlist_name}.")
         elif playlist_name:
-            for key, song in self.songs.items():
+            for key, song in self.snapshot():
                 if key[0] == playlist_name:
                     self._print_metadata(song["file_path"])
         else:
-            for song in self.songs.values():
+            for _, song in self.snapshot():
                 self._print_metadata(song["file_path"])
 
     def _print_metadata(self, file_path):
@@ -158,12 +308,54 @@ class MusicLibrary:
                 "artist": audio.get('TPE1').text[0] if audio.get('TPE1') else None,
                 "album": audio.get('TALB').text[0] if audio.get('TALB') else None,
                 "youtube_id": audio.get('TXXX:YouTubeID').text[0] if audio.get('TXXX:YouTubeID') else None,
+                "quality": audio.get('TXXX:AlarmQuality').text[0] if audio.get('TXXX:AlarmQuality') else None,
                 "file_path": file_path
             }
         except Exception as e:
             logging.error(f"Error retrieving metadata from {file_path}: {e}")
             return None
 
+    def retag_missing(self, playlist_name=None, max_workers=4):
+        """
+        Add the YouTube ID and playlist frames to library files that lack them.
+
+        Files are tagged in parallel; only files missing TXXX:YouTubeID or TXXX:PlaylistName are rewritten.
+
+        Args:
+            playlist_name (str, optional): If provided, only retag songs of this playlist.
+            max_workers (int): Number of files tagged concurrently.
+
+        Returns:
+            int: The number of files that were rewritten.
+        """
+        songs = [(key[0], key[1], song["file_path"]) for key, song in self.snapshot()
+                 if playlist_name is None or key[0] == playlist_name]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            retagged = sum(executor.map(lambda song: self._retag_file(*song), songs))
+        logging.info(f"Retagged {retagged} of {len(songs)} files.")
+        return retagged
+
+    def _retag_file(self, playlist_name, video_id, file_path):
+        """Helper function to add missing identification frames to a single file."""
+        try:
+            try:
+                audio = ID3(file_path)
+            except ID3NoHeaderError:
+                audio = ID3()
+            if audio.get('TXXX:YouTubeID') and audio.get('TXXX:PlaylistName'):
+                return False
+            if not audio.get('TIT2'):
+                audio.add(TIT2(encoding=3, text=self.songs[(playlist_name, video_id)]["title"]))
+            if not audio.get('TALB'):
+                audio.add(TALB(encoding=3, text=playlist_name))
+            audio.add(TXXX(encoding=3, desc='YouTubeID', text=video_id))
+            audio.add(TXXX(encoding=3, desc='PlaylistName', text=playlist_name))
+            audio.save(file_path)
+            return True
+        except (MutagenError, OSError) as e:
+            logging.error(f"Could not retag {file_path}: {e}")
+            return False
+
     def is_valid_filename_format(self, filename):
         """Check if the filename matches the expected format: 'YouTubeID_Title.mp3'."""
         pattern = r'^[a-zA-Z0-9_-]{11}_.+\.mp3$'
@@ -176,14 +368,15 @@ class MusicLibrary:
     def count_songs(self, playlist_name=None):
         """Return the number of songs in the entire library or within a specific playlist."""
         if playlist_name:
-            return sum(1 for key in self.songs if key[0] == playlist_name)
+            return sum(1 for key, _ in self.snapshot() if key[0] == playlist_name)
         return len(self.songs)
 
     def update_library(self):
         """Rescan the folder, clean up non-MP3 files, validate songs, and refresh the library."""
         logging.info("Updating music library...")
         for playlist_name in os.listdir(self.base_folder):
-            self.clean_up_non_mp3_files(playlist_name)
+            if os.path.isdir(os.path.join(self.base_folder, playlist_name)):
+                self.clean_up_non_mp3_files(playlist_name)
         self.scan_folders()
         if self.validate:
             self.validate_songs()
@@ -191,14 +384,40 @@ class MusicLibrary:
     def get_song_paths(self, playlist_name=None):
         """Return a list of all song file paths in the library or within a specific playlist."""
         if playlist_name:
-            return [song["file_path"] for key, song in self.songs.items() if key[0] == playlist_name]
-        return [song["file_path"] for song in self.songs.values()]
+            return [song["file_path"] for key, song in self.snapshot() if key[0] == playlist_name]
+        return [song["file_path"] for _, song in self.snapshot()]
+
+    def get_analysis(self, playlist_name, video_id):
+        """
+        Get the cached audio analysis of a song.
+
+        Args:
+            playlist_name (str): The playlist the song belongs to.
+            video_id (str): The YouTube ID of the song.
+
+        Returns:
+            dict: duration (s), bitrate (bps), track_gain (dB) and track_peak, or None if the
+            song has not been analyzed since it last changed on disk.
+        """
+        song = self.songs.get((playlist_name, video_id))
+        if song is None:
+            return None
+        try:
+            stat = os.stat(song["file_path"])
+        except FileNotFoundError:
+            return None
+        return self.analysis.get(playlist_name, song.file_name, stat)
+
+    def get_duration(self, playlist_name, video_id, default=None):
+        """Return the analyzed duration of a song in seconds, or `default` if unknown."""
+        analysis = self.get_analysis(playlist_name, video_id)
+        return analysis["duration"] if analysis else default
 
     def get_song_titles(self, playlist_name=None):
         """Return a list of all song titles in the library or within a specific playlist."""
         if playlist_name:
-            return [song["title"] for key, song in self.songs.items() if key[0] == playlist_name]
-        return [song["title"] for song in self.songs.values()]
+            return [song["title"] for key, song in self.snapshot() if key[0] == playlist_name]
+        return [song["title"] for _, song in self.snapshot()]
 
     def check_youtube_ids(self, youtube_ids, playlist_name=None):
         """
@@ -217,7 +436,7 @@ class MusicLibrary:
             if playlist_name:
                 exists = (playlist_name, video_id) in self.songs
             else:
-                exists = any(pl_id == video_id for pl, pl_id in self.songs.keys())
+                exists = any(pl_id == video_id for (pl, pl_id), _ in self.snapshot())
             results.append(exists)
 
         return results
@@ -242,7 +461,7 @@ class MusicLibrary:
                 paths.append(self.songs[key]['file_path'])
         else:
             # Search across all playlists
-            for (pl_name, pl_id), song in self.songs.items():
+            for (pl_name, pl_id), song in self.snapshot():
                 if pl_id == video_id:
                     paths.append(song['file_path'])
 
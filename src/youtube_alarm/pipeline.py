@@ -0,0 +1,207 @@
+import os
+import time
+import logging
+import tempfile
+from collections import defaultdict
+
+import yt_dlp
+
+from .utils import extract_id_from_url, sanitize_name
+from .postprocessors import PLAYLIST_FIELD, QUALITY_FIELD
+from .ydl_pool import shared_pool
+from .download_scheduler import download_throughput, DEFAULT_TRACK_DURATION
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(module)s - %(funcName)s - line %(lineno)d - %(message)s'
+)
+
+
+class StageTimings:
+    """Wall-clock durations of every pipeline stage run, for measuring where buffering time goes."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    def record(self, stage, seconds):
+        self.samples[stage].append(seconds)
+
+    def summary(self):
+        """Return {stage: {'count', 'total', 'mean', 'max'}} in seconds."""
+        return {
+            stage: {
+                'count': len(samples),
+                'total': sum(samples),
+                'mean': sum(samples) / len(samples),
+                'max': max(samples),
+            }
+            for stage, samples in self.samples.items() if samples
+        }
+
+    def report(self):
+        lines = [f"{stage}: {s['count']} runs, mean {s['mean']:.2f}s, max {s['max']:.2f}s, total {s['total']:.1f}s"
+                 for stage, s in self.summary().items()]
+        return "Pipeline stage timings: " + ("; ".join(lines) if lines else "no runs")
+
+    def clear(self):
+        self.samples.clear()
+
+
+# Timings of every pipeline of the process
+stage_timings = StageTimings()
+
+BEST_AUDIO_KBPS = 160  # assumed bitrate of the best audio stream when formats do not tell
+TRANSCODE_SPEED = 20  # seconds of audio converted to MP3 per second, conservative for small boards
+DEADLINE_SAFETY = 2  # the best quality is used only if it is expected to take under half the time left
+UPGRADE_FOLDER = os.path.join(tempfile.gettempdir(), "youtube_alarm_upgrade")
+
+
+def estimate_fetch_seconds(info_dict, throughput):
+    """Expected time to download the best audio stream of a resolved video and convert it."""
+    duration = info_dict.get('duration') or DEFAULT_TRACK_DURATION
+    sizes = [f.get('filesize') or f.get('filesize_approx') or (f.get('abr') or 0) * 125 * duration
+             for f in info_dict.get('formats') or () if f.get('vcodec') == 'none']
+    size = max(sizes, default=0) or BEST_AUDIO_KBPS * 125 * duration
+    return size / throughput + duration / TRANSCODE_SPEED
+
+
+def choose_quality(info_dict, deadline, throughput=download_throughput, clock=time.monotonic):
+    """
+    Pick 'best', or 'draft' when the best stream is unlikely to be ready before `deadline`.
+
+    Args:
+        deadline (float, optional): Monotonic time at which the track is needed, None if not urgent.
+        throughput (ThroughputMeter): Measured download throughput.
+    """
+    if deadline is None:
+        return 'best'
+    expected = estimate_fetch_seconds(info_dict, throughput.bytes_per_second)
+    time_left = deadline - clock()
+    if expected * DEADLINE_SAFETY <= time_left:
+        return 'best'
+    logging.info(f"{info_dict.get('id')} is needed in {time_left:.0f}s and the best stream takes ~{expected:.0f}s: "
+                 f"downloading a draft.")
+    return 'draft'
+
+
+def resolve_video(video_url, failures=None, pool=shared_pool, timings=stage_timings):
+    """
+    Resolve stage: run the extractor once for a video.
+
+    The result is the extractor's raw info dict (formats included, nothing selected or
+    downloaded yet), which the fetch stage can download without extracting again.
+
+    Returns:
+        dict: The unprocessed info dict, or None if extraction failed.
+    """
+    start = time.perf_counter()
+    try:
+        with pool.acquire('info') as ydl:
+            info_dict = ydl.extract_info(video_url, download=False, process=False)
+        logging.info(f"Extracted info for {video_url}: {info_dict.get('title')}")
+        if failures:
+            failures.record_success(info_dict.get('id'))
+        return info_dict
+    except yt_dlp.utils.DownloadError as e:
+        logging.error(f"Error extracting info for {video_url}: {e}")
+        if failures:
+            failures.record_failure(extract_id_from_url(video_url), e)
+        return None
+    finally:
+        timings.record('resolve', time.perf_counter() - start)
+
+
+class TrackPipeline:
+    """
+    Two-stage buffering pipeline for one playlist: resolve (extract info) then fetch (download).
+
+    Each video is extracted exactly once. The fetch stage hands the resolved info dict to
+    YoutubeDL.process_ie_result, which selects the format and downloads it directly.
+    """
+
+    def __init__(self, playlist_name, music_library, failures=None, pool=shared_pool, timings=stage_timings,
+                 throughput=download_throughput):
+        self.playlist_name = playlist_name
+        self.music_library = music_library
+        self.failures = failures
+        self.pool = pool
+        self.timings = timings
+        self.throughput = throughput
+
+    def resolve(self, video_url):
+        return resolve_video(video_url, self.failures, self.pool, self.timings)
+
+    def fetch(self, info_dict, deadline=None, upgrade=False):
+        """
+        Fetch stage: download, convert and tag a resolved video, then add it to the library.
+
+        Args:
+            deadline (float, optional): Monotonic time at which the track is needed. When it is too
+                close for the best stream, a draft is downloaded instead and flagged for upgrade.
+            upgrade (bool): Replace a draft already in the library with the best quality.
+
+        Returns:
+            str: The path of the new MP3, or None if it failed or was already in the library.
+        """
+        video_id = info_dict.get('id')
+        previous = self.music_library.get_song_paths_by_id(video_id, self.playlist_name)
+        if previous and not upgrade:
+            return None
+        # Ensure we use the base folder from the library instance
+        playlist_folder = os.path.join(self.music_library.base_folder, self.playlist_name)
+        quality = 'best' if upgrade else choose_quality(info_dict, deadline, self.throughput)
+        profile = {'base_folder': self.music_library.base_folder, 'quality': quality}
+        if upgrade:
+            profile['temp_folder'] = UPGRADE_FOLDER  # The draft is only replaced once the new MP3 is complete
+
+        start = time.perf_counter()
+        try:
+            # The file is written straight to its final 'ID_SanitizedTitle.mp3' name and tagged during
+            # the ffmpeg conversion, so no rename or second tag rewrite is needed afterwards
+            with self.pool.acquire('download', **profile) as ydl:
+                info_dict = ydl.process_ie_result(dict(info_dict), download=True,
+                                                  extra_info={PLAYLIST_FIELD: self.playlist_name, QUALITY_FIELD: quality})
+        except (yt_dlp.utils.DownloadError, yt_dlp.utils.PostProcessingError, FileNotFoundError) as e:
+            logging.error(f"Error processing {video_id}: {e}")
+            if self.failures and isinstance(e, yt_dlp.utils.DownloadError):
+                self.failures.record_failure(video_id, e)
+            return None
+        finally:
+            self.timings.record('fetch', time.perf_counter() - start)
+
+        title = info_dict.get('title')
+        artist = info_dict.get('uploader')
+        album = self.playlist_name
+        clean_title = info_dict.get('clean_title') or sanitize_name(title)
+        final_path = os.path.join(playlist_folder, f"{video_id}_{clean_title}.mp3")
+
+        if not os.path.exists(final_path):
+            logging.error(f"Expected file not found: {final_path}")
+            return None
+
+        if upgrade and previous and previous[0] != final_path:
+            os.remove(previous[0])  # The title changed since the draft was downloaded
+        self.music_library.add_song(
+            playlist_name=self.playlist_name,
+            video_id=video_id,
+            title=clean_title,
+            file_path=final_path,
+            draft=quality == 'draft'
+        )
+
+        logging.info(f"Downloaded and processed: {clean_title}")
+        logging.info(f"Saved as: {final_path} with metadata - Title: {title}, Artist: {artist}, Album: {album}, YouTubeID: {video_id}")
+        return final_path
+
+    def process(self, video_url, deadline=None):
+        """Run both stages for one video. Returns the new MP3 path or None."""
+        video_id = extract_id_from_url(video_url)
+        if video_id and self.music_library.song_exists(self.playlist_name, video_id):
+            return None  # Already downloaded: no need to even resolve it
+        info_dict = self.resolve(video_url)
+        return self.fetch(info_dict, deadline) if info_dict else None
+
+    def upgrade(self, video_id):
+        """Download the best quality of a song the library holds as a draft. Returns the new path or None."""
+        info_dict = self.resolve(f"https://www.youtube.com/watch?v={video_id}")
+        return self.fetch(info_dict, upgrade=True) if info_dict else None
@@ -0,0 +1,134 @@
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(module)s - %(funcName)s - line %(lineno)d - %(message)s'
+)
+
+
+class PlayerStartError(RuntimeError):
+    """The player process could not be started or never became ready."""
+
+
+class PlayerBackend(ABC):
+    """
+    Interface the alarm uses to drive a media player.
+
+    A backend owns the player process and mirrors its queue: `playlist` holds the enqueued file
+    paths in order, `current_index` the position of the song being played (-1 if unknown) and
+    `position` the seconds played into it, as of the last update. `main_loop`,
+    `maintain_buffer` and the checkpoint only go through this interface.
+    """
+
+    # How long main_loop may wait between two updates. Backends that get pushed events can wait
+    # longer, since wait_for_change returns as soon as something happens.
+    poll_interval = 0.25
+    max_restarts = 5  # supervise gives up after this many crashes
+
+    def __init__(self):
+        self.playlist = []  # To track the playlist order
+        self.current_index = -1  # To track the current song index
+        self.position = 0  # Seconds into the current song, as of the last update
+        self.closed = False  # Set by cleanup: the player was stopped on purpose
+        self.restarts = 0
+
+    @property
+    @abstractmethod
+    def pid(self):
+        """PID of the player process, or None if it is not running."""
+
+    @abstractmethod
+    async def start(self):
+        """Start the player process and wait until it accepts commands. Raises PlayerStartError on failure."""
+
+    @abstractmethod
+    async def rejoin(self, pid):
+        """Take over a player left running by a previous run. Returns True on success."""
+
+    @abstractmethod
+    def is_running(self):
+        """True while the player process is alive."""
+
+    @abstractmethod
+    def is_ready(self):
+        """True if the player currently answers commands."""
+
+    @abstractmethod
+    async def add_to_playlist(self, file_path):
+        """Append a file to the end of the queue."""
+
+    @abstractmethod
+    async def start_playback(self):
+        """Start playing the queue from its first song."""
+
+    @abstractmethod
+    async def skip_song(self):
+        """Jump to the next song."""
+
+    @abstractmethod
+    async def previous_song(self):
+        """Jump back to the previous song."""
+
+    @abstractmethod
+    async def seek(self, seconds):
+        """Seek to an absolute position in the current song."""
+
+    @abstractmethod
+    async def clear_playlist(self):
+        """Remove every song from the queue."""
+
+    @abstractmethod
+    async def update_current_song_index(self):
+        """Bring current_index and position up to date with the player."""
+
+    @abstractmethod
+    def cleanup(self, signum=None, frame=None):
+        """Stop the player process."""
+
+    def has_crashed(self):
+        """True if the player process exited on its own. Backends may exclude normal exits."""
+        return self.pid is not None and not self.is_running()
+
+    async def supervise(self):
+        """
+        Restart the player if it crashed, requeueing from the interrupted song and seeking back to it.
+
+        Returns:
+            bool: True if the player was restarted.
+        """
+        if self.closed or not self.playlist or not self.has_crashed() or self.restarts >= self.max_restarts:
+            return False
+        self.restarts += 1
+        queue = self.playlist[max(self.current_index, 0):]
+        position = self.position
+        logging.warning(f"{type(self).__name__} exited unexpectedly, restarting it with {len(queue)} queued songs "
+                        f"(restart {self.restarts}/{self.max_restarts}).")
+        try:
+            await self.start()
+        except PlayerStartError as e:
+            # The queue is kept, so the next call tries again until max_restarts
+            logging.error(f"Could not restart {type(self).__name__}: {e}")
+            return False
+        self.playlist = []
+        self.current_index = -1
+        for path in queue:
+            await self.add_to_playlist(path)
+        await self.start_playback()
+        if position:
+            await self.seek(position)
+        return True
+
+    async def get_current_song(self):
+        """Return (file path, index) of the song being played, or (None, index) if unknown."""
+        if 0 <= self.current_index < len(self.playlist):
+            return self.playlist[self.current_index], self.current_index
+        return None, self.current_index
+
+    async def wait_for_change(self, timeout):
+        """Wait until the player reports a change or `timeout` seconds pass. Polling backends just sleep."""
+        await asyncio.sleep(timeout)
+
+    def get_playlist_length(self):
+        return len(self.playlist)
@@ -0,0 +1,164 @@
+import random
+import asyncio
+import logging
+import threading
+from collections import deque
+
+from .utils import sanitize_name
+from .ydl_pool import shared_pool
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(module)s - %(funcName)s - line %(lineno)d - %(message)s'
+)
+
+SHUFFLE_WINDOW = 100  # --shuffle picks each next video at random among the next this many listed
+MAX_REDIRECTS = 5  # url results followed before giving up on finding the playlist itself
+
+
+class PlaylistQueue:
+    """
+    Videos still to play, in a deque that the playlist listing keeps filling while they are consumed.
+
+    `popleft` is O(1) (O(window) when shuffling) instead of the O(n) of list.pop(0). With a
+    shuffle window, each pop takes a random video among the first `shuffle_window` queued ones:
+    a windowed shuffle that can start before the whole playlist is known. Every listed URL is
+    also kept in listing order for `follow`, which walks the playlist without consuming it.
+
+    `listed_count` is how far into the playlist the listing got, so that a listing interrupted
+    by a restart can skip that many entries when it starts over.
+    """
+
+    def __init__(self, urls=(), shuffle_window=0, rng=random, done=True, listed_count=None):
+        self.queue = deque(urls)
+        self.listed = list(self.queue)
+        self.listed_count = len(self.listed) if listed_count is None else listed_count
+        self.shuffle_window = shuffle_window
+        self.rng = rng
+        self.done = done  # False while the listing is still running
+        self.changed = asyncio.Event()
+        self.stopped = threading.Event()  # Asks the listing thread to stop early
+
+    def __len__(self):
+        return len(self.queue)
+
+    def __bool__(self):
+        return bool(self.queue)
+
+    def __iter__(self):
+        return iter(list(self.queue))
+
+    def __getitem__(self, index):
+        return self.queue[index]
+
+    def put(self, url):
+        self.queue.append(url)
+        self.listed.append(url)
+        self.listed_count += 1
+        self.changed.set()
+
+    def finish(self):
+        self.done = True
+        self.changed.set()
+
+    def stop(self):
+        self.stopped.set()
+
+    def popleft(self):
+        if self.shuffle_window > 1 and len(self.queue) > 1:
+            index = self.rng.randrange(min(self.shuffle_window, len(self.queue)))
+            self.queue.rotate(-index)
+            url = self.queue.popleft()
+            self.queue.rotate(index)
+            return url
+        return self.queue.popleft()
+
+    async def _wait_for_change(self):
+        self.changed.clear()
+        await self.changed.wait()
+
+    async def wait_for(self, count):
+        """Wait until `count` videos are queued or the listing is over. Returns the number queued."""
+        while len(self.queue) < count and not self.done:
+            await self._wait_for_change()
+        return len(self.queue)
+
+    async def follow(self):
+        """Yield every listed URL in listing order, waiting for new pages until the listing ends."""
+        position = 0
+        while True:
+            if position < len(self.listed):
+                position += 1
+                yield self.listed[position - 1]
+            elif self.done:
+                return
+            else:
+                await self._wait_for_change()
+
+
+def list_playlist(playlist_url, videos, on_info, loop, pool=shared_pool, skip=0):
+    """
+    Worker thread: page through a playlist and feed its video URLs to `videos` on `loop`.
+
+    The first `skip` videos are passed over, for a listing resumed where a previous run stopped.
+
+    process=False hands back the extractor's own entries, which for YouTube playlists is a
+    generator fetching one page (~100 videos) at a time as it is iterated. It also leaves url
+    results unresolved (watch?list=... links, YouTube Music albums, regional redirects), so
+    those are extracted again until the playlist itself comes back.
+    """
+    try:
+        with pool.acquire('flat') as ydl:
+            playlist_info = ydl.extract_info(playlist_url, download=False, process=False)
+            for _ in range(MAX_REDIRECTS):
+                if playlist_info.get('_type') not in ('url', 'url_transparent'):
+                    break
+                redirect = playlist_info
+                playlist_info = ydl.extract_info(redirect['url'], download=False, process=False,
+                                                 ie_key=redirect.get('ie_key'))
+                if redirect['_type'] == 'url_transparent' and redirect.get('title'):
+                    # A transparent redirect's own fields take precedence over the target's
+                    playlist_info = dict(playlist_info, title=redirect['title'])
+            loop.call_soon_threadsafe(on_info, playlist_info)
+            count = 0
+            for entry in playlist_info.get('entries') or ():
+                if videos.stopped.is_set():
+                    break
+                if entry and entry.get('url'):
+                    count += 1
+                    if count > skip:
+                        loop.call_soon_threadsafe(videos.put, entry['url'])
+            logging.info(f"Listed {count} videos of the playlist.")
+    finally:
+        loop.call_soon_threadsafe(videos.finish)
+
+
+async def stream_playlist(playlist_url, videos, pool=shared_pool, skip=0):
+    """
+    Start listing a playlist into `videos` and return its sanitized title as soon as it is known.
+
+    The listing continues in the background; the returned task completes once it is over.
+
+    Returns:
+        tuple: (playlist name, listing task)
+    """
+    loop = asyncio.get_running_loop()
+    title = loop.create_future()
+
+    def on_info(playlist_info):
+        if not title.done():
+            title.set_result(sanitize_name(playlist_info.get('title', 'Unknown Playlist')))
+
+    listing = loop.run_in_executor(None, list_playlist, playlist_url, videos, on_info, loop, pool, skip)
+
+    def report_failure(future):
+        if title.done() and not future.cancelled() and future.exception():
+            logging.error(f"Playlist listing stopped early: {future.exception()}")
+    listing.add_done_callback(report_failure)
+    # Whichever comes first: the title, or the listing failing before it got one
+    await asyncio.wait([title, listing], return_when=asyncio.FIRST_COMPLETED)
+    if not title.done():
+        title.cancel()
+        listing.result()  # Raises the listing error
+        raise ValueError(f"No playlist information for {playlist_url}")
+    return title.result(), listing
@@ -0,0 +1,71 @@
+import logging
+
+from yt_dlp.postprocessor import PostProcessor
+from yt_dlp.postprocessor.ffmpeg import FFmpegExtractAudioPP
+
+from .utils import sanitize_name
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(module)s - %(funcName)s - line %(lineno)d - %(message)s'
+)
+
+# Key under which download_audio passes the playlist name through yt_dlp's info dict
+PLAYLIST_FIELD = 'alarm_playlist'
+# Key under which the pipeline passes the download quality ('best' or 'draft')
+QUALITY_FIELD = 'alarm_quality'
+
+
+class SanitizeTitlePP(PostProcessor):
+    """
+    Adds a 'clean_title' field to the info dict before the file name is chosen.
+
+    This lets the output template write the final 'ID_SanitizedTitle.mp3' name directly,
+    so the library never has to rename the file after the download.
+    """
+
+    def run(self, info):
+        info['clean_title'] = sanitize_name(info.get('title') or info['id'])
+        return [], info
+
+
+class TaggingExtractAudioPP(FFmpegExtractAudioPP):
+    """
+    FFmpegExtractAudio that also writes the ID3 tags in the same ffmpeg pass.
+
+    ffmpeg stores unknown metadata keys as TXXX frames in MP3 files, so 'YouTubeID' and
+    'PlaylistName' end up as TXXX:YouTubeID and TXXX:PlaylistName, exactly as mutagen used to write them.
+    Draft-quality downloads also get TXXX:AlarmQuality=draft, which marks them for a later upgrade.
+    """
+
+    def run(self, information):
+        self._tags = self.build_tags(information)
+        try:
+            return super().run(information)
+        finally:
+            self._tags = None
+
+    @staticmethod
+    def build_tags(information):
+        playlist_name = information.get(PLAYLIST_FIELD)
+        tags = {
+            'title': information.get('title'),  # Keep original title in metadata
+            'artist': information.get('uploader'),
+            'album': playlist_name,  # Set album as playlist name
+            'YouTubeID': information.get('id'),
+            'PlaylistName': playlist_name,
+            'AlarmQuality': 'draft' if information.get(QUALITY_FIELD) == 'draft' else None,
+        }
+        return {key: value for key, value in tags.items() if value}
+
+    def run_ffmpeg(self, path, out_path, codec, more_opts):
+        metadata_opts = []
+        for key, value in (self._tags or {}).items():
+            metadata_opts += ['-metadata', f'{key}={value}']
+        super().run_ffmpeg(path, out_path, codec, [*more_opts, *metadata_opts])
+
+
+def add_download_postprocessors(ydl, preferredcodec='mp3', preferredquality='192'):
+    """Register the title sanitizer and the tagging audio extractor on a YoutubeDL instance."""
+    ydl.add_post_processor(SanitizeTitlePP(ydl), when='pre_process')
+    ydl.add_post_processor(TaggingExtractAudioPP(ydl, preferredcodec=preferredcodec, preferredquality=preferredquality))
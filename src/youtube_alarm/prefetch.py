@@ -0,0 +1,178 @@
+import os
+import time
+import asyncio
+import logging
+
+from .utils import extract_id_from_filename
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(module)s - %(funcName)s - line %(lineno)d - %(message)s'
+)
+
+PREFETCH_LEAD = 30  # seconds before the end of the current track to warm the next ones
+PREFETCH_TRACKS = 2
+MEMORY_BUDGET = 64 * 1024 * 1024  # bytes of page cache the prefetcher may ask for at once
+FIRST_READ_SIZE = 256 * 1024  # bytes of the next track read just before it starts, to time its opening
+PROBE_LEAD = 3  # seconds before the end of the current track to time the start of the next one
+READ_CHUNK = 1024 * 1024
+
+HAS_FADVISE = hasattr(os, 'posix_fadvise')
+
+
+class TrackPrefetcher:
+    """
+    Warms the next tracks of the player's queue into the page cache before they are needed.
+
+    On slow storage (SD cards, USB disks) the first read of a cold MP3 stalls the track change.
+    Once the current track is within `lead_time` seconds of its end (or right away if its
+    duration is unknown), the next `lookahead` tracks are announced to the kernel with
+    posix_fadvise(WILLNEED), which reads them ahead asynchronously. Where fadvise is missing
+    they are read in a worker thread instead. The pages of tracks that were played are released
+    with DONTNEED, and the bytes requested at any time stay within `memory_budget`.
+
+    PROBE_LEAD seconds before the current track ends, i.e. just before the player opens the
+    next one, the first FIRST_READ_SIZE bytes of that next track are read and timed, split by
+    whether it was prefetched or not: the time the player's own first read would take, so the
+    effect on track-change gaps shows in report(). The end of the track is extrapolated from
+    the last reported position, since some backends refresh it only every few seconds.
+    """
+
+    def __init__(self, player, music_library, playlist_name, lookahead=PREFETCH_TRACKS,
+                 lead_time=PREFETCH_LEAD, memory_budget=MEMORY_BUDGET, clock=time.monotonic):
+        self.player = player
+        self.music_library = music_library
+        self.playlist_name = playlist_name
+        self.lookahead = lookahead
+        self.lead_time = lead_time
+        self.memory_budget = memory_budget
+        self.clock = clock
+        self.warmed = {}  # path -> (bytes requested, time requested)
+        self.last_index = None
+        self.last_position = None
+        self.track_end = None  # clock() at which the current track is expected to end
+        self.probed = None  # the next track, once its first read was timed
+        self.first_reads = {'warm': [], 'cold': []}  # seconds to read the start of the next track
+        self.stats = {'prefetched': 0, 'bytes': 0, 'over_budget': 0, 'released': 0}
+
+    def in_use(self):
+        return sum(length for length, _ in self.warmed.values())
+
+    def _remaining(self, index, path):
+        """Seconds left of the current track, extrapolated since the player last reported its position."""
+        position = (index, self.player.position)
+        if position != self.last_position:
+            self.last_position = position
+            video_id = extract_id_from_filename(os.path.basename(path))
+            duration = self.music_library.get_duration(self.playlist_name, video_id)
+            self.track_end = None if duration is None else self.clock() + duration - self.player.position
+        return None if self.track_end is None else self.track_end - self.clock()
+
+    async def update(self):
+        """Prefetch or release tracks according to the player's current index and position."""
+        playlist = self.player.playlist
+        index = self.player.current_index
+        if not 0 <= index < len(playlist):
+            return
+        upcoming = playlist[index + 1:index + 1 + self.lookahead]
+        if index != self.last_index:
+            self.last_index = index
+            self._track_changed(playlist[index], upcoming)
+        remaining = self._remaining(index, playlist[index])
+        if remaining is None or remaining <= self.lead_time:
+            for path in upcoming:
+                if path not in self.warmed:
+                    await self._warm(path)
+        if upcoming and remaining is not None and remaining <= PROBE_LEAD and self.probed != upcoming[0]:
+            await self._probe(upcoming[0])
+
+    async def warm(self, paths):
+        """Prefetch the given tracks now, e.g. the first songs shortly before the alarm."""
+        for path in paths:
+            if path not in self.warmed:
+                await self._warm(path)
+
+    def _track_changed(self, current, upcoming):
+        # Tracks already played no longer need their pages
+        for path in list(self.warmed):
+            if path != current and path not in upcoming:
+                self._release(path)
+
+    async def _probe(self, path):
+        self.probed = path
+        kind = 'warm' if path in self.warmed else 'cold'
+        elapsed = await asyncio.to_thread(self._time_first_read, path)
+        if elapsed is not None:
+            self.first_reads[kind].append(elapsed)
+
+    async def _warm(self, path):
+        length = self._size(path)
+        if length is None:
+            return
+        allowed = self.memory_budget - self.in_use()
+        if allowed <= 0:
+            self.stats['over_budget'] += 1
+            return
+        length = min(length, allowed)
+        if HAS_FADVISE:
+            self._advise(path, length, os.POSIX_FADV_WILLNEED)
+        else:
+            await asyncio.to_thread(self._read, path, length)
+        self.warmed[path] = (length, self.clock())
+        self.stats['prefetched'] += 1
+        self.stats['bytes'] += length
+        logging.info(f"Prefetched {length / 1048576:.1f} MB of {os.path.basename(path)}")
+
+    def _release(self, path):
+        length, _ = self.warmed.pop(path)
+        if HAS_FADVISE:
+            self._advise(path, length, os.POSIX_FADV_DONTNEED)
+        self.stats['released'] += 1
+
+    @staticmethod
+    def _size(path):
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return None
+
+    @staticmethod
+    def _advise(path, length, advice):
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError as e:
+            logging.warning(f"Could not open {path} for prefetching: {e}")
+            return
+        try:
+            os.posix_fadvise(fd, 0, length, advice)
+        except OSError as e:
+            logging.warning(f"posix_fadvise failed on {path}: {e}")
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def _read(path, length):
+        try:
+            with open(path, 'rb') as f:
+                while length > 0 and f.read(min(READ_CHUNK, length)):
+                    length -= READ_CHUNK
+        except OSError as e:
+            logging.warning(f"Could not prefetch {path}: {e}")
+
+    @staticmethod
+    def _time_first_read(path):
+        start = time.perf_counter()
+        try:
+            with open(path, 'rb') as f:
+                f.read(FIRST_READ_SIZE)
+        except OSError:
+            return None
+        return time.perf_counter() - start
+
+    def report(self):
+        def mean_ms(samples):
+            return f"{1000 * sum(samples) / len(samples):.1f} ms" if samples else "n/a"
+        warm, cold = self.first_reads['warm'], self.first_reads['cold']
+        return (f"Prefetch: {self.stats['prefetched']} tracks, {self.stats['bytes'] / 1048576:.1f} MB, "
+                f"{self.stats['over_budget']} skipped over budget; next-track first reads: {len(warm)} warm "
+                f"({mean_ms(warm)}), {len(cold)} cold ({mean_ms(cold)})")
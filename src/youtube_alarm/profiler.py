@@ -0,0 +1,152 @@
+import os
+import io
+import time
+import logging
+import tracemalloc
+from contextlib import contextmanager
+from collections import defaultdict
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(module)s - %(funcName)s - line %(lineno)d - %(message)s'
+)
+
+TIMELINE_REPEATS = 5  # occurrences of a repeated phase listed in the timeline, the rest is only summed
+PROFILE_LINES = 25  # functions listed per cProfile capture
+MEMORY_LINES = 10  # source lines listed per tracemalloc capture
+
+
+class PhaseProfiler:
+    """
+    Timeline of the phases of a run (playlist fetch, library scan, downloads, player start...).
+
+    Every `phase()` records its start (seconds since the profiler was enabled), wall time and
+    CPU time. CPU time is process-wide, so it includes worker threads and whatever other task
+    ran concurrently. Phases named in `cpu_phases` are also run under cProfile, and those in
+    `memory_phases` under tracemalloc: their net and peak allocations are recorded, and the
+    source lines that allocated the most are kept for their first occurrence. A phase that runs
+    repeatedly (a main loop tick) accumulates into a single cProfile capture.
+
+    A disabled profiler records nothing and costs one attribute check per phase.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.cpu_phases = set()
+        self.memory_phases = set()
+        self.origin = None
+        self.entries = []  # (name, start, wall, cpu, (net bytes, peak bytes) or None)
+        self.marks = []  # (name, time)
+        self.totals = defaultdict(lambda: {'count': 0, 'wall': 0.0, 'cpu': 0.0, 'max': 0.0})
+        self.profiles = {}  # phase -> cProfile.Profile
+        self.memory_top = {}  # phase -> top StatisticDiff of its first occurrence
+        self._profiling = None  # phase currently under cProfile: captures cannot nest
+        self._tracing = 0  # memory phases in progress; tracemalloc stops when the last one ends
+
+    def enable(self, cpu_phases=(), memory_phases=()):
+        self.enabled = True
+        self.cpu_phases = set(cpu_phases)
+        self.memory_phases = set(memory_phases)
+        self.origin = time.perf_counter()
+
+    def mark(self, name):
+        """Record an instant on the timeline, e.g. the alarm time or the first track playing."""
+        if self.enabled:
+            self.marks.append((name, time.perf_counter() - self.origin))
+
+    @contextmanager
+    def phase(self, name):
+        if not self.enabled:
+            yield
+            return
+        profile = self._start_profile(name) if name in self.cpu_phases else None
+        snapshot = self._start_tracing(name) if name in self.memory_phases else None
+        traced = tracemalloc.get_traced_memory()[0] if name in self.memory_phases else None
+        start, start_cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - start, time.process_time() - start_cpu
+            if profile:
+                profile.disable()
+                self._profiling = None
+            memory = self._stop_tracing(name, traced, snapshot) if traced is not None else None
+            self._record(name, start - self.origin, wall, cpu, memory)
+
+    def _record(self, name, start, wall, cpu, memory):
+        totals = self.totals[name]
+        totals['count'] += 1
+        totals['wall'] += wall
+        totals['cpu'] += cpu
+        totals['max'] = max(totals['max'], wall)
+        if totals['count'] <= TIMELINE_REPEATS:
+            self.entries.append((name, start, wall, cpu, memory))
+
+    def _start_profile(self, name):
+        if self._profiling:
+            logging.warning(f"Not profiling {name}: it runs inside {self._profiling}, which already is.")
+            return None
+        import cProfile
+        profile = self.profiles.setdefault(name, cProfile.Profile())
+        try:
+            profile.enable()
+        except ValueError as e:  # Another profiler (a debugger, coverage) holds the hooks
+            logging.warning(f"Not profiling {name}: {e}")
+            return None
+        self._profiling = name
+        return profile
+
+    def _start_tracing(self, name):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self._tracing += 1
+        tracemalloc.reset_peak()
+        # Line statistics only for the first occurrence: a snapshot copies every live trace
+        return tracemalloc.take_snapshot() if name not in self.memory_top else None
+
+    def _stop_tracing(self, name, traced, snapshot):
+        current, peak = tracemalloc.get_traced_memory()
+        if snapshot is not None:
+            self.memory_top[name] = tracemalloc.take_snapshot().compare_to(snapshot, 'lineno')[:MEMORY_LINES]
+        self._tracing -= 1
+        if not self._tracing:
+            tracemalloc.stop()
+        return current - traced, peak - traced
+
+    def report(self):
+        """Return the timeline, per-phase totals and captures as text."""
+        lines = ["Timeline (seconds since start):"]
+        events = [(start, f"{start:9.3f}  {name:<24} wall {wall:8.3f}s  cpu {cpu:8.3f}s"
+                          + (f"  memory {memory[0] / 1024:+.0f} KB (peak +{memory[1] / 1024:.0f} KB)" if memory else ""))
+                  for name, start, wall, cpu, memory in self.entries]
+        events += [(at, f"{at:9.3f}  * {name}") for name, at in self.marks]
+        lines += [text for _, text in sorted(events, key=lambda event: event[0])]
+
+        lines += ["", "Totals per phase:"]
+        for name, totals in sorted(self.totals.items(), key=lambda item: -item[1]['wall']):
+            lines.append(f"  {name:<24} {totals['count']:6} runs  wall {totals['wall']:8.3f}s  "
+                         f"cpu {totals['cpu']:8.3f}s  max {totals['max']:8.3f}s")
+
+        import pstats
+        for name, profile in self.profiles.items():
+            stream = io.StringIO()
+            pstats.Stats(profile, stream=stream).sort_stats('cumulative').print_stats(PROFILE_LINES)
+            lines += ["", f"cProfile of {name}:", stream.getvalue().strip()]
+        for name, top in self.memory_top.items():
+            lines += ["", f"Largest allocations during {name}:"]
+            lines += [f"  {stat}" for stat in top]
+        return "\n".join(lines) + "\n"
+
+    def write_report(self, path):
+        """Write report() to `path`, and each cProfile capture next to it as <path>.<phase>.prof."""
+        folder = os.path.dirname(os.path.abspath(path))
+        os.makedirs(folder, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.report())
+        for name, profile in self.profiles.items():
+            profile.dump_stats(f"{path}.{name}.prof")
+        logging.info(f"Profile report written to {path}")
+
+
+# Phases of the whole process; enabled by --profile
+shared_profiler = PhaseProfiler()
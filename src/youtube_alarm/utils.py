@@ -1,4 +1,7 @@
+import os
 import re
+import json
+import tempfile
 
 def sanitize_name(name, max_length=100):
     """
@@ -26,3 +29,35 @@ def extract_id_from_url(url):
 def extract_id_from_filename(filename):
     """Extract the YouTube ID from the filename (first 11 characters)."""
     return filename[:11]
+
+def write_json_atomic(path, data, fsync=False):
+    """
+    Write `data` as JSON to `path` so that readers only ever see the old or the new content.
+
+    Args:
+        path (str): Destination file.
+        data: JSON-serializable object.
+        fsync (bool): Also flush the file and its directory to disk, for crash safety across power loss.
+    """
+    # A temporary file of its own, so concurrent writers never interleave in the same one
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp",
+                                    dir=os.path.dirname(path) or ".")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    if fsync:
+        dir_fd = os.open(os.path.dirname(path) or ".", os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
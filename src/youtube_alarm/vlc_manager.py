@@ -1,43 +1,143 @@
 import os
+import json
 import time
+import socket
 import logging
 import requests
+import tempfile
 import subprocess
 import asyncio
 import signal
 import psutil
 
+from .player_backend import PlayerBackend, PlayerStartError
+from .utils import write_json_atomic
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(module)s - %(funcName)s - line %(lineno)d - %(message)s'
 )
 
 VLC_PASSWORD = "vlc"
+READY_TIMEOUT = 10  # seconds for a new VLC to answer on its HTTP port
+READY_POLL_INTERVAL = 0.2
+HEALTH_TIMEOUT = 1  # seconds for a single HTTP health check
+EXIT_UNKNOWN = -1  # poll() of an attached process that is gone: it is not our child, so its exit code is lost
+
+class AttachedProcess:
+    """
+    Minimal Popen look-alike for a player process started by a previous run of the program.
+
+    It is not our child, so once it is gone its exit code cannot be read: poll() then returns
+    EXIT_UNKNOWN, and the backend has to tell a crash from a normal exit by other means.
+    """
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.process = psutil.Process(pid)
+
+    def poll(self):
+        try:
+            if self.process.is_running() and self.process.status() != psutil.STATUS_ZOMBIE:
+                return None
+        except psutil.NoSuchProcess:
+            pass
+        return EXIT_UNKNOWN
+
+    def terminate(self):
+        try:
+            self.process.terminate()
+        except psutil.NoSuchProcess:
+            pass
+
+    def kill(self):
+        try:
+            self.process.kill()
+        except psutil.NoSuchProcess:
+            pass
+
+    def wait(self, timeout=None):
+        try:
+            return self.process.wait(timeout=timeout)
+        except psutil.TimeoutExpired:
+            raise subprocess.TimeoutExpired("vlc", timeout)
+        except psutil.NoSuchProcess:
+            return 0
+
+class VLCManager(PlayerBackend):
+    """
+    Player backend driving VLC through its HTTP interface. Track changes are found by polling status.json.
+
+    The VLC started here is recorded in a pidfile (PID, port and process start time), so a later
+    start can tell our own VLC apart from any other process: a healthy one still listening on our
+    port is reused, an unhealthy one is stopped, and other VLC instances on the host are left alone.
+    """
 
-class VLCManager:
     def __init__(self, port=8080):
+        super().__init__()
         self.vlc_process = None
-        self.playlist = []  # To track the playlist order
-        self.current_index = -1  # To track the current song index
         self.port = port  # Store the port as an attribute
+        self.pidfile = os.path.join(tempfile.gettempdir(), f"youtube_alarm_vlc_{os.getuid()}_{port}.pid")
         signal.signal(signal.SIGINT, self.cleanup)
         signal.signal(signal.SIGTERM, self.cleanup)
 
-    def kill_existing_vlc(self):
-        for proc in psutil.process_iter(['pid', 'name']):
-            if 'vlc' in proc.info['name']:
-                try:
-                    proc.terminate()
-                    proc.wait(timeout=5)
-                    logging.info(f"Killed existing VLC process with PID {proc.info['pid']}")
-                except psutil.NoSuchProcess:
-                    logging.info(f"VLC process {proc.info['pid']} already terminated.")
-                except psutil.TimeoutExpired:
-                    logging.warning(f"VLC process {proc.info['pid']} did not terminate in time. Forcing kill.")
-                    proc.kill()
+    def owned_process(self):
+        """Return the VLC recorded in our pidfile if it is still that same process, else None."""
+        try:
+            with open(self.pidfile) as f:
+                record = json.load(f)
+            process = psutil.Process(record["pid"])
+            # PIDs get reused: the start time tells whether it is still the process we launched
+            if abs(process.create_time() - record["create_time"]) > 1 or 'vlc' not in process.name():
+                return None
+            return process
+        except (OSError, ValueError, KeyError, TypeError, psutil.Error):
+            return None
+
+    def owns_port(self, process):
+        """True if `process` is the one listening on our HTTP port."""
+        try:
+            connections = process.net_connections(kind='tcp')
+        except psutil.Error:
+            return False
+        return any(c.status == psutil.CONN_LISTEN and c.laddr and c.laddr.port == self.port for c in connections)
+
+    def port_in_use(self):
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            sock.settimeout(HEALTH_TIMEOUT)
+            return sock.connect_ex(("127.0.0.1", self.port)) == 0
+
+    def write_pidfile(self):
+        try:
+            write_json_atomic(self.pidfile, {
+                "pid": self.vlc_process.pid,
+                "port": self.port,
+                "create_time": psutil.Process(self.vlc_process.pid).create_time(),
+            })
+        except (OSError, psutil.Error) as e:
+            logging.warning(f"Could not write VLC pidfile {self.pidfile}: {e}")
+
+    def remove_pidfile(self):
+        try:
+            os.remove(self.pidfile)
+        except FileNotFoundError:
+            pass
+
+    async def stop_owned(self, process):
+        """Stop a VLC we started earlier, without blocking the event loop."""
+        logging.info(f"Stopping unresponsive VLC (PID {process.pid}) left by a previous run.")
+        try:
+            process.terminate()
+            await asyncio.to_thread(process.wait, 5)
+        except psutil.TimeoutExpired:
+            logging.warning(f"VLC process {process.pid} did not terminate in time. Forcing kill.")
+            process.kill()
+        except psutil.NoSuchProcess:
+            pass
+        self.remove_pidfile()
 
     def initialize_vlc_server(self):
-        self.kill_existing_vlc()
+        """Launch VLC and record it in the pidfile. Does not wait for it, see wait_until_ready."""
         play_command = [
             "cvlc",
             "--extraintf=http",
@@ -46,17 +146,83 @@ class VLCManager:
             "--play-and-exit",
             "--no-video",  # Disable video output
             "--no-metadata-network-access",  # Prevent fetching metadata online
+            "--audio-replay-gain-mode=track",  # Apply the gain written by the audio analysis stage
         ]
         self.vlc_process = subprocess.Popen(play_command)
+        self.write_pidfile()
 
-        # Wait until VLC is ready by checking the HTTP server
-        for _ in range(10):
-            if self.is_server_running():
+    async def wait_until_ready(self, timeout=READY_TIMEOUT):
+        """Wait for the HTTP interface to answer. Returns False if VLC exits or times out first."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.vlc_process.poll() is not None:
+                logging.error(f"VLC exited during startup with code {self.vlc_process.poll()}.")
+                return False
+            if await asyncio.to_thread(self.is_server_running):
                 logging.info(f"VLC server initialized on port {self.port}.")
-                return
-            time.sleep(1)
-
+                return True
+            await asyncio.sleep(READY_POLL_INTERVAL)
         logging.error(f"VLC server failed to start on port {self.port}.")
+        return False
+
+    @property
+    def pid(self):
+        return self.vlc_process.pid if self.vlc_process else None
+
+    async def start(self):
+        owned = self.owned_process()
+        if owned and self.owns_port(owned) and await asyncio.to_thread(self.is_server_running):
+            # Our VLC from an earlier run is still healthy: reuse it with an empty queue
+            self.vlc_process = AttachedProcess(owned.pid)
+            logging.info(f"Reusing running VLC server (PID {owned.pid}) on port {self.port}.")
+            await self.clear_playlist()
+            return
+        if owned:
+            await self.stop_owned(owned)
+        if await asyncio.to_thread(self.port_in_use):
+            raise PlayerStartError(f"Port {self.port} is used by another program, VLC cannot listen on it.")
+        self.initialize_vlc_server()
+        if not await self.wait_until_ready():
+            # Do not leave a half-started VLC holding the port for the next attempt
+            if self.vlc_process.poll() is None:
+                self.vlc_process.kill()
+            self.remove_pidfile()
+            raise PlayerStartError(f"VLC did not answer on port {self.port} within {READY_TIMEOUT}s.")
+
+    def is_running(self):
+        return self.vlc_process is not None and self.vlc_process.poll() is None
+
+    def has_crashed(self):
+        if self.vlc_process is None:
+            return False
+        code = self.vlc_process.poll()
+        if code == EXIT_UNKNOWN:
+            # A reused or rejoined VLC: only a played-out queue explains it exiting on its own
+            return self.current_index < len(self.playlist) - 1
+        # With --play-and-exit VLC exits with code 0 once the queue has played out
+        return code not in (None, 0)
+
+    def is_ready(self):
+        return self.is_server_running()
+
+    async def rejoin(self, pid):
+        """
+        Take over a VLC server left running by a previous run instead of starting a new one.
+
+        Returns:
+            bool: True if `pid` is a live VLC answering on our port.
+        """
+        try:
+            process = AttachedProcess(pid)
+            if 'vlc' not in process.process.name() or process.poll() is not None:
+                return False
+        except psutil.Error:
+            return False
+        if not await asyncio.to_thread(self.is_server_running):
+            return False
+        self.vlc_process = process
+        logging.info(f"Rejoined running VLC server (PID {pid}) on port {self.port}.")
+        return True
 
     async def send_vlc_command(self, command, params=None):
         max_retries = 5
@@ -68,7 +234,8 @@ class VLCManager:
 
         for attempt in range(max_retries):
             try:
-                response = requests.get(url, auth=("", VLC_PASSWORD))
+                # requests is blocking: run it in a thread so a hung VLC cannot stall main_loop
+                response = await asyncio.to_thread(requests.get, url, auth=("", VLC_PASSWORD), timeout=HEALTH_TIMEOUT)
                 response.raise_for_status()
                 return response
             except requests.RequestException as e:
@@ -117,6 +284,7 @@ class VLCManager:
             response = await self.send_vlc_command('')
             if response and response.status_code == 200:
                 status = response.json()
+                self.position = status.get('time', self.position)
                 if 'information' in status:
                     meta = status['information'].get('category', {}).get('meta', {})
                     current_file_path = meta.get('filename', None)
@@ -159,6 +327,21 @@ class VLCManager:
             logging.error("Could not retrieve current song from VLC.")
             self.current_index = -1
 
+    async def seek(self, seconds):
+        response = await self.send_vlc_command('seek', f"val={int(seconds)}")
+        if response and response.status_code == 200:
+            self.position = int(seconds)
+        else:
+            logging.error(f"Failed to seek to {seconds}s.")
+
+    async def clear_playlist(self):
+        response = await self.send_vlc_command('pl_empty')
+        if response and response.status_code == 200:
+            self.playlist = []
+            self.current_index = -1
+        else:
+            logging.error("Failed to clear VLC playlist.")
+
     async def get_playlist(self):
         response = await self.send_vlc_command('pl_info')
         if response and response.status_code == 200:
@@ -168,12 +351,14 @@ class VLCManager:
 
     def is_server_running(self):
         try:
-            response = requests.get(f"http://localhost:{self.port}/requests/status.json", auth=("", VLC_PASSWORD))
+            response = requests.get(f"http://localhost:{self.port}/requests/status.json", auth=("", VLC_PASSWORD),
+                                    timeout=HEALTH_TIMEOUT)
             return response.status_code == 200
         except requests.RequestException:
             return False
 
     def cleanup(self, signum=None, frame=None):
+        self.closed = True
         if self.vlc_process:
             if self.vlc_process.poll() is None:  # Check if process is still running
                 self.vlc_process.terminate()
@@ -182,7 +367,5 @@ class VLCManager:
                 except subprocess.TimeoutExpired:
                     self.vlc_process.kill()
                     logging.warning("VLC server forcefully terminated.")
+            self.remove_pidfile()
             logging.info("VLC server terminated.")
-
-    def get_playlist_length(self):
-        return len(self.playlist)
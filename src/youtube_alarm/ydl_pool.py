@@ -0,0 +1,163 @@
+import os
+import queue
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager
+
+import yt_dlp
+
+from .postprocessors import PLAYLIST_FIELD, add_download_postprocessors
+from .download_scheduler import job_progress_hook
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(module)s - %(funcName)s - line %(lineno)d - %(message)s'
+)
+
+MAX_INSTANCES_PER_PROFILE = 2
+
+# Download qualities: (format selector, MP3 bitrate). 'draft' fetches a small stream (YouTube's
+# ~50-70 kbps opus) for tracks needed too soon for the best one; it is upgraded later
+QUALITIES = {
+    'best': ('bestaudio/best', '192'),
+    'draft': ('bestaudio[abr<=70]/worstaudio/worst', '96'),
+}
+
+
+def flat_profile():
+    """Playlist listing: entries only, no per-video extraction."""
+    return {
+        'extract_flat': 'in_playlist',
+        'skip_download': True,
+        'quiet': True
+    }, None
+
+
+def info_profile():
+    """Metadata of a single video, without downloading it."""
+    return {
+        'quiet': True,
+        'skip_download': True
+    }, None
+
+
+def download_profile(base_folder, quality='best', temp_folder=None):
+    """
+    Download a single video as a tagged MP3 into <base_folder>/<playlist>/ID_SanitizedTitle.mp3.
+
+    With a `temp_folder`, the download and conversion happen there and the finished MP3 is then
+    moved over any existing file, so a player holding the old file open is not disturbed.
+    """
+    audio_format, mp3_quality = QUALITIES[quality]
+    paths = {'home': base_folder}
+    if temp_folder:
+        paths['temp'] = temp_folder
+    return {
+        'format': audio_format,
+        'paths': paths,
+        # The playlist name comes from the per-call info dict, see download_audio
+        'outtmpl': os.path.join(f'%({PLAYLIST_FIELD})s', '%(id)s_%(clean_title)s.%(ext)s'),
+        'noplaylist': True,
+        # Lets the download scheduler throttle or preempt background downloads
+        'progress_hooks': [job_progress_hook],
+        'quiet': True
+    }, lambda ydl: add_download_postprocessors(ydl, preferredquality=mp3_quality)
+
+
+PROFILES = {
+    'flat': flat_profile,
+    'info': info_profile,
+    'download': download_profile,
+}
+
+
+def _in_event_loop():
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+class YoutubeDLPool:
+    """
+    Long-lived YoutubeDL instances, shared across calls.
+
+    Building a YoutubeDL registers every extractor, processes the options and sets up a new HTTP
+    session; doing that per video costs more than many extractions. The pool keeps up to
+    `max_instances` instances per option profile (flat listing, info-only, download) and hands
+    each one to a single caller at a time, since YoutubeDL itself is not thread-safe. Reused
+    instances keep their HTTP session, and with it their open connections.
+
+    `acquire` blocks until an instance is free, and a playlist listing holds its 'flat'
+    instance for the whole listing: it may only be called from worker threads (the download
+    scheduler, run_in_executor, asyncio.to_thread), never from the event loop.
+    """
+
+    def __init__(self, max_instances=MAX_INSTANCES_PER_PROFILE, profiles=PROFILES, factory=yt_dlp.YoutubeDL):
+        self.max_instances = max_instances
+        self.profiles = profiles
+        self.factory = factory
+        self._lock = threading.Lock()
+        self._idle = {}  # key -> LifoQueue of idle instances
+        self._slots = {}  # key -> semaphore limiting live instances
+        self._instances = {}  # key -> every instance created, for close()
+
+    def _key(self, profile, params):
+        return (profile, tuple(sorted(params.items())))
+
+    def _create(self, profile, params):
+        opts, setup = self.profiles[profile](**params)
+        ydl = self.factory(opts)
+        if setup:
+            setup(ydl)
+        logging.debug(f"Created YoutubeDL instance for profile '{profile}'.")
+        return ydl
+
+    @contextmanager
+    def acquire(self, profile, **params):
+        """
+        Borrow an instance of the given profile, blocking while all of its instances are in use.
+
+        Args:
+            profile (str): One of the pool's profiles ('flat', 'info', 'download').
+            **params: Profile parameters, e.g. base_folder for 'download'.
+        """
+        if _in_event_loop():
+            raise RuntimeError("YoutubeDLPool.acquire blocks until an instance is free: "
+                               "call it from a worker thread, not from the event loop.")
+        key = self._key(profile, params)
+        with self._lock:
+            if key not in self._idle:
+                self._idle[key] = queue.LifoQueue()
+                self._slots[key] = threading.BoundedSemaphore(self.max_instances)
+                self._instances[key] = []
+        self._slots[key].acquire()
+        try:
+            try:
+                ydl = self._idle[key].get_nowait()
+            except queue.Empty:
+                ydl = self._create(profile, params)
+                with self._lock:
+                    self._instances[key].append(ydl)
+            try:
+                yield ydl
+            finally:
+                self._idle[key].put(ydl)
+        finally:
+            self._slots[key].release()
+
+    def close(self):
+        """Close every instance and their HTTP sessions."""
+        with self._lock:
+            instances = [ydl for ydls in self._instances.values() for ydl in ydls]
+            self._idle.clear()
+            self._slots.clear()
+            self._instances.clear()
+        for ydl in instances:
+            ydl.close()
+
+
+# Shared by every extraction and download of the process
+shared_pool = YoutubeDLPool()
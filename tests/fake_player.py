@@ -0,0 +1,69 @@
+from youtube_alarm.player_backend import PlayerBackend, PlayerStartError
+
+class FakePlayer(PlayerBackend):
+    """In-memory player backend: records commands and lets tests move through the queue."""
+
+    poll_interval = 0.01
+
+    def __init__(self):
+        super().__init__()
+        self.running = False
+        self.playing = False
+        self.crashed = False
+        self.failing_starts = 0  # start() raises PlayerStartError this many times
+        self.commands = []
+
+    @property
+    def pid(self):
+        return 4242 if self.running or self.crashed else None
+
+    async def start(self):
+        self.commands.append("start")
+        if self.failing_starts:
+            self.failing_starts -= 1
+            raise PlayerStartError("fake player failed to start")
+        self.running = True
+        self.crashed = False
+
+    def crash(self):
+        self.running = False
+        self.crashed = True
+
+    async def rejoin(self, pid):
+        return False
+
+    def is_running(self):
+        return self.running
+
+    def is_ready(self):
+        return self.running
+
+    async def add_to_playlist(self, file_path):
+        self.commands.append(("add", file_path))
+        self.playlist.append(file_path)
+
+    async def start_playback(self):
+        self.commands.append("play")
+        self.playing = True
+        self.current_index = 0
+
+    async def skip_song(self):
+        self.current_index += 1
+
+    async def previous_song(self):
+        self.current_index = max(self.current_index - 1, 0)
+
+    async def seek(self, seconds):
+        self.commands.append(("seek", seconds))
+        self.position = seconds
+
+    async def clear_playlist(self):
+        self.playlist = []
+        self.current_index = -1
+
+    async def update_current_song_index(self):
+        pass
+
+    def cleanup(self, signum=None, frame=None):
+        self.closed = True
+        self.running = False
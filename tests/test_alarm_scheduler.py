@@ -0,0 +1,78 @@
+import asyncio
+import datetime
+import unittest
+from youtube_alarm.alarm_scheduler import AlarmScheduler
+
+class FakeClock:
+    """Wall and monotonic clocks that only move when the scheduler sleeps."""
+
+    def __init__(self, wall):
+        self.wall = wall
+        self.mono = 0.0
+        self.sleeps = []
+        self.suspend_at = None  # (sleep number, seconds the machine is suspended)
+
+    def time(self):
+        return self.wall
+
+    def monotonic(self):
+        return self.mono
+
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.wall += seconds
+        self.mono += seconds
+        if self.suspend_at and len(self.sleeps) == self.suspend_at[0]:
+            self.wall += self.suspend_at[1]  # The monotonic clock stands still while suspended
+
+class TestAlarmScheduler(unittest.TestCase):
+
+    ALARM = datetime.datetime(2026, 3, 2, 7, 0, tzinfo=datetime.timezone.utc)
+
+    def make_scheduler(self, hours_before):
+        clock = FakeClock(self.ALARM.timestamp() - hours_before * 3600)
+        return clock, AlarmScheduler(wall_clock=clock.time, monotonic=clock.monotonic, sleep=clock.sleep, max_slice=60)
+
+    def test_sleeps_in_slices_until_the_alarm(self):
+        clock, scheduler = self.make_scheduler(hours_before=8)
+        asyncio.run(scheduler.wait_until(self.ALARM))
+        self.assertEqual(clock.wall, self.ALARM.timestamp())
+        self.assertEqual(len(clock.sleeps), 8 * 60)  # Instead of 115,200 wakeups at 0.25 s
+        self.assertEqual(scheduler.clock_jumps, 0)
+
+    def test_resume_from_suspend_rechecks_the_wall_clock(self):
+        clock, scheduler = self.make_scheduler(hours_before=8)
+        clock.suspend_at = (10, 6 * 3600)  # Suspended for 6 hours during the 10th sleep
+        asyncio.run(scheduler.wait_until(self.ALARM))
+        self.assertEqual(clock.wall, self.ALARM.timestamp())
+        self.assertEqual(len(clock.sleeps), 2 * 60)
+        self.assertEqual(scheduler.clock_jumps, 1)
+
+    def test_pre_alarm_tasks_run_at_their_own_times(self):
+        clock, scheduler = self.make_scheduler(hours_before=1)
+        ran = []
+
+        def task(name):
+            async def run():
+                ran.append((name, self.ALARM.timestamp() - clock.wall))
+            return run
+
+        alarm = self.ALARM.timestamp()
+        scheduler.add_task(alarm - 30, "warm-up", task("warm-up"))
+        scheduler.add_task(alarm - 120, "prefetch", task("prefetch"))
+        scheduler.add_task(alarm + 10, "too late", task("too late"))
+        asyncio.run(scheduler.wait_until(self.ALARM))
+        self.assertEqual(ran, [("prefetch", 120), ("warm-up", 30)])
+
+    def test_failing_task_does_not_delay_the_alarm(self):
+        clock, scheduler = self.make_scheduler(hours_before=0.01)
+
+        async def broken():
+            raise RuntimeError("player did not start")
+
+        scheduler.add_task(self.ALARM.timestamp() - 10, "warm-up", broken)
+        asyncio.run(scheduler.wait_until(self.ALARM))
+        self.assertEqual(clock.wall, self.ALARM.timestamp())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import os
+import shutil
+import asyncio
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+from mutagen.id3 import ID3
+from youtube_alarm.music_library import MusicLibrary
+from youtube_alarm import audio_analysis
+from youtube_alarm.audio_analysis import AudioAnalyzer, AnalysisCache
+from tests.fake_player import FakePlayer
+
+class TestAudioAnalysis(unittest.TestCase):
+
+    PLAYLIST = "TestPlaylist1"
+
+    def setUp(self):
+        self.base_folder = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.base_folder, self.PLAYLIST))
+        self.song_path = os.path.join(self.base_folder, self.PLAYLIST, "abcdefghijk_1_test_song.mp3")
+        # 100 silent MPEG-1 layer III frames at 128 kbps / 44.1 kHz, about 2.6 seconds
+        frame = bytes([0xFF, 0xFB, 0x90, 0x64]) + bytes(413)
+        with open(self.song_path, "wb") as f:
+            f.write(frame * 100)
+        self.library = MusicLibrary(self.base_folder)
+
+    def tearDown(self):
+        shutil.rmtree(self.base_folder)
+
+    def analyze(self):
+        async def scenario():
+            # Threads instead of processes keep the mocked ffmpeg in effect
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                return await AudioAnalyzer(self.library).analyze_pending(executor)
+        with mock.patch.object(audio_analysis, "measure_loudness", return_value=(-3.5, 0.9)):
+            return asyncio.run(scenario())
+
+    def test_analysis_is_cached_and_tagged(self):
+        self.assertIsNone(self.library.get_analysis(self.PLAYLIST, "abcdefghijk"))
+        self.assertEqual(self.analyze(), 1)
+        analysis = self.library.get_analysis(self.PLAYLIST, "abcdefghijk")
+        self.assertAlmostEqual(analysis["duration"], 2.6, places=1)
+        self.assertEqual(analysis["bitrate"], 128000)
+        self.assertEqual(analysis["track_gain"], -3.5)
+        self.assertAlmostEqual(self.library.get_duration(self.PLAYLIST, "abcdefghijk"), 2.6, places=1)
+        self.assertEqual(ID3(self.song_path).get("TXXX:REPLAYGAIN_TRACK_GAIN").text[0], "-3.50 dB")
+
+        # Nothing left to do, and the cache survives a restart
+        self.assertEqual(self.analyze(), 0)
+        self.assertIsNotNone(MusicLibrary(self.base_folder).get_analysis(self.PLAYLIST, "abcdefghijk"))
+
+    def test_modified_file_is_reanalyzed(self):
+        self.analyze()
+        with open(self.song_path, "ab") as f:
+            f.write(bytes(417))
+        self.assertIsNone(self.library.get_analysis(self.PLAYLIST, "abcdefghijk"))
+        self.assertEqual(self.analyze(), 1)
+
+    def test_queued_tracks_are_skipped_and_batches_bounded(self):
+        frame = bytes([0xFF, 0xFB, 0x90, 0x64]) + bytes(413)
+        for i in range(4):
+            with open(os.path.join(self.base_folder, self.PLAYLIST, f"abcdefghij{i}_song.mp3"), "wb") as f:
+                f.write(frame * 10)
+        library = MusicLibrary(self.base_folder)
+        player = FakePlayer()
+        player.playlist = [self.song_path]
+        player.current_index = 0
+        analyzer = AudioAnalyzer(library, batch_size=2, player=player)
+
+        pending = analyzer.pending()
+        self.assertEqual(len(pending), 2)
+        self.assertNotIn(self.song_path, [path for _, _, path in pending])
+
+    def test_analyzed_records_are_not_stat_again(self):
+        analyzer = AudioAnalyzer(self.library)
+        self.assertEqual(len(analyzer.pending()), 1)
+        self.library.analysis.put(self.PLAYLIST, os.path.basename(self.song_path), {
+            "size": os.path.getsize(self.song_path), "mtime_ns": os.stat(self.song_path).st_mtime_ns})
+        self.assertEqual(analyzer.pending(), [])  # Found analyzed: remembered
+        with mock.patch.object(audio_analysis.os, "stat", side_effect=AssertionError("stat")):
+            self.assertEqual(analyzer.pending(), [])
+
+    def test_cache_ignores_corrupt_file(self):
+        with open(os.path.join(self.base_folder, audio_analysis.CACHE_FILE_NAME), "w") as f:
+            f.write("{not json")
+        self.assertEqual(AnalysisCache(self.base_folder).entries, {})
+
+if __name__ == "__main__":
+    unittest.main()
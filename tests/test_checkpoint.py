@@ -0,0 +1,102 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+from youtube_alarm import checkpoint as checkpoint_module
+from youtube_alarm.checkpoint import PlaybackCheckpoint
+from youtube_alarm.playlist_stream import PlaylistQueue
+
+PLAYLIST_URL = "https://www.youtube.com/playlist?list=TEST"
+
+class TestPlaybackCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.base_folder = tempfile.mkdtemp()
+        self.checkpoint = PlaybackCheckpoint(self.base_folder)
+        self.player = SimpleNamespace(playlist=["a.mp3", "b.mp3"], current_index=1, position=42, pid=1234)
+
+    def tearDown(self):
+        shutil.rmtree(self.base_folder)
+
+    def test_roundtrip(self):
+        self.assertTrue(self.checkpoint.update(PLAYLIST_URL, "TestPlaylist1", ["url3", "url4"], self.player))
+        state = self.checkpoint.load(PLAYLIST_URL)
+        self.assertEqual(state["player_playlist"], ["a.mp3", "b.mp3"])
+        self.assertEqual(state["current_index"], 1)
+        self.assertEqual(state["position"], 42)
+        self.assertEqual(state["videos"], ["url3", "url4"])
+        self.assertEqual(state["player_pid"], 1234)
+        self.assertIsNone(self.checkpoint.load("https://www.youtube.com/playlist?list=OTHER"))
+        self.assertEqual([f for f in os.listdir(self.base_folder) if f.endswith(".tmp")], [])
+
+    def test_unfinished_listing_is_recorded(self):
+        videos = PlaylistQueue(["url3", "url4"], done=False, listed_count=4)
+        self.checkpoint.update(PLAYLIST_URL, "TestPlaylist1", videos, self.player)
+        state = self.checkpoint.load(PLAYLIST_URL)
+        self.assertEqual(state["videos"], ["url3", "url4"])
+        self.assertFalse(state["listing_complete"])
+        self.assertEqual(state["listed_count"], 4)
+
+    def test_queue_is_snapshotted_once_and_changes_are_journaled(self):
+        videos = PlaylistQueue([f"https://www.youtube.com/watch?v=video{i:06d}" for i in range(5000)])
+        self.checkpoint.update(PLAYLIST_URL, "TestPlaylist1", videos, self.player)
+        snapshot_mtime = os.stat(self.checkpoint.queue_path).st_mtime_ns
+
+        consumed = [videos.popleft() for _ in range(3)]
+        videos.put("https://www.youtube.com/watch?v=newvideo001")
+        self.player.playlist.append("c.mp3")
+        self.player.current_index = 2
+        self.checkpoint.update(PLAYLIST_URL, "TestPlaylist1", videos, self.player)
+
+        self.assertEqual(os.stat(self.checkpoint.queue_path).st_mtime_ns, snapshot_mtime)
+        self.assertLess(os.path.getsize(self.checkpoint.path), 1024)  # Position and changes only
+        state = self.checkpoint.load(PLAYLIST_URL)
+        self.assertEqual(state["videos"], list(videos))
+        self.assertNotIn(consumed[0], state["videos"])
+        self.assertEqual(state["player_playlist"], ["a.mp3", "b.mp3", "c.mp3"])
+        self.assertEqual(state["current_index"], 2)
+
+    def test_rebuilt_player_queue_writes_a_new_snapshot(self):
+        self.checkpoint.update(PLAYLIST_URL, "TestPlaylist1", ["url3"], self.player)
+        self.player.playlist = ["b.mp3"]  # Restarted from the interrupted song
+        self.player.current_index = 0
+        self.checkpoint.update(PLAYLIST_URL, "TestPlaylist1", ["url3"], self.player)
+        self.assertEqual(self.checkpoint.load(PLAYLIST_URL)["player_playlist"], ["b.mp3"])
+        self.checkpoint.clear()
+        self.assertFalse(os.path.exists(self.checkpoint.queue_path))
+
+    def test_stale_or_corrupt_checkpoint_is_ignored(self):
+        self.checkpoint.update(PLAYLIST_URL, "TestPlaylist1", [], self.player)
+        with open(self.checkpoint.path) as f:
+            state = json.load(f)
+        state["saved_at"] -= checkpoint_module.MAX_RESUME_AGE + 1
+        with open(self.checkpoint.path, "w") as f:
+            json.dump(state, f)
+        self.assertIsNone(self.checkpoint.load(PLAYLIST_URL))
+        with open(self.checkpoint.path, "w") as f:
+            f.write("{truncated")
+        self.assertIsNone(self.checkpoint.load(PLAYLIST_URL))
+        self.checkpoint.clear()
+        self.assertIsNone(self.checkpoint.load(PLAYLIST_URL))
+
+    def test_position_only_updates_are_throttled_and_unsynced(self):
+        with mock.patch.object(checkpoint_module.os, "fsync") as fsync:
+            self.assertTrue(self.checkpoint.update(PLAYLIST_URL, "TestPlaylist1", [], self.player))
+            synced = fsync.call_count
+            self.assertGreater(synced, 0)
+
+            # Same queue, new position: skipped until the interval elapses
+            self.player.position = 43
+            self.assertFalse(self.checkpoint.update(PLAYLIST_URL, "TestPlaylist1", [], self.player))
+
+            # New track: written right away, but the fsync is rate limited
+            self.player.current_index = 2
+            self.assertTrue(self.checkpoint.update(PLAYLIST_URL, "TestPlaylist1", [], self.player))
+            self.assertEqual(fsync.call_count, synced)
+        self.assertEqual(self.checkpoint.load()["current_index"], 2)
+
+if __name__ == "__main__":
+    unittest.main()
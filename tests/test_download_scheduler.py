@@ -0,0 +1,170 @@
+import time
+import asyncio
+import threading
+import unittest
+from unittest import mock
+from yt_dlp.utils import DownloadCancelled
+from youtube_alarm import download_scheduler
+from youtube_alarm.download_scheduler import DownloadScheduler, JobControl, job_progress_hook, track_deadline, DEFAULT_TRACK_DURATION
+from tests.fake_player import FakePlayer
+
+class StubLibrary:
+    def __init__(self, durations):
+        self.durations = durations
+
+    def get_duration(self, playlist_name, video_id, default=None):
+        return self.durations.get(video_id, default)
+
+class TestDownloadScheduler(unittest.TestCase):
+
+    def test_foreground_jobs_run_earliest_deadline_first(self):
+        order = []
+        release = threading.Event()
+
+        async def scenario():
+            scheduler = DownloadScheduler(foreground_workers=1)
+            blocker = asyncio.ensure_future(scheduler.run(release.wait, deadline=time.monotonic() + 1000))
+            await asyncio.sleep(0.05)  # The only worker is now busy
+            jobs = [asyncio.ensure_future(scheduler.run(order.append, name, deadline=time.monotonic() + offset))
+                    for name, offset in (("late", 3000), ("first", 1000), ("second", 2000))]
+            await asyncio.sleep(0.05)
+            release.set()
+            await asyncio.gather(blocker, *jobs)
+            scheduler.shutdown()
+
+        asyncio.run(scenario())
+        self.assertEqual(order, ["first", "second", "late"])
+
+    def test_background_download_is_preempted_and_requeued(self):
+        attempts = []
+        started = threading.Event()
+
+        def background_download():
+            attempts.append(threading.current_thread().name)
+            started.set()
+            for downloaded in range(0, 10 ** 6, 1024):
+                job_progress_hook({'status': 'downloading', 'downloaded_bytes': downloaded})
+                if len(attempts) > 1:
+                    return "background done"
+                time.sleep(0.01)
+            return "not preempted"
+
+        async def scenario():
+            scheduler = DownloadScheduler()
+            background = asyncio.ensure_future(scheduler.run(background_download, background=True))
+            await asyncio.get_running_loop().run_in_executor(None, started.wait)
+            # Needed in 5 seconds: less slack than PREEMPT_SLACK
+            urgent = await scheduler.run(lambda: "urgent done", deadline=time.monotonic() + 5)
+            result = await background
+            scheduler.shutdown()
+            return urgent, result, scheduler.stats
+
+        urgent, result, stats = asyncio.run(scenario())
+        self.assertEqual(urgent, "urgent done")
+        self.assertEqual(result, "background done")
+        self.assertEqual(len(attempts), 2)
+        self.assertTrue(all(name.startswith("background-download") for name in attempts))
+        self.assertEqual(stats['preempted'], 1)
+
+    def test_foreground_request_promotes_queued_background_job(self):
+        calls = []
+        release = threading.Event()
+
+        async def scenario():
+            scheduler = DownloadScheduler(background_workers=1)
+            blocker = asyncio.ensure_future(scheduler.run(release.wait, background=True))
+            await asyncio.sleep(0.05)
+            queued = asyncio.ensure_future(scheduler.run(calls.append, "abcdefghijk", background=True, key="abcdefghijk"))
+            await asyncio.sleep(0.05)
+            # Runs on the foreground worker although the background worker is still busy
+            await scheduler.run(calls.append, "abcdefghijk", deadline=time.monotonic() + 1000, key="abcdefghijk")
+            await queued
+            release.set()
+            await blocker
+            scheduler.shutdown()
+            return scheduler.stats
+
+        stats = asyncio.run(scenario())
+        self.assertEqual(calls, ["abcdefghijk"])
+        self.assertEqual(stats['promoted'], 1)
+
+    def test_shutdown_stops_running_downloads(self):
+        started = threading.Event()
+        stopped = []
+
+        def endless_download():
+            started.set()
+            try:
+                while True:
+                    job_progress_hook({'status': 'downloading', 'downloaded_bytes': 0})
+                    time.sleep(0.01)
+            except DownloadCancelled:
+                stopped.append(True)
+                raise
+
+        async def scenario():
+            scheduler = DownloadScheduler()
+            running = asyncio.ensure_future(scheduler.run(endless_download, background=True, key="abcdefghijk"))
+            queued = asyncio.ensure_future(scheduler.run(lambda: "never", background=True))
+            await asyncio.get_running_loop().run_in_executor(None, started.wait)
+            # A foreground caller waiting on it pins the job, which must not keep it alive either
+            pinned = asyncio.ensure_future(scheduler.run(endless_download, deadline=time.monotonic() + 1000, key="abcdefghijk"))
+            await asyncio.sleep(0.05)
+            scheduler.shutdown()
+            results = await asyncio.wait_for(asyncio.gather(running, queued, pinned, return_exceptions=True), 5)
+            return results, scheduler
+
+        results, scheduler = asyncio.run(scenario())
+        self.assertTrue(all(isinstance(result, asyncio.CancelledError) for result in results))
+        self.assertEqual(stopped, [True])
+        self.assertEqual(scheduler.jobs, {})
+        self.assertEqual(scheduler.stats['preempted'], 0)
+
+    def test_deadline_misses_are_counted(self):
+        now = [100.0]
+
+        async def scenario():
+            scheduler = DownloadScheduler(clock=lambda: now[0])
+
+            def slow_download():
+                now[0] += 50
+                return "done"
+
+            await scheduler.run(slow_download, deadline=120)
+            await scheduler.run(lambda: "done", deadline=1000)
+            scheduler.shutdown()
+            return scheduler
+
+        scheduler = asyncio.run(scenario())
+        self.assertEqual(scheduler.stats['deadline_misses'], 1)
+        self.assertEqual(scheduler.stats['completed'], 2)
+        self.assertIn("1 deadline misses", scheduler.report())
+
+    def test_throttled_job_sleeps_to_match_rate(self):
+        control = JobControl()
+        control.throttle_rate = 1000
+        with mock.patch.object(download_scheduler.time, "sleep") as sleep:
+            control.on_progress({'status': 'downloading', 'downloaded_bytes': 0})
+            control.on_progress({'status': 'downloading', 'downloaded_bytes': 500})
+        self.assertAlmostEqual(sleep.call_args[0][0], 0.5, places=1)
+
+        control.pinned = True
+        control.preempted = True
+        control.on_progress({'status': 'downloading', 'downloaded_bytes': 600})  # Pinned: neither slowed nor stopped
+        control.pinned = False
+        with self.assertRaises(DownloadCancelled):
+            control.on_progress({'status': 'downloading', 'downloaded_bytes': 700})
+
+    def test_track_deadline_adds_remaining_play_time(self):
+        player = FakePlayer()
+        player.playlist = ["/music/aaaaaaaaaaa_One.mp3", "/music/bbbbbbbbbbb_Two.mp3", "/music/ccccccccccc_Three.mp3"]
+        player.current_index = 1
+        player.position = 30
+        library = StubLibrary({"bbbbbbbbbbb": 100})
+
+        deadline = track_deadline(player, library, "TestPlaylist1", tracks_before=2, clock=lambda: 1000.0)
+        # 70s left of the current track, the unanalyzed next one and the two queued before it
+        self.assertEqual(deadline, 1000.0 + 70 + 3 * DEFAULT_TRACK_DURATION)
+
+if __name__ == '__main__':
+    unittest.main()
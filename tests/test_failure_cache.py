@@ -0,0 +1,144 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from youtube_alarm.failure_cache import (
+    FailureCache, CircuitBreaker, classify_error, UNAVAILABLE, RESTRICTED, THROTTLED, TRANSIENT, RETRY_BACKOFF
+)
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class TestFailureCache(unittest.TestCase):
+
+    def setUp(self):
+        self.base_folder = tempfile.mkdtemp()
+        self.clock = FakeClock()
+        self.cache = FailureCache(self.base_folder, clock=self.clock)
+
+    def tearDown(self):
+        shutil.rmtree(self.base_folder)
+
+    def test_classify_error(self):
+        self.assertEqual(classify_error("ERROR: [youtube] abcdefghijk: Private video. Sign in if you've been granted access"), UNAVAILABLE)
+        self.assertEqual(classify_error("ERROR: [youtube] abcdefghijk: Video unavailable"), UNAVAILABLE)
+        self.assertEqual(classify_error("ERROR: The uploader has not made this video available in your country"), RESTRICTED)
+        self.assertEqual(classify_error("ERROR: Video is not available in your country"), RESTRICTED)
+        self.assertEqual(classify_error("ERROR: unable to download video data: HTTP Error 429: Too Many Requests"), THROTTLED)
+        self.assertEqual(classify_error("ERROR: Sign in to confirm you're not a bot"), THROTTLED)
+        self.assertEqual(classify_error("ERROR: timed out"), TRANSIENT)
+
+    def test_backoff_and_persistence(self):
+        self.assertFalse(self.cache.should_skip("abcdefghijk"))
+        self.cache.record_failure("abcdefghijk", "ERROR: timed out")
+        self.assertTrue(self.cache.should_skip("abcdefghijk"))
+        first_delay = RETRY_BACKOFF[TRANSIENT][0]
+        self.assertEqual(self.cache.entries["abcdefghijk"]["retry_at"], self.clock.now + first_delay)
+
+        # Retry allowed after the delay; a second failure doubles it
+        self.clock.now += first_delay
+        self.assertFalse(self.cache.should_skip("abcdefghijk"))
+        self.cache.record_failure("abcdefghijk", "ERROR: timed out")
+        self.assertEqual(self.cache.entries["abcdefghijk"]["retry_at"], self.clock.now + 2 * first_delay)
+
+        self.cache.record_failure("abcdefghijf", "ERROR: Private video")
+        reloaded = FailureCache(self.base_folder, clock=self.clock)
+        self.assertTrue(reloaded.should_skip("abcdefghijf"))
+        self.assertEqual(reloaded.entries["abcdefghijf"]["error"], UNAVAILABLE)
+
+        reloaded.record_success("abcdefghijf")
+        self.assertFalse(FailureCache(self.base_folder, clock=self.clock).should_skip("abcdefghijf"))
+
+    def test_throttling_is_not_held_against_the_video(self):
+        self.cache.record_failure("abcdefghijk", "HTTP Error 429: Too Many Requests")
+        self.assertFalse(self.cache.should_skip("abcdefghijk"))
+        self.assertEqual(self.cache.breaker.consecutive_errors, 1)
+
+    def test_concurrent_failures_from_worker_threads(self):
+        video_ids = [f"video{i:06d}" for i in range(40)]
+
+        def record(video_id):
+            for _ in range(5):
+                self.cache.record_failure(video_id, "ERROR: timed out")
+
+        threads = [threading.Thread(target=record, args=(video_id,)) for video_id in video_ids]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        reloaded = FailureCache(self.base_folder, clock=self.clock)
+        self.assertEqual(sorted(reloaded.entries), video_ids)
+        self.assertTrue(all(entry["failures"] == 5 for entry in reloaded.entries.values()))
+        self.assertEqual([f for f in os.listdir(self.base_folder) if f.endswith(".tmp")], [])
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def test_open_half_open_close(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(threshold=2, cooldown=60, max_cooldown=100, clock=clock)
+        breaker.record_throttle()
+        self.assertTrue(breaker.allow())
+        breaker.record_throttle()
+        self.assertFalse(breaker.allow())
+        self.assertEqual(breaker.remaining(), 60)
+
+        # Trial request after the cooldown fails: reopen for longer, capped
+        clock.now += 60
+        self.assertTrue(breaker.allow())
+        breaker.record_throttle()
+        self.assertFalse(breaker.allow())
+        self.assertEqual(breaker.remaining(), 100)
+
+        clock.now += 100
+        breaker.record_success()
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.cooldown, 60)
+        breaker.record_throttle()
+        self.assertTrue(breaker.allow())
+
+    def test_half_open_lets_a_single_trial_through(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(threshold=1, cooldown=60, trial_timeout=30, clock=clock)
+        breaker.record_throttle()
+        clock.now += 60
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())  # The trial is in flight
+        self.assertEqual(breaker.remaining(), 30)
+
+        # A trial that failed for another reason lets the next caller try
+        breaker.record_inconclusive()
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+
+        # A trial that never reported back is given up on
+        clock.now += 30
+        self.assertTrue(breaker.allow())
+
+    def test_concurrent_callers_get_one_trial(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(threshold=1, cooldown=60, clock=clock)
+        breaker.record_throttle()
+        clock.now += 60
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            allowed = list(executor.map(lambda _: breaker.allow(), range(50)))
+        self.assertEqual(allowed.count(True), 1)
+
+    def test_only_real_answers_close_the_breaker(self):
+        cache = FailureCache(tempfile.mkdtemp(), clock=FakeClock())
+        cache.breaker = CircuitBreaker(threshold=1, cooldown=60, clock=FakeClock())
+        cache.record_failure("abcdefghijk", "HTTP Error 429: Too Many Requests")
+        cache.record_failure("abcdefghijf", "ERROR: timed out")
+        self.assertFalse(cache.breaker.allow())
+        cache.record_failure("abcdefghijg", "ERROR: Private video")
+        self.assertTrue(cache.breaker.allow())
+        shutil.rmtree(os.path.dirname(cache.path))
+
+if __name__ == "__main__":
+    unittest.main()
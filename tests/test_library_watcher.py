@@ -0,0 +1,98 @@
+import os
+import time
+import shutil
+import asyncio
+import tempfile
+import unittest
+from unittest import mock
+from youtube_alarm.music_library import MusicLibrary
+from youtube_alarm.library_watcher import LibraryWatcher
+
+class TestLibraryWatcher(unittest.TestCase):
+
+    PLAYLIST = "TestPlaylist1"
+
+    def setUp(self):
+        self.base_folder = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.base_folder, self.PLAYLIST))
+        self.touch(self.PLAYLIST, "abcdefghijk_1_test_song.mp3")
+        self.library = MusicLibrary(self.base_folder)
+
+    def tearDown(self):
+        shutil.rmtree(self.base_folder)
+
+    def touch(self, playlist, filename):
+        # Empty files are enough: unreadable tags fall back to the title from the filename
+        with open(os.path.join(self.base_folder, playlist, filename), "wb"):
+            pass
+
+    def run_with_watcher(self, actions, **kwargs):
+        async def scenario():
+            watcher = LibraryWatcher(self.library, debounce=0.05, **kwargs)
+            watcher.start()
+            try:
+                await asyncio.sleep(0.05)
+                actions()
+                await asyncio.sleep(0.3)
+            finally:
+                watcher.stop()
+            return watcher
+        return asyncio.run(scenario())
+
+    def test_incremental_add_rename_delete(self):
+        def actions():
+            self.touch(self.PLAYLIST, "abcdefghijf_2_another_song.mp3")
+            os.rename(os.path.join(self.base_folder, self.PLAYLIST, "abcdefghijk_1_test_song.mp3"),
+                      os.path.join(self.base_folder, self.PLAYLIST, "abcdefghijk_renamed.mp3"))
+        watcher = self.run_with_watcher(actions)
+        if watcher.is_polling:
+            self.skipTest("inotify not available")
+        self.assertTrue(self.library.song_exists(self.PLAYLIST, "abcdefghijf"))
+        self.assertEqual(self.library.get_song_paths_by_id("abcdefghijk", self.PLAYLIST),
+                         [os.path.join(self.base_folder, self.PLAYLIST, "abcdefghijk_renamed.mp3")])
+
+        self.run_with_watcher(lambda: os.remove(os.path.join(self.base_folder, self.PLAYLIST, "abcdefghijf_2_another_song.mp3")))
+        self.assertFalse(self.library.song_exists(self.PLAYLIST, "abcdefghijf"))
+        self.assertEqual(self.library.count_songs(self.PLAYLIST), 1)
+
+    def test_new_playlist_folder(self):
+        def actions():
+            os.makedirs(os.path.join(self.base_folder, "TestPlaylist2"))
+            self.touch("TestPlaylist2", "abcdefghijg_3_last_song.mp3")
+        watcher = self.run_with_watcher(actions)
+        if watcher.is_polling:
+            self.skipTest("inotify not available")
+        self.assertTrue(self.library.song_exists("TestPlaylist2", "abcdefghijg"))
+
+    def test_polling_fallback(self):
+        watcher = self.run_with_watcher(lambda: self.touch(self.PLAYLIST, "abcdefghijf_2_another_song.mp3"),
+                                        use_inotify=False, poll_interval=0.1)
+        self.assertFalse(watcher.is_polling)  # stopped
+        self.assertTrue(self.library.song_exists(self.PLAYLIST, "abcdefghijf"))
+
+    def test_rescan_runs_off_the_event_loop_and_never_empties_the_library(self):
+        for i in range(5):
+            self.touch(self.PLAYLIST, f"abcdefghi{i:02d}_song.mp3")
+        counts = []
+
+        def slow_metadata(file_path):
+            time.sleep(0.05)  # Reading tags on a slow SD card
+            return None
+
+        async def scenario():
+            async def ticker():
+                while True:
+                    counts.append(self.library.count_songs(self.PLAYLIST))
+                    await asyncio.sleep(0.01)
+            task = asyncio.ensure_future(ticker())
+            await LibraryWatcher(self.library).rescan()
+            task.cancel()
+
+        with mock.patch.object(self.library, "get_metadata_by_path", side_effect=slow_metadata):
+            asyncio.run(scenario())
+        self.assertGreater(len(counts), 10)
+        self.assertEqual(min(counts), 1)  # The old index stays until the new one is complete
+        self.assertEqual(self.library.count_songs(self.PLAYLIST), 6)
+
+if __name__ == "__main__":
+    unittest.main()
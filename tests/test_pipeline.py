@@ -0,0 +1,112 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+import yt_dlp
+from yt_dlp.extractor.common import InfoExtractor
+from youtube_alarm.music_library import MusicLibrary
+from youtube_alarm.postprocessors import PLAYLIST_FIELD, QUALITY_FIELD
+from youtube_alarm.ydl_pool import YoutubeDLPool
+from youtube_alarm.pipeline import TrackPipeline, StageTimings, choose_quality
+from youtube_alarm.download_scheduler import ThroughputMeter
+
+class CountingIE(InfoExtractor):
+    _VALID_URL = r'https://www\.youtube\.com/watch\?v=(?P<id>[0-9A-Za-z_-]{11})'
+    calls = 0
+
+    def _real_extract(self, url):
+        CountingIE.calls += 1
+        video_id = self._match_id(url)
+        return {'id': video_id, 'title': 'Test Song: 1', 'uploader': 'Test Artist', 'duration': 200,
+                'formats': [{'format_id': 'audio', 'url': 'https://example.invalid/a.webm', 'ext': 'webm', 'vcodec': 'none', 'abr': 160}]}
+
+class TestTrackPipeline(unittest.TestCase):
+
+    PLAYLIST = "TestPlaylist1"
+    URL = "https://www.youtube.com/watch?v=abcdefghijk"
+
+    def setUp(self):
+        CountingIE.calls = 0
+        self.base_folder = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.base_folder, self.PLAYLIST))
+        self.library = MusicLibrary(self.base_folder)
+        self.downloaded = []
+        self.formats = []
+        self.pool = YoutubeDLPool(factory=self.factory)
+        self.timings = StageTimings()
+
+    def tearDown(self):
+        self.pool.close()
+        shutil.rmtree(self.base_folder)
+
+    def factory(self, opts):
+        ydl = yt_dlp.YoutubeDL(dict(opts, simulate=True), auto_init=False)
+        self.formats.append(opts.get('format'))
+        ydl.add_info_extractor(CountingIE())
+        if 'paths' in opts:
+            # Stand-in for the real download: write the file the post-processors would have produced
+            def fake_download(info, download=True, extra_info=None):
+                info = dict(info, **(extra_info or {}), clean_title='Test_Song_1')
+                path = os.path.join(opts['paths']['home'], info[PLAYLIST_FIELD], f"{info['id']}_{info['clean_title']}.mp3")
+                open(path, 'wb').close()
+                self.downloaded.append(info)
+                return info
+            ydl.process_ie_result = fake_download
+        return ydl
+
+    def test_each_video_is_extracted_once(self):
+        pipeline = TrackPipeline(self.PLAYLIST, self.library, pool=self.pool, timings=self.timings)
+        info = pipeline.resolve(self.URL)
+        self.assertEqual(info['title'], 'Test Song: 1')
+        self.assertNotIn('requested_formats', info)  # Unprocessed: format is chosen at fetch time
+        path = pipeline.fetch(info)
+        self.assertEqual(path, os.path.join(self.base_folder, self.PLAYLIST, "abcdefghijk_Test_Song_1.mp3"))
+        self.assertEqual(CountingIE.calls, 1)
+        self.assertEqual(self.downloaded[0]['formats'][0]['format_id'], 'audio')
+        self.assertTrue(self.library.song_exists(self.PLAYLIST, "abcdefghijk"))
+
+        summary = self.timings.summary()
+        self.assertEqual(summary['resolve']['count'], 1)
+        self.assertEqual(summary['fetch']['count'], 1)
+
+    def test_existing_song_is_not_resolved(self):
+        pipeline = TrackPipeline(self.PLAYLIST, self.library, pool=self.pool, timings=self.timings)
+        self.assertIsNotNone(pipeline.process(self.URL))
+        self.assertIsNone(pipeline.process(self.URL))
+        self.assertEqual(CountingIE.calls, 1)
+        self.assertEqual(len(self.downloaded), 1)
+
+    def test_tight_deadline_fetches_a_draft_then_upgrades_it(self):
+        throughput = ThroughputMeter(default=100 * 1024)  # 4 MB of best audio take ~40s at this rate
+        pipeline = TrackPipeline(self.PLAYLIST, self.library, pool=self.pool, timings=self.timings, throughput=throughput)
+        info = pipeline.resolve(self.URL)
+        pipeline.fetch(info, deadline=time.monotonic() + 30)
+        self.assertEqual(self.downloaded[-1][QUALITY_FIELD], 'draft')
+        self.assertEqual(self.library.get_draft_ids(self.PLAYLIST), ["abcdefghijk"])
+        self.assertIsNone(pipeline.fetch(info))  # Already in the library
+
+        path = pipeline.upgrade("abcdefghijk")
+        self.assertEqual(path, os.path.join(self.base_folder, self.PLAYLIST, "abcdefghijk_Test_Song_1.mp3"))
+        self.assertEqual(self.downloaded[-1][QUALITY_FIELD], 'best')
+        self.assertEqual(self.library.get_draft_ids(self.PLAYLIST), [])
+        self.assertIn('bestaudio/best', self.formats)
+        self.assertTrue(any(f and f.startswith('bestaudio[abr<=70]') for f in self.formats))
+
+    def test_quality_follows_time_left_and_throughput(self):
+        info = {'id': 'abcdefghijk', 'duration': 200, 'formats': [{'vcodec': 'none', 'filesize': 4_000_000}]}
+        fast, slow = ThroughputMeter(default=2_000_000), ThroughputMeter(default=50_000)
+        now = lambda: 1000.0
+        self.assertEqual(choose_quality(info, None, slow, now), 'best')  # No deadline: never rushed
+        self.assertEqual(choose_quality(info, 1060, fast, now), 'best')  # ~12s expected, 60s left
+        self.assertEqual(choose_quality(info, 1060, slow, now), 'draft')  # ~90s expected
+
+    def test_throughput_is_measured_on_finished_downloads(self):
+        meter = ThroughputMeter(default=1)
+        meter.observe({'status': 'downloading', 'downloaded_bytes': 10 ** 6, 'elapsed': 1})
+        self.assertEqual(meter.bytes_per_second, 1)
+        meter.observe({'status': 'finished', 'downloaded_bytes': 4 * 10 ** 6, 'elapsed': 2})
+        self.assertEqual(meter.bytes_per_second, 2 * 10 ** 6)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,376 @@
+import os
+import json
+import time
+import socket
+import shutil
+import signal
+import asyncio
+import subprocess
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+from youtube_alarm import main
+from youtube_alarm.music_library import MusicLibrary
+from youtube_alarm.mpv_manager import MpvManager
+from youtube_alarm.vlc_manager import VLCManager, AttachedProcess, EXIT_UNKNOWN, HEALTH_TIMEOUT
+from youtube_alarm.playlist_stream import PlaylistQueue
+from youtube_alarm.failure_cache import FailureCache
+from youtube_alarm.player_backend import PlayerStartError
+from tests.fake_player import FakePlayer
+
+class FakePipeline:
+    """Resolves 'https://www.youtube.com/watch?v=<id>' locally and 'downloads' by creating the file."""
+
+    upgraded = []  # video IDs passed to upgrade(), across instances
+
+    def __init__(self, playlist_name, music_library, failures=None):
+        self.playlist_name = playlist_name
+        self.music_library = music_library
+
+    def resolve(self, video_url):
+        video_id = video_url[-11:]
+        return {'id': video_id, 'title': f'Song {video_id}'}
+
+    def fetch(self, info_dict, deadline=None):
+        path = os.path.join(self.music_library.base_folder, self.playlist_name, f"{info_dict['id']}_Song.mp3")
+        open(path, 'wb').close()
+        self.music_library.add_song(self.playlist_name, info_dict['id'], 'Song', path)
+        return path
+
+    def upgrade(self, video_id):
+        self.upgraded.append(video_id)
+        if video_id == "abcdefghij2":
+            raise RuntimeError("extractor changed")
+        self.music_library.add_song(self.playlist_name, video_id, 'Song', self.music_library.get_song_paths_by_id(video_id, self.playlist_name)[0])
+
+class TestMainLoopWithFakePlayer(unittest.TestCase):
+
+    PLAYLIST = "TestPlaylist1"
+
+    def setUp(self):
+        self.base_folder = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.base_folder, self.PLAYLIST))
+        for video_id in ("abcdefghij1", "abcdefghij2", "abcdefghij3"):
+            open(os.path.join(self.base_folder, self.PLAYLIST, f"{video_id}_Song.mp3"), 'wb').close()
+        self.library = MusicLibrary(self.base_folder)
+        self.videos = PlaylistQueue([f"https://www.youtube.com/watch?v=abcdefghij{i}" for i in range(4, 8)])
+        self.player = FakePlayer()
+
+    def tearDown(self):
+        shutil.rmtree(self.base_folder)
+
+    def test_main_loop_starts_playback_and_buffers(self):
+        async def scenario():
+            task = asyncio.ensure_future(main.main_loop(self.videos, self.PLAYLIST, self.library, self.player, None, True))
+            await asyncio.sleep(0.1)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        with mock.patch.object(main, "TrackPipeline", FakePipeline):
+            asyncio.run(scenario())
+        self.assertEqual(self.player.commands[0], "start")
+        self.assertIn("play", self.player.commands)
+        self.assertEqual(len(self.player.playlist), 7)  # 3 local songs, then the 4 buffered ones
+        self.assertEqual(list(self.videos), [])
+
+    def test_draft_upgrades_respect_the_failure_cache_and_survive_errors(self):
+        failures = FailureCache(self.base_folder)
+        failures.record_failure("abcdefghij1", "ERROR: timed out")
+        for video_id in ("abcdefghij1", "abcdefghij2", "abcdefghij3"):
+            self.library._mark_draft(self.PLAYLIST, video_id, True)
+        FakePipeline.upgraded = []
+
+        async def scenario():
+            task = asyncio.ensure_future(main.upgrade_drafts(self.PLAYLIST, self.library, self.player, failures))
+            await asyncio.sleep(0.2)
+            self.assertFalse(task.done())  # A failed upgrade does not end the task
+            task.cancel()
+
+        with mock.patch.object(main, "TrackPipeline", FakePipeline):
+            asyncio.run(scenario())
+        self.assertEqual(sorted(FakePipeline.upgraded), ["abcdefghij2", "abcdefghij3"])
+        self.assertEqual(self.library.get_draft_ids(self.PLAYLIST).count("abcdefghij3"), 0)
+
+    def test_main_loop_retries_a_player_that_failed_to_start(self):
+        self.player.failing_starts = 1
+
+        async def scenario():
+            task = asyncio.ensure_future(main.main_loop(self.videos, self.PLAYLIST, self.library, self.player, None, True))
+            await asyncio.sleep(0.1)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        with mock.patch.object(main, "TrackPipeline", FakePipeline), mock.patch.object(main, "PLAYER_RETRY_DELAY", 0.01):
+            asyncio.run(scenario())
+        self.assertEqual(self.player.commands[:2], ["start", "start"])
+        self.assertIn("play", self.player.commands)
+
+    def test_main_loop_ends_once_the_player_is_stopped_on_purpose(self):
+        async def scenario():
+            task = asyncio.ensure_future(main.main_loop(self.videos, self.PLAYLIST, self.library, self.player, None, True))
+            await asyncio.sleep(0.05)
+            self.player.cleanup()  # What Ctrl+C does through the player's signal handler
+            await asyncio.wait_for(task, 1)
+
+        with mock.patch.object(main, "TrackPipeline", FakePipeline):
+            asyncio.run(scenario())
+        self.assertIn("play", self.player.commands)
+
+    def test_player_loop_follows_track_changes(self):
+        async def scenario():
+            await self.player.start()
+            for path in self.library.get_song_paths(self.PLAYLIST):
+                await self.player.add_to_playlist(path)
+            await self.player.start_playback()
+            first = await main.player_loop(self.player, -1)
+            await self.player.skip_song()
+            return first, await main.player_loop(self.player, first)
+        self.assertEqual(asyncio.run(scenario()), (0, 1))
+
+    def test_resume_requeues_from_interrupted_song(self):
+        paths = self.library.get_song_paths(self.PLAYLIST)
+        state = {"player": "FakePlayer", "player_pid": 1, "player_playlist": paths, "current_index": 1, "position": 30}
+        self.assertTrue(asyncio.run(main.resume_playback(self.player, state)))
+        self.assertEqual(self.player.playlist, paths[1:])
+        self.assertEqual(self.player.commands[-1], ("seek", 30))
+
+    def test_supervise_restarts_crashed_player_from_interrupted_song(self):
+        paths = self.library.get_song_paths(self.PLAYLIST)
+
+        async def scenario():
+            await self.player.start()
+            for path in paths:
+                await self.player.add_to_playlist(path)
+            await self.player.start_playback()
+            await self.player.skip_song()
+            self.player.position = 42
+            self.player.crash()
+            restarted = await self.player.supervise()
+            self.player.cleanup()
+            return restarted, await self.player.supervise()
+
+        self.assertEqual(asyncio.run(scenario()), (True, False))  # Not restarted once stopped on purpose
+        self.assertEqual(self.player.playlist, paths[1:])
+        self.assertEqual(self.player.commands[-1], ("seek", 42))
+        self.assertEqual(self.player.restarts, 1)
+
+    def test_failed_restart_keeps_the_queue_for_the_next_attempt(self):
+        paths = self.library.get_song_paths(self.PLAYLIST)
+
+        async def scenario():
+            await self.player.start()
+            for path in paths:
+                await self.player.add_to_playlist(path)
+            await self.player.start_playback()
+            self.player.crash()
+            self.player.failing_starts = 1
+            return await self.player.supervise(), await self.player.supervise()
+
+        self.assertEqual(asyncio.run(scenario()), (False, True))
+        self.assertEqual(self.player.playlist, paths)
+        self.assertEqual(self.player.restarts, 2)
+
+class TestVLCSupervisor(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        with mock.patch("signal.signal"):
+            self.player = VLCManager(port=self._free_port())
+        self.player.pidfile = os.path.join(self.folder, "vlc.pid")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    @staticmethod
+    def _free_port():
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            return sock.getsockname()[1]
+
+    def test_pidfile_of_another_process_is_not_ours(self):
+        with open(self.player.pidfile, "w") as f:
+            json.dump({"pid": os.getpid(), "port": self.player.port, "create_time": 0}, f)
+        self.assertIsNone(self.player.owned_process())
+
+    def test_healthy_owned_instance_is_reused(self):
+        owned = SimpleNamespace(pid=os.getpid())
+        with mock.patch.object(self.player, "owned_process", return_value=owned), \
+             mock.patch.object(self.player, "owns_port", return_value=True), \
+             mock.patch.object(self.player, "is_server_running", return_value=True), \
+             mock.patch.object(self.player, "clear_playlist", mock.AsyncMock()) as clear, \
+             mock.patch("subprocess.Popen") as popen:
+            asyncio.run(self.player.start())
+        popen.assert_not_called()
+        clear.assert_awaited_once()
+        self.assertEqual(self.player.pid, os.getpid())
+
+    def test_port_used_by_another_program_is_left_alone(self):
+        with socket.socket() as listener:
+            listener.bind(("127.0.0.1", self.player.port))
+            listener.listen()
+            with mock.patch("subprocess.Popen") as popen, self.assertRaises(RuntimeError):
+                asyncio.run(self.player.start())
+        popen.assert_not_called()
+
+    def test_readiness_wait_does_not_block_the_event_loop(self):
+        answers = iter([False, False, True])
+        ticks = []
+        self.player.vlc_process = SimpleNamespace(pid=1, poll=lambda: None)
+
+        async def ticker():
+            while True:
+                ticks.append(1)
+                await asyncio.sleep(0.01)
+
+        async def scenario():
+            task = asyncio.ensure_future(ticker())
+            ready = await self.player.wait_until_ready(timeout=5)
+            task.cancel()
+            return ready
+
+        with mock.patch.object(self.player, "is_server_running", side_effect=lambda: next(answers)):
+            self.assertTrue(asyncio.run(scenario()))
+        self.assertGreater(len(ticks), 5)
+
+    def test_server_that_never_answers_is_killed_and_reported(self):
+        process = mock.Mock(pid=os.getpid())
+        process.poll.return_value = None
+        with mock.patch("subprocess.Popen", return_value=process), \
+             mock.patch.object(self.player, "write_pidfile"), \
+             mock.patch.object(self.player, "wait_until_ready", mock.AsyncMock(return_value=False)), \
+             self.assertRaises(PlayerStartError):
+            asyncio.run(self.player.start())
+        process.kill.assert_called_once()
+
+    def test_normal_exit_is_not_a_crash(self):
+        self.player.vlc_process = SimpleNamespace(pid=1, poll=lambda: 0)  # --play-and-exit reached the end
+        self.assertFalse(self.player.has_crashed())
+        self.player.vlc_process = SimpleNamespace(pid=1, poll=lambda: -11)
+        self.assertTrue(self.player.has_crashed())
+
+    def test_killed_attached_instance_is_restarted(self):
+        process = subprocess.Popen(["sleep", "60"])
+        self.player.vlc_process = AttachedProcess(process.pid)  # Reused or rejoined: not a child of this run
+        self.player.playlist = ["/music/abcdefghijk_A.mp3", "/music/bcdefghijkl_B.mp3"]
+        self.player.current_index = 0
+        process.send_signal(signal.SIGKILL)
+        process.wait()
+        with mock.patch.object(self.player, "start", mock.AsyncMock()) as start, \
+             mock.patch.object(self.player, "add_to_playlist", mock.AsyncMock()), \
+             mock.patch.object(self.player, "start_playback", mock.AsyncMock()):
+            self.assertFalse(self.player.is_running())
+            self.assertTrue(self.player.has_crashed())
+            self.assertTrue(asyncio.run(self.player.supervise()))
+        start.assert_awaited_once()
+
+    def test_attached_instance_that_played_out_is_not_a_crash(self):
+        self.player.vlc_process = SimpleNamespace(pid=1, poll=lambda: EXIT_UNKNOWN)
+        self.player.playlist = ["/music/abcdefghijk_A.mp3", "/music/bcdefghijkl_B.mp3"]
+        self.player.current_index = 1
+        self.assertFalse(self.player.has_crashed())
+
+    def test_commands_do_not_block_the_event_loop(self):
+        ticks = []
+
+        def slow_get(url, auth=None, timeout=None):
+            time.sleep(0.2)
+            return SimpleNamespace(status_code=200, raise_for_status=lambda: None)
+
+        async def ticker():
+            while True:
+                ticks.append(1)
+                await asyncio.sleep(0.01)
+
+        async def scenario():
+            task = asyncio.ensure_future(ticker())
+            await self.player.add_to_playlist("/music/abcdefghijk_A.mp3")
+            task.cancel()
+
+        with mock.patch("requests.get", side_effect=slow_get) as get:
+            asyncio.run(scenario())
+        self.assertEqual(get.call_args.kwargs["timeout"], HEALTH_TIMEOUT)
+        self.assertGreater(len(ticks), 5)
+
+class TestMpvManager(unittest.TestCase):
+
+    def test_json_ipc_commands_and_pushed_events(self):
+        socket_path = os.path.join(tempfile.mkdtemp(), "mpv.sock")
+        received = []
+
+        async def fake_mpv(reader, writer):
+            while line := await reader.readline():
+                request = json.loads(line)
+                received.append(request["command"])
+                writer.write(json.dumps({"request_id": request["request_id"], "error": "success", "data": None}).encode() + b"\n")
+                if request["command"][0] == "set_property" and request["command"][1] == "playlist-pos":
+                    # mpv announces the track change on its own
+                    writer.write(b'{"event": "property-change", "id": 1, "name": "playlist-pos", "data": 0}\n')
+                await writer.drain()
+
+        async def scenario():
+            server = await asyncio.start_unix_server(fake_mpv, socket_path)
+            player = MpvManager(socket_path=socket_path)
+            player.mpv_process = SimpleNamespace(pid=1, poll=lambda: None)
+            self.assertTrue(await player._connect())
+            await player.add_to_playlist("/music/abcdefghijk_Song.mp3")
+            await player.start_playback()
+            await player.wait_for_change(1)
+            index = player.current_index
+            player.writer.close()
+            player.reader_task.cancel()
+            server.close()
+            return index
+
+        with mock.patch("signal.signal"):
+            self.assertEqual(asyncio.run(scenario()), 0)
+        self.assertEqual(received[0], ["observe_property", 1, "playlist-pos"])
+        self.assertEqual(received[1], ["loadfile", "/music/abcdefghijk_Song.mp3", "append"])
+        shutil.rmtree(os.path.dirname(socket_path))
+
+    def test_instance_left_on_the_socket_is_reused(self):
+        socket_path = os.path.join(tempfile.mkdtemp(), "mpv.sock")
+        received = []
+
+        async def old_mpv(reader, writer):
+            while line := await reader.readline():
+                request = json.loads(line)
+                received.append(request["command"])
+                data = os.getpid() if request["command"] == ["get_property", "pid"] else None
+                writer.write(json.dumps({"request_id": request["request_id"], "error": "success", "data": data}).encode() + b"\n")
+                await writer.drain()
+
+        async def scenario():
+            server = await asyncio.start_unix_server(old_mpv, socket_path)
+            player = MpvManager(socket_path=socket_path)
+            await player.start()
+            pid = player.pid
+            player._disconnect()
+            server.close()
+            return pid
+
+        with mock.patch("signal.signal"), mock.patch("subprocess.Popen") as popen:
+            self.assertEqual(asyncio.run(scenario()), os.getpid())
+        popen.assert_not_called()
+        self.assertIn(["stop"], received)
+        self.assertIn(["playlist-clear"], received)
+        shutil.rmtree(os.path.dirname(socket_path))
+
+    def test_event_pushed_while_busy_is_not_lost(self):
+        async def scenario():
+            player = MpvManager(socket_path=os.path.join(tempfile.gettempdir(), "unused.sock"))
+            player.changed.set()  # A track change arrived while main_loop was buffering
+            start = time.monotonic()
+            await player.wait_for_change(5)
+            woke_after = time.monotonic() - start
+            return woke_after, player.changed.is_set()
+
+        with mock.patch("signal.signal"):
+            woke_after, still_set = asyncio.run(scenario())
+        self.assertLess(woke_after, 1)
+        self.assertFalse(still_set)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+import random
+import asyncio
+import threading
+import unittest
+from contextlib import contextmanager
+from youtube_alarm.playlist_stream import PlaylistQueue, stream_playlist
+
+class PagedYoutubeDL:
+    """Lists two pages of a playlist; the second page waits until the test releases it."""
+
+    PLAYLIST_URL = "https://www.youtube.com/playlist?list=x"
+
+    def __init__(self, release, fail=False):
+        self.release = release
+        self.fail = fail
+        self.extracted = []
+
+    def extract_info(self, url, download=False, process=True, ie_key=None):
+        if self.fail:
+            raise RuntimeError("playlist does not exist")
+        assert process is False
+        self.extracted.append((url, ie_key))
+        if url != self.PLAYLIST_URL:
+            # Like watch?list=... links: the extractor only points at the playlist
+            return {'_type': 'url', 'url': self.PLAYLIST_URL, 'ie_key': 'YoutubeTab'}
+        return {'title': 'Morning: Mix', 'entries': self.entries()}
+
+    def entries(self):
+        for i in range(3):
+            yield {'url': f"https://www.youtube.com/watch?v=abcdefghij{i}"}
+        self.release.wait(5)
+        for i in range(3, 6):
+            yield {'url': f"https://www.youtube.com/watch?v=abcdefghij{i}"}
+
+class StubPool:
+    def __init__(self, ydl):
+        self.ydl = ydl
+
+    @contextmanager
+    def acquire(self, profile, **params):
+        yield self.ydl
+
+class TestPlaylistStream(unittest.TestCase):
+
+    URLS = [f"https://www.youtube.com/watch?v=abcdefghij{i}" for i in range(6)]
+
+    def test_first_page_is_usable_while_later_pages_are_listed(self):
+        release = threading.Event()
+
+        async def scenario():
+            videos = PlaylistQueue(done=False)
+            name, listing = await stream_playlist("https://www.youtube.com/playlist?list=x", videos, pool=StubPool(PagedYoutubeDL(release)))
+            queued = await videos.wait_for(3)
+            first = videos.popleft()
+            still_listing = not videos.done
+            release.set()
+            followed = [url async for url in videos.follow()]
+            await listing
+            return name, queued, first, still_listing, followed, list(videos)
+
+        name, queued, first, still_listing, followed, remaining = asyncio.run(scenario())
+        self.assertEqual(name, "Morning_Mix")
+        self.assertEqual(queued, 3)
+        self.assertEqual(first, self.URLS[0])
+        self.assertTrue(still_listing)
+        self.assertEqual(followed, self.URLS)  # follow sees every video, consumed or not
+        self.assertEqual(remaining, self.URLS[1:])
+
+    def test_url_results_are_followed_to_the_playlist(self):
+        release = threading.Event()
+        release.set()
+        ydl = PagedYoutubeDL(release)
+
+        async def scenario():
+            videos = PlaylistQueue(done=False)
+            name, listing = await stream_playlist("https://www.youtube.com/watch?v=abcdefghij0&list=x", videos, pool=StubPool(ydl))
+            await listing
+            return name, list(videos)
+
+        name, listed = asyncio.run(scenario())
+        self.assertEqual(name, "Morning_Mix")
+        self.assertEqual(listed, self.URLS)
+        self.assertEqual(ydl.extracted[1], (PagedYoutubeDL.PLAYLIST_URL, 'YoutubeTab'))
+
+    def test_resumed_listing_skips_what_was_already_listed(self):
+        release = threading.Event()
+        release.set()
+
+        async def scenario():
+            # A restart after the first four videos were listed, two of them already played
+            videos = PlaylistQueue(self.URLS[2:4], done=False, listed_count=4)
+            _, listing = await stream_playlist(PagedYoutubeDL.PLAYLIST_URL, videos, pool=StubPool(PagedYoutubeDL(release)), skip=4)
+            await listing
+            return list(videos), videos.listed_count
+
+        remaining, listed_count = asyncio.run(scenario())
+        self.assertEqual(remaining, self.URLS[2:])
+        self.assertEqual(listed_count, 6)
+
+    def test_listing_failure_before_the_title_is_raised(self):
+        async def scenario():
+            videos = PlaylistQueue(done=False)
+            await stream_playlist("https://www.youtube.com/playlist?list=x", videos, pool=StubPool(PagedYoutubeDL(None, fail=True)))
+
+        with self.assertRaises(RuntimeError):
+            asyncio.run(scenario())
+
+    def test_windowed_shuffle_stays_within_the_window(self):
+        urls = list(range(1000))
+        videos = PlaylistQueue(urls, shuffle_window=10, rng=random.Random(4))
+        order = []
+        while videos:
+            remaining_before = list(videos)
+            url = videos.popleft()
+            self.assertIn(url, remaining_before[:10])
+            order.append(url)
+        self.assertEqual(sorted(order), urls)
+        self.assertNotEqual(order, urls)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+from unittest import mock
+from yt_dlp.postprocessor.ffmpeg import FFmpegPostProcessor
+from youtube_alarm.postprocessors import PLAYLIST_FIELD, QUALITY_FIELD, SanitizeTitlePP, TaggingExtractAudioPP
+
+class TestPostprocessors(unittest.TestCase):
+
+    INFO = {
+        'id': 'abcdefghijk',
+        'title': 'Test Song: Live / 2024',
+        'uploader': 'Test Artist',
+        PLAYLIST_FIELD: 'TestPlaylist1',
+    }
+
+    def test_sanitize_title(self):
+        _, info = SanitizeTitlePP().run(dict(self.INFO))
+        self.assertEqual(info['clean_title'], 'Test_Song_Live_2024')
+
+    def test_tags_added_to_conversion(self):
+        pp = TaggingExtractAudioPP(preferredcodec='mp3', preferredquality='192')
+        pp._tags = pp.build_tags(self.INFO)
+        with mock.patch.object(FFmpegPostProcessor, 'run_ffmpeg') as run_ffmpeg:
+            pp.run_ffmpeg('in.webm', 'out.mp3', 'libmp3lame', ['-b:a', '192k'])
+        opts = run_ffmpeg.call_args[0][3]
+        self.assertEqual(opts[:4], ['-vn', '-acodec', 'libmp3lame', '-b:a'])
+        metadata = dict(opt.split('=', 1) for opt in opts[opts.index('-metadata') + 1::2])
+        self.assertEqual(metadata, {
+            'title': 'Test Song: Live / 2024',
+            'artist': 'Test Artist',
+            'album': 'TestPlaylist1',
+            'YouTubeID': 'abcdefghijk',
+            'PlaylistName': 'TestPlaylist1',
+        })
+
+    def test_missing_fields_are_not_tagged(self):
+        tags = TaggingExtractAudioPP.build_tags({'id': 'abcdefghijk', 'title': 'Song'})
+        self.assertEqual(set(tags), {'title', 'YouTubeID'})
+
+    def test_draft_downloads_are_flagged(self):
+        self.assertEqual(TaggingExtractAudioPP.build_tags(dict(self.INFO, **{QUALITY_FIELD: 'draft'}))['AlarmQuality'], 'draft')
+        self.assertNotIn('AlarmQuality', TaggingExtractAudioPP.build_tags(dict(self.INFO, **{QUALITY_FIELD: 'best'})))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+import os
+import shutil
+import asyncio
+import tempfile
+import unittest
+from unittest import mock
+from youtube_alarm import prefetch
+from youtube_alarm.prefetch import TrackPrefetcher
+from tests.fake_player import FakePlayer
+
+class StubLibrary:
+    def __init__(self, durations):
+        self.durations = durations
+
+    def get_duration(self, playlist_name, video_id, default=None):
+        return self.durations.get(video_id, default)
+
+class TestTrackPrefetcher(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.paths = []
+        for i in range(5):
+            path = os.path.join(self.folder, f"abcdefghij{i}_Song.mp3")
+            with open(path, 'wb') as f:
+                f.write(bytes(1000))
+            self.paths.append(path)
+        self.player = FakePlayer()
+        self.player.playlist = list(self.paths)
+        self.player.current_index = 0
+        self.library = StubLibrary({f"abcdefghij{i}": 200 for i in range(5)})
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def run_updates(self, prefetcher, *steps):
+        """Apply (index, position) steps and return the posix_fadvise calls as (file name, length, advice)."""
+        calls = []
+
+        def fake_fadvise(fd, offset, length, advice):
+            name = os.path.basename(os.readlink(f"/proc/self/fd/{fd}"))
+            calls.append((name, length, advice))
+
+        async def scenario():
+            for index, position in steps:
+                self.player.current_index = index
+                self.player.position = position
+                await prefetcher.update()
+
+        with mock.patch.object(prefetch, "HAS_FADVISE", True), \
+             mock.patch.object(prefetch.os, "posix_fadvise", fake_fadvise, create=True), \
+             mock.patch.object(prefetch.os, "POSIX_FADV_WILLNEED", 3, create=True), \
+             mock.patch.object(prefetch.os, "POSIX_FADV_DONTNEED", 4, create=True):
+            asyncio.run(scenario())
+        return calls
+
+    @unittest.skipUnless(os.path.isdir("/proc/self/fd"), "needs /proc to name file descriptors")
+    def test_next_tracks_are_warmed_near_the_end_and_released_after_playing(self):
+        prefetcher = TrackPrefetcher(self.player, self.library, "TestPlaylist1", lookahead=2, lead_time=30)
+        calls = self.run_updates(prefetcher, (0, 10), (0, 175), (1, 0))
+        self.assertEqual(calls, [
+            ("abcdefghij1_Song.mp3", 1000, 3),  # 25s left: warm the next two
+            ("abcdefghij2_Song.mp3", 1000, 3),
+        ])
+        self.assertEqual(prefetcher.first_reads, {'warm': [], 'cold': []})  # Nothing read at the track change
+
+        calls = self.run_updates(prefetcher, (1, 198), (1, 199), (2, 190))
+        self.assertIn(("abcdefghij1_Song.mp3", 1000, 4), calls)  # Played: pages released
+        self.assertIn(("abcdefghij3_Song.mp3", 1000, 3), calls)
+        # Timed once shortly before each next track starts, after its prefetch
+        self.assertEqual(prefetcher.first_reads, {'warm': [mock.ANY], 'cold': []})
+        self.assertIn("1 warm", prefetcher.report())
+
+    def test_next_track_is_timed_before_it_starts_even_when_not_prefetched(self):
+        prefetcher = TrackPrefetcher(self.player, self.library, "TestPlaylist1", memory_budget=0)
+        now = [1000.0]
+        prefetcher.clock = lambda: now[0]
+
+        async def scenario():
+            self.player.position = 150  # Positions are only refreshed now and then
+            await prefetcher.update()
+            now[0] += 48  # 2s left by the clock, although the position did not change
+            await prefetcher.update()
+
+        asyncio.run(scenario())
+        self.assertEqual(prefetcher.first_reads, {'warm': [], 'cold': [mock.ANY]})
+        self.assertEqual(prefetcher.probed, self.paths[1])
+
+    @unittest.skipUnless(os.path.isdir("/proc/self/fd"), "needs /proc to name file descriptors")
+    def test_memory_budget_bounds_prefetching(self):
+        prefetcher = TrackPrefetcher(self.player, self.library, "TestPlaylist1", lookahead=3, memory_budget=1500)
+        calls = self.run_updates(prefetcher, (0, 190))
+        self.assertEqual(calls, [("abcdefghij1_Song.mp3", 1000, 3), ("abcdefghij2_Song.mp3", 500, 3)])
+        self.assertEqual(prefetcher.in_use(), 1500)
+        self.assertEqual(prefetcher.stats['over_budget'], 1)
+
+    def test_unknown_duration_warms_right_away_without_fadvise(self):
+        prefetcher = TrackPrefetcher(self.player, StubLibrary({}), "TestPlaylist1", lookahead=1)
+        with mock.patch.object(prefetch, "HAS_FADVISE", False):
+            asyncio.run(prefetcher.update())
+        self.assertEqual(list(prefetcher.warmed), [self.paths[1]])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import os
+import asyncio
+import tempfile
+import unittest
+from youtube_alarm.profiler import PhaseProfiler, TIMELINE_REPEATS
+
+def allocate():
+    return [bytearray(1024) for _ in range(1000)]
+
+class TestPhaseProfiler(unittest.TestCase):
+
+    def test_disabled_profiler_records_nothing(self):
+        profiler = PhaseProfiler()
+        with profiler.phase('library_scan'):
+            pass
+        profiler.mark('alarm')
+        self.assertEqual(profiler.entries, [])
+        self.assertEqual(profiler.marks, [])
+
+    def test_timeline_records_wall_and_cpu_time(self):
+        profiler = PhaseProfiler()
+        profiler.enable()
+
+        async def scenario():
+            with profiler.phase('playlist_fetch'):
+                await asyncio.sleep(0.05)
+            profiler.mark('alarm')
+            with profiler.phase('check_metadata'):
+                sum(i * i for i in range(200000))
+
+        asyncio.run(scenario())
+        (first, start, wall, cpu, memory), second = profiler.entries
+        self.assertEqual(first, 'playlist_fetch')
+        self.assertGreaterEqual(wall, 0.04)
+        self.assertLess(cpu, wall)  # Sleeping costs no CPU
+        self.assertIsNone(memory)
+        self.assertEqual(second[0], 'check_metadata')
+        self.assertGreater(second[3], 0)
+        report = profiler.report()
+        self.assertLess(report.index('playlist_fetch'), report.index('* alarm'))
+        self.assertLess(report.index('* alarm'), report.index('check_metadata'))
+
+    def test_repeated_phase_is_summed_beyond_the_timeline(self):
+        profiler = PhaseProfiler()
+        profiler.enable()
+        for _ in range(TIMELINE_REPEATS + 3):
+            with profiler.phase('playback_tick'):
+                pass
+        self.assertEqual(len(profiler.entries), TIMELINE_REPEATS)
+        self.assertEqual(profiler.totals['playback_tick']['count'], TIMELINE_REPEATS + 3)
+
+    def test_selected_phases_are_profiled_and_traced(self):
+        profiler = PhaseProfiler()
+        profiler.enable(cpu_phases=['check_metadata'], memory_phases=['library_scan'])
+        with profiler.phase('check_metadata'):
+            allocate()
+        with profiler.phase('library_scan'):
+            kept = allocate()
+        with profiler.phase('validate_songs'):
+            allocate()
+
+        self.assertEqual(list(profiler.profiles), ['check_metadata'])
+        net, peak = profiler.entries[1][4]
+        self.assertGreater(net, 1000 * 1024)
+        self.assertGreaterEqual(peak, net)
+        self.assertIsNone(profiler.entries[2][4])
+        del kept
+
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'profile.txt')
+            profiler.write_report(path)
+            with open(path, encoding='utf-8') as f:
+                report = f.read()
+            self.assertTrue(os.path.exists(path + '.check_metadata.prof'))
+        self.assertIn('cProfile of check_metadata', report)
+        self.assertIn('allocate', report)
+        self.assertIn('Largest allocations during library_scan', report)
+        self.assertIn('test_profiler.py', report)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import os
+import shutil
+import tempfile
+import unittest
+from mutagen.id3 import ID3, TIT2, TPE1, TALB
+from youtube_alarm.music_library import MusicLibrary
+
+class TestRetagMissing(unittest.TestCase):
+
+    PLAYLISTS = ["TestPlaylist1", "TestPlaylist2"]
+
+    def setUp(self):
+        # Tags only: mutagen reads and writes ID3 frames without any audio after them
+        self.base_folder = tempfile.mkdtemp()
+        for playlist in self.PLAYLISTS:
+            os.makedirs(os.path.join(self.base_folder, playlist))
+            self.create_tagged_file(playlist, "abcdefghijk_1_test_song.mp3", "Test Song 1", "Test Album")
+            self.create_tagged_file(playlist, "abcdefghijf_2_another_song.mp3", "Test Song 2", "Test Album")
+            open(os.path.join(self.base_folder, playlist, "abcdefghijg_3_untagged.mp3"), "wb").close()
+
+    def tearDown(self):
+        shutil.rmtree(self.base_folder)
+
+    def create_tagged_file(self, playlist, filename, title, album):
+        audio = ID3()
+        audio.add(TIT2(encoding=3, text=title))
+        audio.add(TPE1(encoding=3, text="Test Artist"))
+        audio.add(TALB(encoding=3, text=album))
+        audio.save(os.path.join(self.base_folder, playlist, filename))
+
+    def test_retag_missing(self):
+        library = MusicLibrary(self.base_folder)
+        playlist = self.PLAYLISTS[0]
+        self.assertEqual(library.retag_missing(playlist), 3)
+        audio = ID3(os.path.join(self.base_folder, playlist, "abcdefghijk_1_test_song.mp3"))
+        self.assertEqual(audio.get('TXXX:YouTubeID').text[0], "abcdefghijk")
+        self.assertEqual(audio.get('TXXX:PlaylistName').text[0], playlist)
+        self.assertEqual(audio.get('TALB').text[0], "Test Album")  # Existing frames are kept
+        # Already tagged files are not rewritten again
+        self.assertEqual(library.retag_missing(playlist), 0)
+
+    def test_untagged_file_gets_title_and_album_from_the_library(self):
+        library = MusicLibrary(self.base_folder)
+        playlist = self.PLAYLISTS[0]
+        library.retag_missing(playlist)
+        audio = ID3(os.path.join(self.base_folder, playlist, "abcdefghijg_3_untagged.mp3"))
+        self.assertEqual(audio.get('TIT2').text[0], "3_untagged")
+        self.assertEqual(audio.get('TALB').text[0], playlist)
+        self.assertEqual(audio.get('TXXX:YouTubeID').text[0], "abcdefghijg")
+
+    def test_other_playlists_are_left_alone(self):
+        library = MusicLibrary(self.base_folder)
+        library.retag_missing(self.PLAYLISTS[0])
+        audio = ID3(os.path.join(self.base_folder, self.PLAYLISTS[1], "abcdefghijk_1_test_song.mp3"))
+        self.assertIsNone(audio.get('TXXX:YouTubeID'))
+        self.assertEqual(library.retag_missing(), 3)
+
+if __name__ == '__main__':
+    unittest.main()
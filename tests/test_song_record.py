@@ -0,0 +1,80 @@
+import os
+import shutil
+import tempfile
+import tracemalloc
+import unittest
+from youtube_alarm.music_library import MusicLibrary, SongRecord
+
+class TestSongRecord(unittest.TestCase):
+
+    N_SONGS = 20000
+
+    def setUp(self):
+        self.base_folder = tempfile.mkdtemp()
+        self.library = MusicLibrary(self.base_folder)
+
+    def tearDown(self):
+        shutil.rmtree(self.base_folder)
+
+    def test_dict_like_access(self):
+        self.library._store("TestPlaylist1", "abcdefghijk", "Test Song 1", "abcdefghijk_Test_Song_1.mp3")
+        song = self.library.songs[("TestPlaylist1", "abcdefghijk")]
+        expected_path = os.path.join(self.base_folder, "TestPlaylist1", "abcdefghijk_Test_Song_1.mp3")
+        self.assertEqual(song["title"], "Test Song 1")
+        self.assertEqual(song["file_path"], expected_path)
+        self.assertEqual(song["youtube_id"], "abcdefghijk")
+        self.assertEqual(song.get("missing", "default"), "default")
+        self.assertEqual(song, {"title": "Test Song 1", "file_path": expected_path, "youtube_id": "abcdefghijk"})
+        with self.assertRaises(KeyError):
+            song["missing"]
+        self.assertEqual(self.library.get_song_paths("TestPlaylist1"), [expected_path])
+
+    def test_records_are_unhashable_like_the_dicts_they_equal(self):
+        self.library._store("TestPlaylist1", "abcdefghijk", "Test Song 1", "abcdefghijk_Test_Song_1.mp3")
+        song = self.library.songs[("TestPlaylist1", "abcdefghijk")]
+        self.assertEqual(song, song.to_dict())
+        with self.assertRaises(TypeError):
+            hash(song)
+
+    def test_playlist_names_are_interned(self):
+        self.library._store("".join(["Test", "Playlist1"]), "abcdefghijk", "a", "abcdefghijk_a.mp3")
+        self.library._store("".join(["Test", "Playlist1"]), "abcdefghijf", "b", "abcdefghijf_b.mp3")
+        first, second = self.library.songs.values()
+        self.assertIs(first.playlist_name, second.playlist_name)
+
+    def measure(self, fill):
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        songs = fill()
+        used = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        self.assertEqual(len(songs), self.N_SONGS)
+        return used
+
+    def test_memory_benchmark(self):
+        playlist_folder = os.path.join(self.base_folder, "TestPlaylist1")
+        entries = [(f"{i:011d}", f"Some fairly typical song title number {i}") for i in range(self.N_SONGS)]
+
+        def fill_dicts():
+            songs = {}
+            for video_id, title in entries:
+                songs[("TestPlaylist1", video_id)] = {
+                    "title": title,
+                    "file_path": os.path.join(playlist_folder, f"{video_id}_{title}.mp3"),
+                    "youtube_id": video_id
+                }
+            return songs
+
+        def fill_records():
+            self.library.songs.clear()
+            for video_id, title in entries:
+                self.library._store("TestPlaylist1", video_id, title, f"{video_id}_{title}.mp3")
+            return self.library.songs
+
+        dict_bytes = self.measure(fill_dicts)
+        record_bytes = self.measure(fill_records)
+        self.assertLess(record_bytes, dict_bytes * 0.75,
+                        f"{self.N_SONGS} songs: dict entries {dict_bytes / 1e6:.1f} MB, SongRecord entries {record_bytes / 1e6:.1f} MB")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+import sys
+import subprocess
+import unittest
+
+HEAVY_MODULES = ("yt_dlp", "mutagen", "requests", "psutil", "asyncio")
+STARTUP_BUDGET_US = 300000  # Cumulative import time allowed for the command line module
+
+def import_times(*args):
+    """Run Python with -X importtime and return (completed process, {module: cumulative microseconds})."""
+    result = subprocess.run([sys.executable, "-X", "importtime", *args], capture_output=True, text=True, timeout=60)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative)
+    return result, times
+
+class TestStartup(unittest.TestCase):
+
+    def test_help_does_not_import_heavy_dependencies(self):
+        result, times = import_times("-m", "youtube_alarm.cli", "--help")
+        self.assertEqual(result.returncode, 0)
+        self.assertIn("usage: YoutubeAlarm", result.stdout)
+        self.assertEqual([name for name in times if name.split(".")[0] in HEAVY_MODULES], [])
+
+    def test_argument_error_does_not_import_heavy_dependencies(self):
+        result, times = import_times("-m", "youtube_alarm.cli", "--test")
+        self.assertEqual(result.returncode, 2)
+        self.assertIn("--playlist", result.stderr)
+        self.assertEqual([name for name in times if name.split(".")[0] in HEAVY_MODULES], [])
+
+    def test_package_import_is_lazy(self):
+        result, times = import_times("-c", "import youtube_alarm.cli")
+        self.assertEqual(result.returncode, 0)
+        self.assertNotIn("youtube_alarm.music_library", times)
+        self.assertLess(times["youtube_alarm.cli"], STARTUP_BUDGET_US)
+
+    def test_lazy_attributes_resolve(self):
+        result = subprocess.run([sys.executable, "-c", "import youtube_alarm; print(youtube_alarm.PlayerBackend.__name__)"],
+                                capture_output=True, text=True, timeout=60)
+        self.assertEqual(result.stdout.strip(), "PlayerBackend")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import asyncio
+import time
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+import yt_dlp
+from yt_dlp.extractor.common import InfoExtractor
+from youtube_alarm.ydl_pool import YoutubeDLPool
+
+class StubIE(InfoExtractor):
+    """Answers 'stub:<id>' URLs locally, so only YoutubeDL's own overhead is measured."""
+    _VALID_URL = r'stub:(?P<id>[0-9A-Za-z_-]{11})'
+
+    def _real_extract(self, url):
+        video_id = self._match_id(url)
+        return {'id': video_id, 'title': f'Song {video_id}', 'url': f'https://example.invalid/{video_id}.mp3', 'ext': 'mp3'}
+
+def stub_factory(opts):
+    ydl = yt_dlp.YoutubeDL(opts)
+    ydl.add_info_extractor(StubIE())
+    return ydl
+
+class TestYoutubeDLPool(unittest.TestCase):
+
+    URLS = [f'stub:{i:011d}' for i in range(30)]
+
+    def extract(self, ydl, url):
+        return ydl.extract_info(url, download=False, ie_key='Stub')
+
+    def test_instances_are_reused(self):
+        pool = YoutubeDLPool(factory=stub_factory)
+        with pool.acquire('info') as first:
+            self.assertEqual(self.extract(first, self.URLS[0])['title'], 'Song 00000000000')
+        with pool.acquire('info') as second:
+            self.assertIs(first, second)
+        with pool.acquire('flat') as flat:
+            self.assertIsNot(flat, first)
+        with pool.acquire('download', base_folder='a') as a, pool.acquire('download', base_folder='b') as b:
+            self.assertNotEqual(a.params['paths'], b.params['paths'])
+        pool.close()
+
+    def test_instances_are_never_shared_between_threads(self):
+        pool = YoutubeDLPool(max_instances=2, factory=stub_factory)
+        in_use = set()
+        lock = threading.Lock()
+        created = set()
+
+        def work(url):
+            with pool.acquire('info') as ydl:
+                with lock:
+                    self.assertNotIn(id(ydl), in_use)
+                    in_use.add(id(ydl))
+                    created.add(id(ydl))
+                result = self.extract(ydl, url)
+                time.sleep(0.01)
+                with lock:
+                    in_use.discard(id(ydl))
+                return result['id']
+
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            ids = list(executor.map(work, self.URLS))
+        self.assertEqual(ids, [url[5:] for url in self.URLS])
+        self.assertLessEqual(len(created), 2)
+        pool.close()
+
+    def test_per_track_overhead_benchmark(self):
+        start = time.perf_counter()
+        for url in self.URLS:
+            with stub_factory({'quiet': True, 'skip_download': True}) as ydl:
+                self.extract(ydl, url)
+        per_call = (time.perf_counter() - start) / len(self.URLS)
+
+        pool = YoutubeDLPool(factory=stub_factory)
+        start = time.perf_counter()
+        for url in self.URLS:
+            with pool.acquire('info') as ydl:
+                self.extract(ydl, url)
+        pooled = (time.perf_counter() - start) / len(self.URLS)
+        pool.close()
+
+        self.assertLess(pooled, per_call,
+                        f"Per-track overhead: new YoutubeDL {per_call * 1000:.2f} ms, pooled {pooled * 1000:.2f} ms")
+
+    def test_acquire_refuses_to_block_the_event_loop(self):
+        pool = YoutubeDLPool(factory=stub_factory)
+
+        async def from_the_loop():
+            with pool.acquire('info'):
+                pass
+
+        async def from_a_worker():
+            def borrow():
+                with pool.acquire('info') as ydl:
+                    return ydl is not None
+            return await asyncio.to_thread(borrow)
+
+        with self.assertRaises(RuntimeError):
+            asyncio.run(from_the_loop())
+        self.assertTrue(asyncio.run(from_a_worker()))
+        pool.close()
+
+if __name__ == "__main__":
+    unittest.main()